@@ -0,0 +1,163 @@
+"""
+Import cost of short lived jobs: importing the package, building generators from configuration and reading a token.
+
+Example::
+
+    python benchmarks/bench_import.py --runs 10 --max-ms 80
+
+Every scenario runs in a fresh interpreter with ``-X importtime``. The reported time is the median over the runs of
+the cumulative import time of the modules the scenario itself imports, so interpreter startup does not count. Each
+scenario must also leave the HTTP stack (requests, urllib3, http.client, ssl, aiohttp), asyncio, the proxy package and
+the broker server unimported, since none of them make a network call. Exits with status 1 if a scenario imports one of
+them or exceeds ``--max-ms``.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from captcha.base import BaseHCaptchaResult  # noqa: E402
+from captcha.broker import TokenBroker  # noqa: E402
+
+FORBIDDEN_MODULES = ('requests', 'urllib3', 'http.client', 'http.server', 'ssl', 'aiohttp', 'asyncio', 'proxy',
+                     'captcha.broker')
+
+SCENARIOS = (
+    ('import', "import captcha"),
+    ('capsolver-hcaptcha', "import captcha\n"
+                           "captcha.create_generator(dict(provider='capsolver', api_key='key',\n"
+                           "                              website_url='https://bench.invalid'))"),
+    ('2captcha-hcaptcha', "import captcha\n"
+                          "captcha.create_generator(dict(provider='2captcha', api_key='key',\n"
+                          "                              website_url='https://bench.invalid', site_key='site-key'))"),
+    ('2captcha-funcaptcha', "import captcha\n"
+                            "captcha.create_generator(dict(provider='2captcha', kind='funcaptcha', api_key='key',\n"
+                            "                              website_url='https://bench.invalid', public_key='key'))"),
+    ('2captcha-pool', "import captcha\n"
+                      "captcha.create_generator(dict(provider='2captcha', api_key='key', pool=4,\n"
+                      "                              website_url='https://bench.invalid', site_key='site-key'))"),
+    ('broker-read', "import captcha\n"
+                    "generator = captcha.create_generator(dict(provider='broker', address={address!r}))\n"
+                    "generator.generate('site-key')"),
+)
+
+# Wraps a scenario to report the modules it imported, tell them apart from those of interpreter startup.
+SCENARIO_WRAPPER = """
+import json, sys
+_before = set(sys.modules)
+{body}
+print(json.dumps(sorted(set(sys.modules) - _before)))
+"""
+
+
+class CachedHCaptchaGenerator:
+    """
+    Generator the benchmark's broker answers from, so reading a token involves no provider.
+    """
+
+    def generate(self, site_key: str, captcha_proxy=None, invisible: bool = False) -> BaseHCaptchaResult:
+        return BaseHCaptchaResult('P1_cached', 'E0_cached', 'Mozilla/5.0')
+
+
+def run_scenario(body: str) -> tuple:
+    """
+    :return: Milliseconds spent importing the modules the scenario imported, and those modules
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, (str(ROOT), environment.get('PYTHONPATH'))))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCENARIO_WRAPPER.format(body=body)],
+                             capture_output=True, text=True, env=environment, check=True)
+    imported = set(json.loads(process.stdout.strip().splitlines()[-1]))
+    total = 0
+
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+
+        _, cumulative, name = line.split('|')
+
+        # Top level entries only: nested imports are already part of their importer's cumulative time.
+        if not name.startswith('  ') and name.strip() in imported:
+            total += int(cumulative)
+
+    return total / 1000, imported
+
+
+def measure(name: str, body: str, runs: int) -> dict:
+    run_scenario(body)
+    timings = list()
+    imported = set()
+
+    for _ in range(runs):
+        elapsed, imported = run_scenario(body)
+        timings.append(elapsed)
+
+    report = dict()
+    report['scenario'] = name
+    report['median_ms'] = statistics.median(timings)
+    report['min_ms'] = min(timings)
+    report['modules'] = len(imported)
+    report['forbidden'] = sorted(module for module in FORBIDDEN_MODULES if module in imported)
+
+    return report
+
+
+def format_report(report: dict) -> str:
+    forbidden = ','.join(report['forbidden']) or '-'
+
+    return (f"{report['scenario']:<20} median={report['median_ms']:>7.1f} ms min={report['min_ms']:>7.1f} ms "
+            f"modules={report['modules']:<4} forbidden={forbidden}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', choices=[name for name, _ in SCENARIOS] + ['all'], default='all')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters started per scenario')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if a scenario median exceeds this')
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    args = parser.parse_args()
+
+    broker: Optional[TokenBroker] = None
+    reports: List[dict] = list()
+
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, 'broker.sock')
+
+        try:
+            for name, body in SCENARIOS:
+                if args.scenario not in ('all', name):
+                    continue
+
+                if name == 'broker-read':
+                    if not hasattr(socket, 'AF_UNIX'):
+                        continue
+
+                    broker = TokenBroker(CachedHCaptchaGenerator())
+                    broker.serve_unix(address)
+
+                report = measure(name, body.format(address=address), args.runs)
+                reports.append(report)
+                print(json.dumps(report) if args.json else format_report(report), flush=True)
+
+        finally:
+            if broker is not None:
+                broker.close()
+
+    passed = all(not report['forbidden'] and (args.max_ms is None or report['median_ms'] <= args.max_ms)
+                 for report in reports)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Convergence of AdaptivePolling against known solve time distributions, on a simulated clock.
+
+Example::
+
+    python benchmarks/bench_polling.py --solves 5000 --distribution uniform:5:15 --distribution lognormal:20:0.6
+
+Each solve draws its true solve time from the distribution and is checked on the schedule of the strategy until a
+check lands after it, then recorded the way the engine records it. Over the last ``--window`` solves, reports the
+learned median against the true one, the median and 99th percentile of the delay between a task finishing and a check
+seeing it (lateness) and of the time until the token is seen, and the checks made per task, next to FixedPolling at
+the same interval for reference. Exits with status 1 if a learned median is off by more than ``--tolerance`` of the
+true median, or if the 99th percentile lateness or time to token of AdaptivePolling exceeds FixedPolling's by more
+than ``--slack``.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_server import parse_distribution  # noqa: E402
+from captcha.polling import AdaptivePolling, FixedPolling, PollingStrategy  # noqa: E402
+
+PROVIDER = 'simulated'
+TASK_TYPE = 'HCaptchaTaskProxyLess'
+DEFAULT_DISTRIBUTIONS = ('uniform:5:15', 'lognormal:10:0.5', 'lognormal:20:0.6', 'exponential:8', 'fixed:12')
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def simulate(strategy: PollingStrategy, solve_time: Callable[[], float], solves: int, window: int) -> dict:
+    lateness = list()
+    time_to_token = list()
+    checks = list()
+
+    for index in range(solves):
+        true_time = solve_time()
+        elapsed = 0.0
+        attempt = 0
+        pending_until = 0.0
+
+        while True:
+            elapsed += strategy.delay(PROVIDER, TASK_TYPE, attempt, elapsed)
+            attempt += 1
+
+            if elapsed >= true_time:
+                break
+
+            pending_until = elapsed
+
+        strategy.record(PROVIDER, TASK_TYPE, elapsed, pending_until)
+
+        if index >= solves - window:
+            lateness.append(elapsed - true_time)
+            time_to_token.append(elapsed)
+            checks.append(attempt)
+
+    report = dict()
+    report['lateness_p50'] = percentile(lateness, 0.5)
+    report['lateness_p99'] = percentile(lateness, 0.99)
+    report['time_to_token_p50'] = percentile(time_to_token, 0.5)
+    report['time_to_token_p99'] = percentile(time_to_token, 0.99)
+    report['checks_per_task'] = statistics.mean(checks)
+
+    return report
+
+
+def measure(spec: str, args: argparse.Namespace) -> dict:
+    random.seed(args.seed)
+    solve_time = parse_distribution(spec)
+    true_median = statistics.median(solve_time() for _ in range(100000))
+
+    adaptive = AdaptivePolling(bucket_width=args.bucket_width)
+    adaptive.set_default_interval(PROVIDER, args.fixed_interval)
+    random.seed(args.seed)
+    adaptive_report = simulate(adaptive, solve_time, args.solves, args.window)
+    random.seed(args.seed)
+    fixed_report = simulate(FixedPolling(args.fixed_interval), solve_time, args.solves, args.window)
+    learned_median = adaptive.percentile(PROVIDER, TASK_TYPE, 0.5)
+
+    report = dict()
+    report['distribution'] = spec
+    report['true_median'] = true_median
+    report['learned_median'] = learned_median
+    report['median_error'] = abs(learned_median - true_median) / true_median
+
+    for name, strategy_report in (('adaptive', adaptive_report), ('fixed', fixed_report)):
+        for key, value in strategy_report.items():
+            report[f'{name}_{key}'] = value
+
+    return report
+
+
+def worse_than_fixed(report: dict, slack: float) -> bool:
+    return any(report[f'adaptive_{key}'] > report[f'fixed_{key}'] + slack
+               for key in ('lateness_p99', 'time_to_token_p99'))
+
+
+def format_strategy(report: dict, name: str) -> str:
+    return (f"{name} late p50={report[f'{name}_lateness_p50']:5.2f}s p99={report[f'{name}_lateness_p99']:5.2f}s "
+            f"token p50={report[f'{name}_time_to_token_p50']:6.2f}s p99={report[f'{name}_time_to_token_p99']:6.2f}s "
+            f"checks={report[f'{name}_checks_per_task']:5.2f}")
+
+
+def format_report(report: dict) -> str:
+    return (f"{report['distribution']:<18} median true={report['true_median']:6.2f}s "
+            f"learned={report['learned_median']:6.2f}s error={report['median_error']:5.1%}\n"
+            f"    {format_strategy(report, 'adaptive')}\n"
+            f"    {format_strategy(report, 'fixed')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--distribution', action='append', default=None,
+                        help='fixed:S, uniform:LOW:HIGH, lognormal:MEDIAN:SIGMA or exponential:MEAN (seconds), '
+                             'repeatable')
+    parser.add_argument('--solves', type=int, default=3000, help='simulated solves per distribution')
+    parser.add_argument('--window', type=int, default=1000, help='last solves the lateness and checks are taken on')
+    parser.add_argument('--bucket-width', type=float, default=0.5, help='histogram bucket width in seconds')
+    parser.add_argument('--fixed-interval', type=float, default=3, help='interval of the FixedPolling reference')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='accepted relative error of the learned median')
+    parser.add_argument('--slack', type=float, default=None,
+                        help='accepted excess of the adaptive 99th percentiles over fixed polling in seconds, '
+                             'the bucket width by default')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    args = parser.parse_args()
+    args.slack = args.bucket_width if args.slack is None else args.slack
+
+    passed = True
+
+    for spec in args.distribution or DEFAULT_DISTRIBUTIONS:
+        report = measure(spec, args)
+        passed = passed and report['median_error'] <= args.tolerance and not worse_than_fixed(report, args.slack)
+        print(json.dumps(report) if args.json else format_report(report), flush=True)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory held by solve results, as kept by token pools and work queue stores.
+
+Example::
+
+    python benchmarks/bench_result_memory.py --count 20000
+
+Results are built from solutions shaped like real provider responses, then every other reference to the solutions is
+dropped, so the reported bytes per result are what a pool of results actually retains: the result object, its token
+strings and, unless disabled, the raw solution dict. Token strings are unique per result while user agents repeat, as
+they do in practice.
+"""
+import argparse
+import gc
+import random
+import string
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from captcha.capsolver import CapSolverHCaptchaResult  # noqa: E402
+from captcha.twocaptcha import TwoCapchaFunCaptchaResult, TwoCapchaHCaptchaResult  # noqa: E402
+
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605',
+)
+
+
+def random_token(length: int) -> str:
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def capsolver_h_captcha_solution(token_length: int) -> dict:
+    # The user agent is copied, as it would be when decoded from a fresh response body.
+    return dict(gRecaptchaResponse=f'P1_{random_token(token_length)}', captchaKey=f'E0_{random_token(32)}',
+                userAgent=''.join(random.choice(USER_AGENTS)), timestamp=1700000000, expireTime=1700000120)
+
+
+def two_captcha_h_captcha_solution(token_length: int) -> dict:
+    return dict(token=f'P1_{random_token(token_length)}', respKey=f'E0_{random_token(32)}',
+                userAgent=''.join(random.choice(USER_AGENTS)))
+
+
+def two_captcha_fun_captcha_solution(token_length: int) -> dict:
+    return dict(token=f'{random_token(16)}|r=eu-west-1|meta=3|{random_token(token_length)}')
+
+
+def measure(build: Callable[[dict, bool], object], solution: Callable[[int], dict], count: int, token_length: int,
+            keep_raw_solution: bool, touch: bool) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    results = [build(solution(token_length), keep_raw_solution) for _ in range(count)]
+
+    if touch:
+        for result in results:
+            getattr(result, 'user_agent', None)
+            getattr(result, 'request_key', None)
+
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    del results
+
+    return retained / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000, help='results built per measurement')
+    parser.add_argument('--token-length', type=int, default=1500, help='characters in each token')
+    args = parser.parse_args()
+
+    targets = (
+        ('capsolver-hcaptcha', CapSolverHCaptchaResult, capsolver_h_captcha_solution),
+        ('2captcha-hcaptcha', TwoCapchaHCaptchaResult, two_captcha_h_captcha_solution),
+        ('2captcha-funcaptcha', TwoCapchaFunCaptchaResult, two_captcha_fun_captcha_solution),
+    )
+
+    print(f'{"target":<20} {"raw kept":>12} {"raw kept, parsed":>18} {"raw dropped":>12} {"token only":>12}')
+
+    for name, build, solution in targets:
+        kept = measure(build, solution, args.count, args.token_length, True, False)
+        kept_parsed = measure(build, solution, args.count, args.token_length, True, True)
+        dropped = measure(build, solution, args.count, args.token_length, False, True)
+        token = sys.getsizeof(f'P1_{random_token(args.token_length)}')
+
+        print(f'{name:<20} {kept:>10.0f} B {kept_parsed:>16.0f} B {dropped:>10.0f} B {token:>10.0f} B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Multi-threaded stress test of generators shared between worker threads, against the local fake provider server.
+
+Example::
+
+    python benchmarks/bench_thread_safety.py --threads 64 --solves 2000 --solve-time uniform:0.05:0.3
+
+Every target uses a single generator shared by all threads. Consecutive solves alternate between no proxy and proxies
+of every protocol, so a generator leaking state from one call into another creates tasks whose type does not match
+their proxy fields, which the server counts. Reports throughput, failures and mismatches, and exits with status 1 if
+any solve failed or any task was mismatched.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_server import add_server_arguments, server_options, start_server  # noqa: E402
+from captcha.capsolver import CapSolverHCaptchaGenerator  # noqa: E402
+from captcha.polling import FixedPolling  # noqa: E402
+from captcha.twocaptcha import RequestHandler, TwoCapchaFunCaptchaGenerator, TwoCapchaHCaptchaGenerator  # noqa: E402
+
+API_KEY = 'stress'
+WEBSITE_URL = 'https://stress.invalid'
+SITE_KEY = '00000000-0000-0000-0000-000000000000'
+PUBLIC_KEY = '00000000-0000-0000-0000-000000000000'
+
+TARGETS = ('capsolver-hcaptcha', '2captcha-hcaptcha', '2captcha-funcaptcha')
+PROTOCOLS = ('http', 'https', 'socks4', 'socks5')
+
+
+class StressProxy:
+    """
+    Minimal stand-in with the attributes the generators read from a ProxyConfig.
+    """
+
+    def __init__(self, hostname: str, port: int, protocol: str, username: str = None, password: str = None):
+        self.hostname: str = hostname
+        self.port: int = port
+        self.protocol: str = protocol
+        self.username: Optional[str] = username
+        self.password: Optional[str] = password
+
+    def has_username(self) -> bool:
+        return self.username is not None
+
+    def has_password(self) -> bool:
+        return self.password is not None
+
+
+def build_proxies(count: int) -> List[Optional[StressProxy]]:
+    """
+    :return: ``count`` proxies cycling through every protocol, with None (no proxy) between each of them.
+    """
+    proxies = list()
+
+    for index in range(count):
+        proxies.append(None)
+        proxies.append(StressProxy(f'10.0.{index // 250}.{index % 250 + 1}', 1080 + index, PROTOCOLS[index % 4],
+                                   username=f'user{index}' if index % 2 else None, password='secret'))
+
+    return proxies
+
+
+def server_request(base_url: str, method: str, path: str) -> dict:
+    request = urllib.request.Request(base_url + path, method=method, data=b'{}' if method == 'POST' else None)
+
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def build_solve(target: str, base_url: str, args: argparse.Namespace):
+    """
+    :return: The shared generator, and a function solving once with the given proxy.
+    """
+    polling_strategy = FixedPolling(args.poll_interval)
+
+    if target == 'capsolver-hcaptcha':
+        generator = CapSolverHCaptchaGenerator(API_KEY, WEBSITE_URL, pool_size=args.threads,
+                                               polling_strategy=polling_strategy, base_url=base_url)
+        return generator, lambda index, captcha_proxy: generator.generate(SITE_KEY, captcha_proxy=captcha_proxy,
+                                                                          invisible=bool(index % 3 == 0))
+
+    request_handler = RequestHandler(API_KEY, pool_size=args.threads, base_url=base_url)
+
+    if target == '2captcha-hcaptcha':
+        generator = TwoCapchaHCaptchaGenerator(request_handler, WEBSITE_URL, SITE_KEY,
+                                               polling_strategy=polling_strategy)
+        return generator, lambda index, captcha_proxy: generator.generate(captcha_proxy=captcha_proxy,
+                                                                          invisible=bool(index % 3 == 0))
+
+    generator = TwoCapchaFunCaptchaGenerator(request_handler, WEBSITE_URL, PUBLIC_KEY,
+                                             polling_strategy=polling_strategy)
+
+    return generator, lambda index, captcha_proxy: generator.generate(captcha_proxy=captcha_proxy)
+
+
+def stress_target(target: str, base_url: str, args: argparse.Namespace) -> dict:
+    server_request(base_url, 'POST', '/reset')
+    generator, solve = build_solve(target, base_url, args)
+    proxies = build_proxies(args.proxies)
+    failures = 0
+    tokens = set()
+    lock = threading.Lock()
+
+    def run(index: int):
+        nonlocal failures
+
+        try:
+            result = solve(index, proxies[index % len(proxies)])
+            token = getattr(result, 'response_key', None) or getattr(result, 'token', None)
+
+        except Exception:
+            with lock:
+                failures += 1
+
+            return
+
+        with lock:
+            tokens.add(token)
+
+    started_at = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(run, range(args.solves)))
+
+    elapsed = time.monotonic() - started_at
+    stats = server_request(base_url, 'GET', '/stats')
+
+    report = dict()
+    report['target'] = target
+    report['threads'] = args.threads
+    report['solves'] = args.solves
+    report['failures'] = failures
+    report['duplicate_tokens'] = args.solves - failures - len(tokens)
+    report['type_mismatches'] = stats.get('create_task_type_mismatch', 0)
+    report['solves_per_second'] = (args.solves - failures) / elapsed
+    report['fragment_cache_hit_rate'] = \
+        generator.task_fragments.hits / max(1, generator.task_fragments.hits + generator.task_fragments.misses)
+
+    return report
+
+
+def format_report(report: dict) -> str:
+    return (f"{report['target']:<20} threads={report['threads']:<4} solves={report['solves']:<6} "
+            f"failures={report['failures']:<4} mismatches={report['type_mismatches']:<4} "
+            f"duplicates={report['duplicate_tokens']:<4} rate={report['solves_per_second']:.2f}/s "
+            f"fragment-hits={report['fragment_cache_hit_rate']:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=TARGETS + ('all',), default='all')
+    parser.add_argument('--threads', type=int, default=32, help='worker threads sharing one generator')
+    parser.add_argument('--solves', type=int, default=500, help='solves per target')
+    parser.add_argument('--proxies', type=int, default=20, help='distinct proxies rotated through')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='fixed polling interval in seconds')
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    add_server_arguments(parser)
+    parser.set_defaults(solve_time='uniform:0.05:0.3')
+    args = parser.parse_args()
+
+    process, base_url = start_server(**server_options(args))
+    passed = True
+
+    try:
+        for target in (TARGETS if args.target == 'all' else (args.target,)):
+            report = stress_target(target, base_url, args)
+            passed = passed and not report['failures'] and not report['type_mismatches'] \
+                and not report['duplicate_tokens']
+            print(json.dumps(report) if args.json else format_report(report), flush=True)
+
+    finally:
+        process.terminate()
+        process.join()
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
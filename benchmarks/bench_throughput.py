@@ -0,0 +1,308 @@
+"""
+Throughput and latency benchmark of the solving generators against the local fake provider server.
+
+Example::
+
+    python benchmarks/bench_throughput.py --solves 500 --concurrency 50 --solve-time lognormal:2:0.4
+
+Reports, per generator, solves per second, p50/p95/p99 time-to-token, HTTP calls per solve (as seen by the server,
+so retries and throttled calls are included) and traced Python memory per in-flight solve. Nothing leaves the machine.
+With ``--callback``, 2Captcha generators receive results through a local CallbackReceiver instead of polling.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_server import add_server_arguments, server_options, start_server  # noqa: E402
+from captcha.callback import CallbackReceiver  # noqa: E402
+from captcha.capsolver import CapSolverHCaptchaGenerator  # noqa: E402
+from captcha.instrumentation import SolveContext, SolveListener  # noqa: E402
+from captcha.poller import TaskPoller  # noqa: E402
+from captcha.polling import FixedPolling  # noqa: E402
+from captcha.retry import RetryPolicy  # noqa: E402
+from captcha.twocaptcha import RequestHandler, TwoCapchaFunCaptchaGenerator, TwoCapchaHCaptchaGenerator  # noqa: E402
+
+API_KEY = 'benchmark'
+WEBSITE_URL = 'https://bench.invalid'
+SITE_KEY = '00000000-0000-0000-0000-000000000000'
+PUBLIC_KEY = '00000000-0000-0000-0000-000000000000'
+
+TARGETS = ('capsolver-hcaptcha', '2captcha-hcaptcha', '2captcha-funcaptcha')
+
+
+class InFlightCounter(SolveListener):
+    def __init__(self):
+        self.in_flight: int = 0
+        self._lock = threading.Lock()
+
+    def on_solve_started(self, context: SolveContext):
+        with self._lock:
+            self.in_flight += 1
+
+    def on_solve_finished(self, context: SolveContext, error: Optional[Exception]):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class MemorySampler:
+    """
+    Samples traced memory above the starting baseline together with the number of solves in flight, and keeps the
+    sample with the highest in-flight count.
+    """
+
+    def __init__(self, counter: InFlightCounter, interval: float = 0.05):
+        self.counter: InFlightCounter = counter
+        self.interval: float = interval
+        self.peak_in_flight: int = 0
+        self.peak_bytes: int = 0
+        self._baseline: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            in_flight = self.counter.in_flight
+            current = tracemalloc.get_traced_memory()[0] - self._baseline
+
+            if in_flight > self.peak_in_flight or (in_flight == self.peak_in_flight and current > self.peak_bytes):
+                self.peak_in_flight = in_flight
+                self.peak_bytes = current
+
+    @property
+    def bytes_per_in_flight(self) -> Optional[float]:
+        return self.peak_bytes / self.peak_in_flight if self.peak_in_flight else None
+
+
+def server_request(base_url: str, method: str, path: str) -> dict:
+    request = urllib.request.Request(base_url + path, method=method, data=b'{}' if method == 'POST' else None)
+
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def build_target(target: str, base_url: str, args: argparse.Namespace, listeners: list, poller: Optional[TaskPoller],
+                 callback_receiver: Optional[CallbackReceiver]):
+    """
+    :return: The generator, and a function calling it with the given async flag.
+    """
+    polling_strategy = FixedPolling(args.poll_interval) if args.poll_interval is not None else None
+    retry_policy = RetryPolicy(max_attempts=args.max_attempts, backoff=args.backoff)
+
+    if target == 'capsolver-hcaptcha':
+        generator = CapSolverHCaptchaGenerator(API_KEY, WEBSITE_URL, pool_size=args.concurrency, poller=poller,
+                                               polling_strategy=polling_strategy, retry_policy=retry_policy,
+                                               listeners=listeners, base_url=base_url)
+        return generator, lambda asynchronous: (generator.agenerate if asynchronous else generator.generate)(SITE_KEY)
+
+    request_handler = RequestHandler(API_KEY, pool_size=args.concurrency, base_url=base_url)
+
+    if target == '2captcha-hcaptcha':
+        generator = TwoCapchaHCaptchaGenerator(request_handler, WEBSITE_URL, SITE_KEY, poller=poller,
+                                               polling_strategy=polling_strategy, retry_policy=retry_policy,
+                                               listeners=listeners, callback_receiver=callback_receiver)
+    else:
+        generator = TwoCapchaFunCaptchaGenerator(request_handler, WEBSITE_URL, PUBLIC_KEY, poller=poller,
+                                                 polling_strategy=polling_strategy, retry_policy=retry_policy,
+                                                 listeners=listeners, callback_receiver=callback_receiver)
+
+    return request_handler, lambda asynchronous: (generator.agenerate if asynchronous else generator.generate)()
+
+
+def run_threads(solve: Callable[[bool], object], solves: int, concurrency: int) -> Tuple[List[float], int]:
+    latencies = list()
+    failures = 0
+    lock = threading.Lock()
+
+    def timed():
+        nonlocal failures
+        started_at = time.monotonic()
+
+        try:
+            solve(False)
+
+        except Exception:
+            with lock:
+                failures += 1
+
+            return
+
+        with lock:
+            latencies.append(time.monotonic() - started_at)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(solves):
+            executor.submit(timed)
+
+    return latencies, failures
+
+
+def run_async(solve: Callable[[bool], object], solves: int, concurrency: int, closer) -> Tuple[List[float], int]:
+    latencies = list()
+    failures = 0
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed():
+            nonlocal failures
+
+            async with semaphore:
+                started_at = time.monotonic()
+
+                try:
+                    await solve(True)
+
+                except Exception:
+                    failures += 1
+                    return
+
+                latencies.append(time.monotonic() - started_at)
+
+        try:
+            await asyncio.gather(*(timed() for _ in range(solves)))
+
+        finally:
+            await closer.aclose()
+
+    asyncio.run(main())
+
+    return latencies, failures
+
+
+def bench_target(target: str, base_url: str, args: argparse.Namespace) -> Dict[str, object]:
+    counter = InFlightCounter()
+    poller = TaskPoller(tick=args.poller_tick) if args.poller else None
+    # CapSolver has no result callbacks, so it is always polled.
+    callback_receiver = CallbackReceiver(fallback_interval=args.callback_fallback) \
+        if args.callback and target.startswith('2captcha') else None
+    closer, solve = build_target(target, base_url, args, [counter], poller, callback_receiver)
+    sampler = MemorySampler(counter) if args.memory else None
+
+    server_request(base_url, 'POST', '/reset')
+
+    if sampler is not None:
+        tracemalloc.start()
+        sampler.start()
+
+    started_at = time.monotonic()
+
+    try:
+        if args.mode == 'async':
+            latencies, failures = run_async(solve, args.solves, args.concurrency, closer)
+        else:
+            latencies, failures = run_threads(solve, args.solves, args.concurrency)
+
+    finally:
+        duration = time.monotonic() - started_at
+
+        if sampler is not None:
+            sampler.stop()
+            tracemalloc.stop()
+
+        closer.close()
+
+        if poller is not None:
+            poller.close()
+
+        if callback_receiver is not None:
+            callback_receiver.close()
+
+    stats = server_request(base_url, 'GET', '/stats')
+    http_calls = stats.get('create_task', 0) + stats.get('get_task_result', 0)
+    latencies.sort()
+
+    report = dict()
+    report['target'] = target
+    report['mode'] = args.mode
+    report['solves'] = len(latencies)
+    report['failures'] = failures
+    report['duration'] = duration
+    report['solves_per_second'] = len(latencies) / duration if duration else None
+    report['p50'] = percentile(latencies, 0.5)
+    report['p95'] = percentile(latencies, 0.95)
+    report['p99'] = percentile(latencies, 0.99)
+    report['http_calls_per_solve'] = http_calls / len(latencies) if latencies else None
+    report['throttled'] = stats.get('create_task_throttled', 0)
+    report['peak_in_flight'] = sampler.peak_in_flight if sampler is not None else None
+    report['bytes_per_in_flight'] = sampler.bytes_per_in_flight if sampler is not None else None
+
+    return report
+
+
+def format_report(report: Dict[str, object]) -> str:
+    def seconds(value):
+        return f'{value:.3f}s' if value is not None else '-'
+
+    memory = report['bytes_per_in_flight']
+    memory = f'{memory / 1024:.1f} KiB' if memory is not None else '-'
+    calls = report['http_calls_per_solve']
+    calls = f'{calls:.2f}' if calls is not None else '-'
+
+    return (f"{report['target']:<20} {report['mode']:<7} solves={report['solves']:<5} failures={report['failures']:<4} "
+            f"rate={report['solves_per_second']:.2f}/s p50={seconds(report['p50'])} p95={seconds(report['p95'])} "
+            f"p99={seconds(report['p99'])} http/solve={calls} throttled={report['throttled']} "
+            f"mem/in-flight={memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=TARGETS + ('all',), default='all')
+    parser.add_argument('--mode', choices=('threads', 'async'), default='threads',
+                        help='drive generate() from a thread pool or agenerate() from asyncio (requires aiohttp)')
+    parser.add_argument('--solves', type=int, default=200, help='solves per target')
+    parser.add_argument('--concurrency', type=int, default=20, help='solves in flight')
+    parser.add_argument('--poll-interval', type=float, default=None,
+                        help='fixed polling interval in seconds, the generator default if omitted')
+    parser.add_argument('--poller', action='store_true', help='poll through a shared TaskPoller')
+    parser.add_argument('--poller-tick', type=float, default=0.5)
+    parser.add_argument('--callback', action='store_true', help='receive 2Captcha results through callbacks')
+    parser.add_argument('--callback-fallback', type=float, default=5, help='seconds between fallback result checks')
+    parser.add_argument('--max-attempts', type=int, default=1, help='tasks created per solve before giving up')
+    parser.add_argument('--backoff', type=float, default=0.1, help='seconds between attempts')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip tracemalloc, which slows down the client')
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    add_server_arguments(parser)
+    parser.set_defaults(solve_time='lognormal:2:0.4')
+    args = parser.parse_args()
+
+    process, base_url = start_server(**server_options(args))
+
+    try:
+        for target in (TARGETS if args.target == 'all' else (args.target,)):
+            report = bench_target(target, base_url, args)
+            print(json.dumps(report) if args.json else format_report(report), flush=True)
+
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""
+Local stand-in for the CapSolver and 2Captcha task APIs, used by the benchmarks so they run entirely offline.
+
+Both providers share the ``/createTask`` and ``/getTaskResult`` endpoints and the same response envelope, so a single
+server serves every generator in this package. Tasks become ready after a solve time drawn from a configurable
+distribution, a configurable fraction of tasks fail, and createTask calls above a configurable rate are rejected.
+With a balance, every created task is charged and createTask fails with ``ERROR_ZERO_BALANCE`` once it runs out;
+``/getBalance`` returns what is left. Tasks whose type does not match the presence of proxy fields are counted as
+``create_task_type_mismatch``. Tasks created with a ``callbackUrl`` are posted there as soon as they finish, like
+2Captcha pingbacks, except for a configurable fraction of lost callbacks.
+
+Run standalone with ``python benchmarks/fake_server.py --port 8080``, or start it from a benchmark with
+``start_server``. ``GET /stats`` returns the request counters as JSON and ``POST /reset`` clears them.
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_SOLVE_TIME = 'lognormal:5:0.5'
+DEFAULT_FAILURE_CODE = 'ERROR_CAPTCHA_UNSOLVABLE'
+DEFAULT_THROTTLE_CODE = 'ERROR_NO_SLOT_AVAILABLE'
+DEFAULT_TASK_COST = 0.001
+CALLBACK_RETENTION = 60
+# Bursts of concurrent solves open many connections at once. With the default backlog of 5 the kernel drops the
+# excess and clients retransmit after a second, so the benchmarks would mostly measure the server.
+LISTEN_BACKLOG = 1024
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """
+    Parses a solve time distribution. Supported forms are ``fixed:SECONDS``, ``uniform:LOW:HIGH``,
+    ``lognormal:MEDIAN:SIGMA`` and ``exponential:MEAN``.
+    """
+    name, *params = spec.split(':')
+    values = [float(param) for param in params]
+
+    if name == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+
+    if name == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+
+    if name == 'lognormal' and len(values) == 2:
+        # The median of a lognormal distribution is exp(mu).
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+
+    if name == 'exponential' and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0])
+
+    raise ValueError(f'Invalid solve time distribution: {spec}')
+
+
+class FakeProvider:
+    """
+    Task state of the fake server. All methods are thread safe.
+    """
+
+    def __init__(self, solve_time: Callable[[], float], error_rate: float = 0.0,
+                 failure_code: str = DEFAULT_FAILURE_CODE, create_rate: Optional[float] = None,
+                 throttle_code: str = DEFAULT_THROTTLE_CODE, latency: float = 0.0, balance: Optional[float] = None,
+                 task_cost: float = DEFAULT_TASK_COST, callback_loss: float = 0.0):
+        """
+        :param solve_time: Returns the seconds a new task takes to become ready
+        :param error_rate: Fraction of tasks that end with ``failure_code`` instead of a solution
+        :param failure_code: Error code of failed tasks
+        :param create_rate: Maximum accepted createTask calls per second, unlimited if None
+        :param throttle_code: Error code returned to throttled createTask calls
+        :param latency: Seconds added to every response
+        :param balance: Account balance, unlimited if None
+        :param task_cost: Amount charged for every created task
+        :param callback_loss: Fraction of result callbacks that are never sent
+        """
+        self.solve_time: Callable[[], float] = solve_time
+        self.error_rate: float = error_rate
+        self.failure_code: str = failure_code
+        self.create_rate: Optional[float] = create_rate
+        self.throttle_code: str = throttle_code
+        self.latency: float = latency
+        self.balance: Optional[float] = balance
+        self.task_cost: float = task_cost
+        self.callback_loss: float = callback_loss
+
+        self._tasks: Dict[str, Tuple[float, bool, str]] = dict()
+        self._task_ids = itertools.count(1)
+        self._allowance: float = create_rate or 0.0
+        self._allowance_at: float = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = dict()
+
+    def _count(self, name: str):
+        self._stats[name] = self._stats.get(name, 0) + 1
+
+    def _throttled(self, now: float) -> bool:
+        if self.create_rate is None:
+            return False
+
+        self._allowance = min(self.create_rate, self._allowance + (now - self._allowance_at) * self.create_rate)
+        self._allowance_at = now
+
+        if self._allowance < 1:
+            return True
+
+        self._allowance -= 1
+        return False
+
+    def create_task(self, body: dict) -> dict:
+        now = time.monotonic()
+
+        with self._lock:
+            self._count('create_task')
+
+            if not body.get('clientKey') or not isinstance(body.get('task'), dict):
+                self._count('create_task_rejected')
+                return dict(errorId=1, errorCode='ERROR_BAD_PARAMETERS', errorDescription='Missing clientKey or task')
+
+            task = body['task']
+
+            # A proxyless task type carrying proxy fields, or the reverse, means the client mixed up two requests.
+            if str(task.get('type', '')).lower().endswith('proxyless') == ('proxyAddress' in task):
+                self._count('create_task_type_mismatch')
+
+            if self._throttled(now):
+                self._count('create_task_throttled')
+                return dict(errorId=1, errorCode=self.throttle_code, errorDescription='Throttled')
+
+            if self.balance is not None:
+                if self.balance < self.task_cost:
+                    self._count('create_task_no_balance')
+                    return dict(errorId=1, errorCode='ERROR_ZERO_BALANCE', errorDescription='Zero balance')
+
+                self.balance -= self.task_cost
+
+            task_id = str(next(self._task_ids))
+            failed = random.random() < self.error_rate
+            solve_time = self.solve_time()
+            self._tasks[task_id] = (now + solve_time, failed, body['task'].get('userAgent') or 'Mozilla/5.0')
+
+        if body.get('callbackUrl') and random.random() >= self.callback_loss:
+            timer = threading.Timer(solve_time, self._send_callback, (task_id, body['callbackUrl']))
+            timer.daemon = True
+            timer.start()
+
+        return dict(errorId=0, taskId=task_id)
+
+    def _send_callback(self, task_id: str, url: str):
+        # The task stays available to getTaskResult for a while, as clients may check it while the callback is sent.
+        with self._lock:
+            result = self._task_result(task_id, time.monotonic(), remove=False)
+
+        # Already collected by a getTaskResult call.
+        if result.get('errorCode') == 'ERROR_TASKID_INVALID':
+            return
+
+        timer = threading.Timer(CALLBACK_RETENTION, self._forget, (task_id,))
+        timer.daemon = True
+        timer.start()
+
+        request = urllib.request.Request(url, data=json.dumps(dict(result, id=task_id)).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+
+        try:
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+
+            name = 'callbacks_sent'
+
+        except OSError:
+            name = 'callbacks_failed'
+
+        with self._lock:
+            self._count(name)
+
+    def get_task_result(self, body: dict) -> dict:
+        now = time.monotonic()
+        task_id = str(body.get('taskId'))
+
+        with self._lock:
+            self._count('get_task_result')
+            result = self._task_result(task_id, now)
+
+            if result.get('errorCode') == 'ERROR_TASKID_INVALID':
+                self._count('get_task_result_invalid')
+
+        return result
+
+    def _forget(self, task_id: str):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def _task_result(self, task_id: str, now: float, remove: bool = True) -> dict:
+        """
+        Result of a task, removing it once finished unless ``remove`` is False. Must be called with the lock held.
+        """
+        task = self._tasks.get(task_id)
+
+        if task is None:
+            return dict(errorId=1, errorCode='ERROR_TASKID_INVALID', errorDescription='Unknown task')
+
+        ready_at, failed, user_agent = task
+
+        if now < ready_at:
+            return dict(errorId=0, status='processing')
+
+        if remove:
+            del self._tasks[task_id]
+
+        if failed:
+            self._count('tasks_failed')
+            return dict(errorId=1, errorCode=self.failure_code, errorDescription='Task failed')
+
+        self._count('tasks_solved')
+
+        token = f'P1_fake.{task_id}.{random.getrandbits(64):016x}'
+
+        # The solution carries the keys of every task type of both providers.
+        solution = dict(gRecaptchaResponse=token, captchaKey=f'E0_{task_id}', token=token, respKey=f'E0_{task_id}',
+                        userAgent=user_agent)
+
+        return dict(errorId=0, status='ready', solution=solution)
+
+    def get_balance(self, body: dict) -> dict:
+        with self._lock:
+            self._count('get_balance')
+            balance = self.balance if self.balance is not None else 1e9
+
+        return dict(errorId=0, balance=balance)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tasks_pending'] = len(self._tasks)
+
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._tasks.clear()
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    provider: FakeProvider = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.provider.stats())
+        else:
+            self._send_json(404, dict(error='Not found'))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+
+        except ValueError:
+            self._send_json(400, dict(errorId=1, errorCode='ERROR_BAD_REQUEST'))
+            return
+
+        if self.provider.latency:
+            time.sleep(self.provider.latency)
+
+        if self.path == '/createTask':
+            self._send_json(200, self.provider.create_task(body))
+
+        elif self.path == '/getTaskResult':
+            self._send_json(200, self.provider.get_task_result(body))
+
+        elif self.path == '/getBalance':
+            self._send_json(200, self.provider.get_balance(body))
+
+        elif self.path == '/reset':
+            self.provider.reset()
+            self._send_json(200, dict())
+
+        else:
+            self._send_json(404, dict(error='Not found'))
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+
+def create_server(provider: FakeProvider, host: str = DEFAULT_HOST, port: int = 0) -> ThreadingHTTPServer:
+    handler = type('BoundFakeProviderHandler', (FakeProviderHandler,), dict(provider=provider))
+    server = _HTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    return server
+
+
+def _serve(options: dict, ready):
+    provider = FakeProvider(parse_distribution(options.pop('solve_time')), **options)
+    server = create_server(provider)
+    ready.put(server.server_address[1])
+    server.serve_forever(poll_interval=0.1)
+
+
+def start_server(solve_time: str = DEFAULT_SOLVE_TIME, **options) -> Tuple[multiprocessing.Process, str]:
+    """
+    Starts the fake server in a child process, so its memory and CPU use do not skew the measurements of the process
+    under test.
+
+    :param solve_time: Solve time distribution, see parse_distribution
+    :param options: Keyword arguments of FakeProvider
+    :return: The server process and its base url
+    """
+    parse_distribution(solve_time)
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(dict(options, solve_time=solve_time), ready), daemon=True)
+    process.start()
+
+    return process, f'http://{DEFAULT_HOST}:{ready.get(timeout=10)}'
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--solve-time', default=DEFAULT_SOLVE_TIME,
+                        help='fixed:S, uniform:LOW:HIGH, lognormal:MEDIAN:SIGMA or exponential:MEAN (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of tasks that fail')
+    parser.add_argument('--failure-code', default=DEFAULT_FAILURE_CODE, help='error code of failed tasks')
+    parser.add_argument('--create-rate', type=float, default=None, help='createTask calls per second before throttling')
+    parser.add_argument('--throttle-code', default=DEFAULT_THROTTLE_CODE, help='error code of throttled calls')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--balance', type=float, default=None, help='account balance, unlimited if omitted')
+    parser.add_argument('--task-cost', type=float, default=DEFAULT_TASK_COST, help='amount charged per created task')
+    parser.add_argument('--callback-loss', type=float, default=0.0, help='fraction of result callbacks never sent')
+
+
+def server_options(args: argparse.Namespace) -> dict:
+    options = dict()
+    options['solve_time'] = args.solve_time
+    options['error_rate'] = args.error_rate
+    options['failure_code'] = args.failure_code
+    options['create_rate'] = args.create_rate
+    options['throttle_code'] = args.throttle_code
+    options['latency'] = args.latency
+    options['balance'] = args.balance
+    options['task_cost'] = args.task_cost
+    options['callback_loss'] = args.callback_loss
+
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=8080)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    options = server_options(args)
+    provider = FakeProvider(parse_distribution(options.pop('solve_time')), **options)
+    server = create_server(provider, args.host, args.port)
+    print(f'Serving on http://{args.host}:{server.server_address[1]}')
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import importlib
+import logging
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# Imported on first access, so ``import captcha`` stays cheap.
+_LAZY_ATTRIBUTES = dict(create_generator='.registry', register_provider='.registry', providers='.registry')
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+
+    if module_name is None:
+        raise (AttributeError(f'module {__name__!r} has no attribute {name!r}'))
+
+    return getattr(importlib.import_module(module_name, __name__), name)
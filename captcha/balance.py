@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 60
+
+# Error codes of solves rejected before any task is created. Both are raised with the provider's failed exception.
+ERROR_INSUFFICIENT_BALANCE = 'ERROR_INSUFFICIENT_BALANCE'
+ERROR_BUDGET_EXCEEDED = 'ERROR_BUDGET_EXCEEDED'
+
+
+class SolveBudget:
+    """
+    Limits of a single solve. ``max_cost`` is compared against the cost of every task the solve creates, retries
+    included, and needs the generator to know its task costs. ``max_latency`` caps the seconds spent on the solve and
+    tightens the deadline of the retry policy.
+    """
+
+    def __init__(self, max_cost: Optional[float] = None, max_latency: Optional[float] = None):
+        self.max_cost: Optional[float] = max_cost
+        self.max_latency: Optional[float] = max_latency
+
+
+class BalanceMonitor:
+    """
+    Cached account balance of a provider, refreshed from its getBalance endpoint by a background thread.
+
+    Solves consult the monitor before creating a task, so once funds run low they are rejected without a request
+    instead of every worker creating tasks that are doomed to fail. Between refreshes the cached balance is lowered by
+    the cost of every task created, and drops to zero as soon as a provider reports a zero balance. A balance that has
+    never been fetched admits every solve.
+    """
+
+    def __init__(self, client, refresh_interval: float = DEFAULT_REFRESH_INTERVAL, min_balance: float = 0.0,
+                 start: bool = True):
+        """
+        :param client: ProviderClient (or 2Captcha RequestHandler) of the account to monitor
+        :param refresh_interval: Seconds between balance requests
+        :param min_balance: Balance to keep in reserve. Solves that would go below it are rejected.
+        :param start: Fetch the balance and start the refresh thread now
+        """
+        self.client = client
+        self.refresh_interval: float = refresh_interval
+        self.min_balance: float = min_balance
+        self.balance: Optional[float] = None
+        self.updated_at: Optional[float] = None
+
+        self.refreshes: int = 0
+        self.refresh_failures: int = 0
+        self.rejected: int = 0
+
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        if start:
+            self.start()
+
+    @property
+    def provider(self) -> str:
+        return self.client.adapter.name
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._refresh_logged()
+        self._thread = threading.Thread(target=self._run, name=f'captcha-balance-{self.provider}', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._closed.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def refresh(self) -> float:
+        """
+        Fetches the balance now.
+
+        :return: The new balance
+        """
+        balance = self.client.get_balance()
+
+        with self._lock:
+            self.balance = balance
+            self.updated_at = time.monotonic()
+            self.refreshes += 1
+
+        logger.debug(f'{self.provider} balance: {balance}')
+
+        return balance
+
+    def _refresh_logged(self):
+        try:
+            self.refresh()
+
+        except Exception as e:
+            # The last known balance stays in use until a refresh succeeds.
+            self.refresh_failures += 1
+            logger.warning(f'Could not refresh the {self.provider} balance. Reason: {e}')
+
+    def _run(self):
+        while not self._closed.wait(self.refresh_interval):
+            self._refresh_logged()
+
+    def admits(self, cost: Optional[float] = None) -> bool:
+        """
+        :param cost: Cost of the task about to be created, if known
+        :return: False if the cached balance cannot cover the task while keeping ``min_balance`` in reserve.
+        """
+        with self._lock:
+            if self.balance is None:
+                return True
+
+            admitted = self.balance > self.min_balance and self.balance - (cost or 0.0) >= self.min_balance
+
+            if not admitted:
+                self.rejected += 1
+
+            return admitted
+
+    def charge(self, cost: float):
+        """
+        Lowers the cached balance by the cost of a created task, until the next refresh.
+        """
+        with self._lock:
+            if self.balance is not None:
+                self.balance -= cost
+
+    def mark_exhausted(self):
+        """
+        Sets the cached balance to zero, after the provider rejected a task for lack of funds.
+        """
+        with self._lock:
+            if self.balance != 0.0:
+                logger.warning(f'{self.provider} reported a zero balance. Solves are rejected until the next refresh.')
+
+            self.balance = 0.0
+            self.updated_at = time.monotonic()
+
+    def metrics(self) -> dict:
+        metrics = dict()
+        metrics['balance'] = self.balance
+        metrics['refreshes'] = self.refreshes
+        metrics['refresh_failures'] = self.refresh_failures
+        metrics['rejected'] = self.rejected
+
+        return metrics
@@ -1,9 +1,75 @@
-import requests
-from proxy import ProxyConfig
-from typing import Protocol
+from __future__ import annotations
+import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Protocol
+
+if TYPE_CHECKING:
+    import requests
+    from proxy import ProxyConfig
+
+USER_AGENT_HEADER_CACHE_SIZE = 256
+
+KIND_H_CAPTCHA = 'hcaptcha'
+KIND_FUN_CAPTCHA = 'funcaptcha'
+
+
+PROXY_PROTOCOL_HTTP = 'http'
+PROXY_PROTOCOL_HTTPS = 'https'
+PROXY_PROTOCOL_SOCKS4 = 'socks4'
+PROXY_PROTOCOL_SOCKS5 = 'socks5'
+
+# Spellings of the same protocol found in proxy URLs and configs
+PROXY_PROTOCOL_ALIASES = {
+    'socks4a': PROXY_PROTOCOL_SOCKS4,
+    'socks5h': PROXY_PROTOCOL_SOCKS5,
+    'socks': PROXY_PROTOCOL_SOCKS5,
+}
+
+
+def proxy_protocol(captcha_proxy: ProxyConfig) -> str:
+    """
+    Normalised protocol of a proxy configuration: one of http, https, socks4 and socks5, or the protocol as given if it
+    is none of those. Configurations without a protocol are HTTP proxies.
+    """
+    protocol = getattr(captcha_proxy, 'protocol', None) or getattr(captcha_proxy, 'scheme', None)
+
+    if not protocol:
+        return PROXY_PROTOCOL_HTTP
+
+    protocol = str(getattr(protocol, 'value', protocol)).lower().rstrip(':/')
+
+    return PROXY_PROTOCOL_ALIASES.get(protocol, protocol)
+
+
+def proxy_key(captcha_proxy: Optional[ProxyConfig]) -> Optional[tuple]:
+    """
+    Hashable identity of a proxy configuration, or None when no proxy is used.
+    """
+    if captcha_proxy is None:
+        return None
+
+    username = captcha_proxy.username if captcha_proxy.has_username() else None
+    password = captcha_proxy.password if captcha_proxy.has_password() else None
+
+    return proxy_protocol(captcha_proxy), captcha_proxy.hostname, captcha_proxy.port, username, password
+
+
+def proxy_endpoint(captcha_proxy: Optional[ProxyConfig]) -> Optional[tuple]:
+    """
+    Identity of the proxy server behind a configuration, regardless of protocol and password. Used to track the health
+    of a proxy across the tasks sent through it.
+    """
+    if captcha_proxy is None:
+        return None
+
+    username = captcha_proxy.username if captcha_proxy.has_username() else None
+
+    return str(captcha_proxy.hostname), str(captcha_proxy.port), username
 
 
 class BaseFunCaptchaResult:
+    __slots__ = ('_token',)
+
     @property
     def token(self):
         return self._token
@@ -17,29 +83,109 @@ class BaseFunCaptchaGenerator(Protocol):
         pass
 
 
+class BaseAsyncFunCaptchaGenerator(Protocol):
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        pass
+
+
+@lru_cache(maxsize=None)
+def _shared_headers_type() -> type:
+    """
+    Defined on first use, so importing this module does not import requests.
+    """
+    from requests.structures import CaseInsensitiveDict
+
+    class _SharedHeaders(CaseInsensitiveDict):
+        """
+        Read only headers shared by every result with the same user agent. ``copy()`` returns a mutable copy.
+        """
+
+        def __init__(self, data=None, **kwargs):
+            super().__init__(data, **kwargs)
+            self._frozen: bool = True
+
+        def __setitem__(self, key, value):
+            if getattr(self, '_frozen', False):
+                raise (TypeError('Shared headers are read only, use copy() to modify them.'))
+
+            super().__setitem__(key, value)
+
+        def __delitem__(self, key):
+            if getattr(self, '_frozen', False):
+                raise (TypeError('Shared headers are read only, use copy() to modify them.'))
+
+            super().__delitem__(key)
+
+    return _SharedHeaders
+
+
+@lru_cache(maxsize=USER_AGENT_HEADER_CACHE_SIZE)
+def _user_agent_header(user_agent: Optional[str]) -> requests.structures.CaseInsensitiveDict:
+    # Without a user agent the header is left out rather than sent as None.
+    return _shared_headers_type()({'User-Agent': user_agent} if user_agent is not None else None)
+
+
+def intern_user_agent(user_agent: Optional[str]) -> Optional[str]:
+    """
+    Solutions of a provider only carry a handful of distinct user agents, so pooled results share one string each.
+    """
+    return sys.intern(user_agent) if type(user_agent) is str else user_agent
+
+
 class BaseHCaptchaResult:
+    """
+    Slotted so pooled results stay small. Subclasses may leave ``_request_key`` and ``_user_agent`` unset and
+    implement ``_parse_request_key`` and ``_parse_user_agent`` instead, which are called on first access.
+    """
+
+    __slots__ = ('_response_key', '_request_key', '_user_agent')
+
     @property
     def response_key(self):
         return self._response_key
 
     @property
     def request_key(self):
-        return self._request_key
+        try:
+            return self._request_key
+
+        except AttributeError:
+            self._request_key = self._parse_request_key()
+            return self._request_key
 
     @property
     def user_agent(self):
-        return self._user_agent
+        try:
+            return self._user_agent
+
+        except AttributeError:
+            self._user_agent = intern_user_agent(self._parse_user_agent())
+            return self._user_agent
 
     def __init__(self, response_key: str, request_key: str, user_agent: str):
         self._response_key: str = response_key
         self._request_key: str = request_key
-        self._user_agent: str = user_agent
+        self._user_agent: str = intern_user_agent(user_agent)
+
+    def _parse_request_key(self) -> Optional[str]:
+        return None
 
-    def generate_user_agent_header(self) -> requests.sessions.CaseInsensitiveDict:
-        session_headers = requests.sessions.CaseInsensitiveDict()
-        session_headers['User-Agent'] = self.user_agent
+    def _parse_user_agent(self) -> Optional[str]:
+        return None
 
-        return session_headers
+    def generate_user_agent_header(self) -> requests.structures.CaseInsensitiveDict:
+        """
+        :return: Headers holding the user agent of the solution, empty if the provider returned none. The mapping is
+            the caller's own to modify.
+        """
+        return self.shared_user_agent_header().copy()
+
+    def shared_user_agent_header(self) -> requests.structures.CaseInsensitiveDict:
+        """
+        :return: The headers of ``generate_user_agent_header`` without the copy. The mapping is shared between results
+            with the same user agent and read only.
+        """
+        return _user_agent_header(self.user_agent)
 
 
 class BaseHCaptchaGenerator(Protocol):
@@ -47,3 +193,7 @@ class BaseHCaptchaGenerator(Protocol):
         pass
 
 
+class BaseAsyncHCaptchaGenerator(Protocol):
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None,
+                        invisible: bool = False) -> BaseHCaptchaResult:
+        pass
@@ -0,0 +1,469 @@
+"""
+Token broker: a long running process solving captchas for short lived jobs and programs in other languages.
+
+The broker holds the generators, so their connection pools, rate limits and token pools outlive any single job. Jobs
+send one JSON object per line over a Unix socket (or POST the same object to ``/solve`` on a localhost HTTP port) and
+get one JSON object back per request::
+
+    {"id": 1, "kind": "hcaptcha", "site_key": "...", "invisible": false, "proxy": null}
+    {"id": 1, "ok": true, "result": {"response_key": "...", "request_key": "...", "user_agent": "..."}}
+
+    {"id": 2, "kind": "funcaptcha", "proxy": {"protocol": "socks5", "hostname": "10.0.0.1", "port": 1080}}
+    {"id": 2, "ok": false, "error": "...", "error_code": "ERROR_BROKER_BUSY"}
+
+Requests on one connection may be pipelined; responses carry the ``id`` of their request and may come back out of
+order. Run it with ``python -m captcha.broker --help``. Jobs talk to it through ``captcha.brokerclient``, whose names
+are also available here.
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+import stat
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from .base import KIND_FUN_CAPTCHA, KIND_H_CAPTCHA, BaseFunCaptchaGenerator, BaseHCaptchaGenerator
+from .brokerclient import (ERROR_BAD_REQUEST, ERROR_BROKER_BUSY, ERROR_NO_GENERATOR, KIND_STATS, BrokerClient,
+                           BrokerException, BrokerFunCaptchaGenerator, BrokerHCaptchaGenerator, BrokerRequestFailed,
+                           BrokerUnavailable, ProxySpec, decode_proxy, encode_proxy, encode_result)
+
+# Names of captcha.brokerclient are re-exported, so servers and clients can be imported from one module.
+__all__ = ('DEFAULT_HOST', 'DEFAULT_MAX_CONCURRENT', 'DEFAULT_MAX_QUEUED', 'DEFAULT_SOCKET_MODE', 'MAX_REQUEST_SIZE',
+           'LISTEN_BACKLOG', 'UNIX_SOCKETS_AVAILABLE', 'TokenBroker', 'main', 'ERROR_BAD_REQUEST', 'ERROR_BROKER_BUSY',
+           'ERROR_NO_GENERATOR', 'KIND_STATS', 'BrokerClient', 'BrokerException', 'BrokerFunCaptchaGenerator',
+           'BrokerHCaptchaGenerator', 'BrokerRequestFailed', 'BrokerUnavailable', 'ProxySpec', 'decode_proxy',
+           'encode_proxy', 'encode_result')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_MAX_CONCURRENT = 32
+DEFAULT_MAX_QUEUED = 256
+DEFAULT_SOCKET_MODE = 0o600
+MAX_REQUEST_SIZE = 64 * 1024
+LISTEN_BACKLOG = 128
+
+# Unix sockets are missing on Windows, where only serve_tcp is available.
+UNIX_SOCKETS_AVAILABLE = hasattr(socketserver, 'ThreadingUnixStreamServer')
+
+
+def _error_response(request_id, error: str, error_code: str = None) -> dict:
+    response = dict()
+    response['id'] = request_id
+    response['ok'] = False
+    response['error'] = error
+    response['error_code'] = error_code
+
+    return response
+
+
+class TokenBroker:
+    """
+    Serves the given generators to broker clients. Wrap the generators in token pools to hand out pre-solved tokens.
+
+    At most ``max_concurrent`` solves run at once and ``max_queued`` more wait for a slot. Requests beyond that are
+    answered straight away with ``ERROR_BROKER_BUSY`` rather than piling up, so clients can back off or fail over.
+    hCaptcha requests without a ``site_key`` use ``default_site_key``, and are rejected with ``ERROR_BAD_REQUEST``
+    when there is none.
+    """
+
+    def __init__(self, hcaptcha_generator: BaseHCaptchaGenerator = None,
+                 funcaptcha_generator: BaseFunCaptchaGenerator = None, max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 max_queued: int = DEFAULT_MAX_QUEUED, default_site_key: str = None):
+        self.hcaptcha_generator: Optional[BaseHCaptchaGenerator] = hcaptcha_generator
+        self.funcaptcha_generator: Optional[BaseFunCaptchaGenerator] = funcaptcha_generator
+        self.default_site_key: Optional[str] = default_site_key
+        self.max_concurrent: int = max_concurrent
+        self.max_queued: int = max_queued
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='captcha-broker')
+        self._lock = threading.Lock()
+        self._servers: List[socketserver.BaseServer] = list()
+        self._threads: List[threading.Thread] = list()
+        self._unix_paths: List[str] = list()
+        self._closed: bool = False
+
+        self._pending: int = 0
+        self._requests: int = 0
+        self._rejected: int = 0
+        self._failures: int = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict()
+            metrics['requests'] = self._requests
+            metrics['rejected'] = self._rejected
+            metrics['failures'] = self._failures
+            metrics['pending'] = self._pending
+
+        return metrics
+
+    def submit(self, request: dict) -> Future:
+        """
+        :return: Future resolved with the response to the request. Never resolved with an exception.
+        """
+        future = Future()
+        request_id = request.get('id')
+
+        if request.get('kind') == KIND_STATS:
+            future.set_result(dict(id=request_id, ok=True, result=self.metrics()))
+            return future
+
+        with self._lock:
+            self._requests += 1
+
+            if self._pending >= self.max_concurrent + self.max_queued:
+                self._rejected += 1
+                future.set_result(_error_response(request_id, 'Too many pending requests.', ERROR_BROKER_BUSY))
+                return future
+
+            self._pending += 1
+
+        future = self._executor.submit(self._handle, request)
+        future.add_done_callback(self._release)
+
+        return future
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def _handle(self, request: dict) -> dict:
+        request_id = request.get('id')
+        kind = request.get('kind')
+
+        try:
+            captcha_proxy = decode_proxy(request.get('proxy'))
+
+        except (KeyError, TypeError, ValueError) as e:
+            return _error_response(request_id, f'Invalid proxy: {e}', ERROR_BAD_REQUEST)
+
+        if kind == KIND_H_CAPTCHA:
+            site_key = request.get('site_key') or self.default_site_key
+
+            if not isinstance(site_key, str):
+                return _error_response(request_id, 'Missing or invalid "site_key".', ERROR_BAD_REQUEST)
+
+            generator = self.hcaptcha_generator
+            params = dict(site_key=site_key, captcha_proxy=captcha_proxy,
+                          invisible=bool(request.get('invisible', False)))
+
+        elif kind == KIND_FUN_CAPTCHA:
+            generator = self.funcaptcha_generator
+            params = dict(captcha_proxy=captcha_proxy)
+
+        else:
+            return _error_response(request_id, f'Unknown request kind "{kind}".', ERROR_BAD_REQUEST)
+
+        if generator is None:
+            return _error_response(request_id, f'No generator configured for "{kind}" requests.', ERROR_NO_GENERATOR)
+
+        try:
+            result = generator.generate(**params)
+
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+
+            logger.info(f'Broker request "{request_id}" failed. Reason: {e}')
+            return _error_response(request_id, str(e) or type(e).__name__, getattr(e, 'error_code', None))
+
+        response = dict()
+        response['id'] = request_id
+        response['ok'] = True
+        response['result'] = encode_result(kind, result)
+
+        return response
+
+    def _start(self, server: socketserver.BaseServer, name: str):
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, kwargs=dict(poll_interval=0.5), name=name, daemon=True)
+        thread.start()
+        self._servers.append(server)
+        self._threads.append(thread)
+
+    def serve_unix(self, path: str, mode: int = DEFAULT_SOCKET_MODE):
+        """
+        Starts serving newline delimited JSON on a Unix socket. A stale socket file left by a previous run is replaced.
+
+        :param mode: Permissions of the socket file. Only the owner may connect by default.
+        :raises NotImplementedError: If the platform has no Unix sockets
+        """
+        if not UNIX_SOCKETS_AVAILABLE:
+            raise (NotImplementedError('Unix sockets are not available on this platform, use serve_tcp instead.'))
+
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+
+        handler = type('BoundBrokerStreamHandler', (_StreamHandler,), dict(broker=self))
+        server = _UnixServer(path, handler)
+        os.chmod(path, mode)
+        self._unix_paths.append(path)
+        self._start(server, 'captcha-broker-unix')
+        logger.info(f'Broker listening on unix:{path}')
+
+    def serve_tcp(self, host: str = DEFAULT_HOST, port: int = 0) -> int:
+        """
+        Starts serving HTTP on a TCP port: POST requests to ``/solve``, GET ``/stats``. Keep ``host`` on a loopback
+        address, as the broker spends the provider balance of anyone who can reach it.
+
+        :return: The port listened on
+        """
+        handler = type('BoundBrokerHTTPHandler', (_HTTPHandler,), dict(broker=self))
+        server = _HTTPServer((host, port), handler)
+        self._start(server, 'captcha-broker-http')
+        port = server.server_address[1]
+        logger.info(f'Broker listening on http://{host}:{port}')
+
+        return port
+
+    def close(self):
+        self._closed = True
+
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+        for thread in self._threads:
+            thread.join()
+
+        for path in self._unix_paths:
+            try:
+                os.unlink(path)
+
+            except FileNotFoundError:
+                pass
+
+        self._servers.clear()
+        self._threads.clear()
+        self._unix_paths.clear()
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _parse_request(line: bytes) -> dict:
+    request = json.loads(line)
+
+    if not isinstance(request, dict):
+        raise (ValueError('Request is not a JSON object'))
+
+    return request
+
+
+# Short lived jobs connect in bursts, which would overflow the default backlog of 5 connections.
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+
+if UNIX_SOCKETS_AVAILABLE:
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        request_queue_size = LISTEN_BACKLOG
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    broker: TokenBroker = None
+
+    def handle(self):
+        write_lock = threading.Lock()
+        pending: List[Future] = list()
+
+        while True:
+            try:
+                line = self.rfile.readline(MAX_REQUEST_SIZE + 1)
+
+            # The client gave up on the connection, e.g. after timing out.
+            except ConnectionError:
+                break
+
+            # Connections opened before close() outlive the server. Closing them unanswered lets clients retry on the
+            # broker replacing this one.
+            if not line or self.broker.closed:
+                break
+
+            if not line.strip():
+                continue
+
+            if len(line) > MAX_REQUEST_SIZE:
+                self._respond(write_lock, _error_response(None, 'Request too large.', ERROR_BAD_REQUEST))
+                break
+
+            try:
+                request = _parse_request(line)
+
+            except ValueError as e:
+                self._respond(write_lock, _error_response(None, f'Invalid request: {e}', ERROR_BAD_REQUEST))
+                continue
+
+            future = self.broker.submit(request)
+            future.add_done_callback(lambda done: self._respond(write_lock, done.result()))
+            pending.append(future)
+            pending = [future for future in pending if not future.done()]
+
+        # Answers requests still running once the client stops sending, e.g. after shutting down its write side.
+        for future in pending:
+            future.result()
+
+    def _respond(self, write_lock: threading.Lock, response: dict):
+        data = json.dumps(response).encode() + b'\n'
+
+        with write_lock:
+            try:
+                self.wfile.write(data)
+
+            except (OSError, ValueError):
+                logger.debug(f'Could not answer broker request "{response.get("id")}", the client is gone.')
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    broker: TokenBroker = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.broker.metrics())
+        else:
+            self._send_json(404, _error_response(None, 'Not found.'))
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+
+        except ValueError:
+            length = -1
+
+        # A body that is not read would be taken for the next request, so the connection is closed instead.
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, _error_response(None, 'Missing or invalid Content-Length.', ERROR_BAD_REQUEST))
+            return
+
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self._send_json(413, _error_response(None, 'Request too large.', ERROR_BAD_REQUEST))
+            return
+
+        body = self.rfile.read(length)
+
+        if self.path != '/solve':
+            self._send_json(404, _error_response(None, 'Not found.'))
+            return
+
+        try:
+            request = _parse_request(body)
+
+        except ValueError as e:
+            self._send_json(400, _error_response(None, f'Invalid request: {e}', ERROR_BAD_REQUEST))
+            return
+
+        response = self.broker.submit(request).result()
+        self._send_json(503 if response.get('error_code') == ERROR_BROKER_BUSY else 200, response)
+
+
+def _build_generators(args: argparse.Namespace) -> tuple:
+    from .pool import FunCaptchaTokenPool, HCaptchaTokenPool
+
+    hcaptcha_generator = None
+    funcaptcha_generator = None
+
+    if args.provider == 'capsolver':
+        from .capsolver import CapSolverHCaptchaGenerator
+
+        hcaptcha_generator = CapSolverHCaptchaGenerator(args.api_key, args.website_url, pool_size=args.max_concurrent,
+                                                        **(dict(base_url=args.base_url) if args.base_url else dict()))
+    else:
+        from .twocaptcha import RequestHandler, TwoCapchaFunCaptchaGenerator, TwoCapchaHCaptchaGenerator
+
+        request_handler = RequestHandler(args.api_key, pool_size=args.max_concurrent,
+                                         **(dict(base_url=args.base_url) if args.base_url else dict()))
+        hcaptcha_generator = TwoCapchaHCaptchaGenerator(request_handler, args.website_url, args.site_key)
+
+        if args.public_key is not None:
+            funcaptcha_generator = TwoCapchaFunCaptchaGenerator(request_handler, args.website_url, args.public_key)
+
+    if args.pool_size > 0:
+        hcaptcha_generator = HCaptchaTokenPool(hcaptcha_generator, target_size=args.pool_size)
+
+        if funcaptcha_generator is not None:
+            funcaptcha_generator = FunCaptchaTokenPool(funcaptcha_generator, target_size=args.pool_size)
+
+    return hcaptcha_generator, funcaptcha_generator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--provider', choices=('capsolver', '2captcha'), required=True)
+    parser.add_argument('--api-key', default=os.environ.get('CAPTCHA_API_KEY'),
+                        help='provider API key, $CAPTCHA_API_KEY if omitted')
+    parser.add_argument('--website-url', required=True)
+    parser.add_argument('--site-key', default=None, help='hCaptcha site key of requests that give none')
+    parser.add_argument('--public-key', default=None, help='FunCaptcha public key, enables FunCaptcha (2Captcha)')
+    parser.add_argument('--base-url', default=None, help='provider API root')
+    parser.add_argument('--unix', default=None, help='Unix socket path to listen on')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=None, help='TCP port to listen on')
+    parser.add_argument('--pool-size', type=int, default=0, help='pre-solved tokens kept per key, 0 to disable')
+    parser.add_argument('--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT)
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED)
+    args = parser.parse_args()
+
+    if args.api_key is None:
+        parser.error('an API key is required')
+
+    if args.unix is None and args.port is None:
+        parser.error('at least one of --unix and --port is required')
+
+    if args.unix is not None and not UNIX_SOCKETS_AVAILABLE:
+        parser.error('--unix is not available on this platform, use --port')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    hcaptcha_generator, funcaptcha_generator = _build_generators(args)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    with TokenBroker(hcaptcha_generator, funcaptcha_generator, max_concurrent=args.max_concurrent,
+                     max_queued=args.max_queued, default_site_key=args.site_key) as broker:
+        if args.unix is not None:
+            broker.serve_unix(args.unix)
+
+        if args.port is not None:
+            broker.serve_tcp(args.host, args.port)
+
+        try:
+            stop.wait()
+
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+Client side of the token broker (see ``captcha.broker``), kept apart from the server so jobs reading tokens import as
+little as possible.
+"""
+from __future__ import annotations
+import itertools
+import json
+import socket
+import threading
+from functools import partial
+from typing import TYPE_CHECKING, List, Optional
+from .base import KIND_FUN_CAPTCHA, KIND_H_CAPTCHA, BaseFunCaptchaResult, BaseHCaptchaResult, proxy_protocol
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+DEFAULT_CLIENT_TIMEOUT = 300
+
+KIND_STATS = 'stats'
+
+ERROR_BROKER_BUSY = 'ERROR_BROKER_BUSY'
+ERROR_BAD_REQUEST = 'ERROR_BAD_REQUEST'
+ERROR_NO_GENERATOR = 'ERROR_NO_GENERATOR'
+
+
+class BrokerException(Exception):
+    def __init__(self, *args, error_code: str = None):
+        super().__init__(*args)
+        self.error_code: Optional[str] = error_code
+
+
+class BrokerRequestFailed(BrokerException):
+    pass
+
+
+class BrokerUnavailable(BrokerException):
+    pass
+
+
+class ProxySpec:
+    """
+    Proxy configuration received from a broker client. Has the attributes generators read from a ProxyConfig.
+    """
+
+    def __init__(self, hostname: str, port: int, protocol: str = None, username: str = None, password: str = None):
+        self.hostname: str = hostname
+        self.port: int = port
+        self.protocol: Optional[str] = protocol
+        self.username: Optional[str] = username
+        self.password: Optional[str] = password
+
+    def has_username(self) -> bool:
+        return self.username is not None
+
+    def has_password(self) -> bool:
+        return self.password is not None
+
+
+def encode_proxy(captcha_proxy: Optional[ProxyConfig]) -> Optional[dict]:
+    if captcha_proxy is None:
+        return None
+
+    new_dict = dict()
+    new_dict['protocol'] = proxy_protocol(captcha_proxy)
+    new_dict['hostname'] = captcha_proxy.hostname
+    new_dict['port'] = captcha_proxy.port
+
+    if captcha_proxy.has_username():
+        new_dict['username'] = captcha_proxy.username
+
+    if captcha_proxy.has_password():
+        new_dict['password'] = captcha_proxy.password
+
+    return new_dict
+
+
+def decode_proxy(data: Optional[dict]) -> Optional[ProxySpec]:
+    if data is None:
+        return None
+
+    return ProxySpec(data['hostname'], int(data['port']), protocol=data.get('protocol'),
+                     username=data.get('username'), password=data.get('password'))
+
+
+def encode_result(kind: str, result) -> dict:
+    new_dict = dict()
+
+    if kind == KIND_H_CAPTCHA:
+        new_dict['response_key'] = result.response_key
+        new_dict['request_key'] = result.request_key
+        new_dict['user_agent'] = result.user_agent
+    else:
+        new_dict['token'] = result.token
+
+    return new_dict
+
+
+def decode_result(kind: str, data: dict):
+    if kind == KIND_H_CAPTCHA:
+        return BaseHCaptchaResult(data['response_key'], data.get('request_key'), data.get('user_agent'))
+
+    return BaseFunCaptchaResult(data['token'])
+
+
+class BrokerClient:
+    """
+    Client of a TokenBroker, safe to share between threads. ``address`` is the path of the broker's Unix socket
+    (optionally prefixed with ``unix:``) or its ``http://host:port`` url. Each thread keeps its own connection to a
+    Unix socket.
+    """
+
+    def __init__(self, address: str, timeout: float = DEFAULT_CLIENT_TIMEOUT):
+        """
+        :param timeout: Seconds to wait for a response, which includes the time the broker takes to solve
+        """
+        self.address: str = address
+        self.timeout: float = timeout
+        self._http_url: Optional[str] = address.rstrip('/') if address.startswith('http://') else None
+        self._unix_path: Optional[str] = None if self._http_url is not None else \
+            address[len('unix:'):] if address.startswith('unix:') else address
+
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._connections: List[socket.socket] = list()
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, list()
+
+        for connection in connections:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+
+        try:
+            connection.connect(self._unix_path)
+
+        except OSError:
+            connection.close()
+            raise
+
+        with self._lock:
+            self._connections.append(connection)
+
+        self._local.connection = connection
+        self._local.reader = connection.makefile('rb')
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+
+        if connection is not None:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+
+            connection.close()
+
+    def _unix_request(self, data: bytes) -> dict:
+        # A kept-alive connection may have been closed by a broker restart, in which case the request is sent again on
+        # a new connection. Only when the broker closed it before answering though: after a timeout the broker may
+        # still be solving the request, and sending it again would solve and pay for it twice.
+        for attempt in range(2):
+            reused = getattr(self._local, 'connection', None) is not None
+
+            try:
+                if not reused:
+                    self._connect()
+
+                self._local.connection.sendall(data + b'\n')
+                line = self._local.reader.readline()
+
+            except OSError as e:
+                self._drop_connection()
+
+                if not reused or attempt or not isinstance(e, (BrokenPipeError, ConnectionResetError)):
+                    raise (BrokerUnavailable(f'Broker at {self.address} is unavailable. Reason: {e}'))
+
+                continue
+
+            if not line.endswith(b'\n'):
+                self._drop_connection()
+
+                if line or not reused or attempt:
+                    raise (BrokerUnavailable(f'Broker at {self.address} closed the connection before answering.'))
+
+                continue
+
+            return json.loads(line)
+
+    def _http_request(self, data: bytes) -> dict:
+        # Imported here so jobs only talking to a Unix socket do not pay for urllib.
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(self._http_url + '/solve', data=data, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+
+        except urllib.error.HTTPError as e:
+            # Busy and bad requests still carry a JSON body, errors of a proxy in front of the broker may not.
+            try:
+                response = json.loads(e.read())
+
+            except ValueError:
+                response = None
+
+            if isinstance(response, dict):
+                return response
+
+            if e.code >= 500:
+                raise (BrokerUnavailable(f'Broker at {self.address} is unavailable. Reason: HTTP {e.code}'))
+
+            raise (BrokerRequestFailed(f'Broker request failed. Reason: HTTP {e.code}'))
+
+        except OSError as e:
+            raise (BrokerUnavailable(f'Broker at {self.address} is unavailable. Reason: {e}'))
+
+    def request(self, request: dict) -> dict:
+        """
+        Sends a request and waits for its response.
+
+        :return: The result of the request
+        :except BrokerRequestFailed: Raised if the broker could not serve the request
+        :except BrokerUnavailable: Raised if the broker cannot be reached
+        """
+        request = dict(request, id=next(self._ids))
+        data = json.dumps(request).encode()
+        response = self._http_request(data) if self._http_url is not None else self._unix_request(data)
+
+        if not response.get('ok'):
+            raise (BrokerRequestFailed(f'Broker request failed. Reason: {response.get("error")}',
+                                       error_code=response.get('error_code')))
+
+        return response['result']
+
+    def stats(self) -> dict:
+        return self.request(dict(kind=KIND_STATS))
+
+
+class BrokerHCaptchaGenerator:
+    """
+    Generator implementing BaseHCaptchaGenerator by asking a TokenBroker for tokens.
+    """
+
+    def __init__(self, client: BrokerClient):
+        self.client: BrokerClient = client
+
+    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+        request = dict()
+        request['kind'] = KIND_H_CAPTCHA
+        request['site_key'] = site_key
+        request['invisible'] = invisible
+        request['proxy'] = encode_proxy(captcha_proxy)
+
+        return decode_result(KIND_H_CAPTCHA, self.client.request(request))
+
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None,
+                        invisible: bool = False) -> BaseHCaptchaResult:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, partial(self.generate, site_key, captcha_proxy, invisible))
+
+
+class BrokerFunCaptchaGenerator:
+    """
+    Generator implementing BaseFunCaptchaGenerator by asking a TokenBroker for tokens.
+    """
+
+    def __init__(self, client: BrokerClient):
+        self.client: BrokerClient = client
+
+    def generate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        request = dict()
+        request['kind'] = KIND_FUN_CAPTCHA
+        request['proxy'] = encode_proxy(captcha_proxy)
+
+        return decode_result(KIND_FUN_CAPTCHA, self.client.request(request))
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, self.generate, captcha_proxy)
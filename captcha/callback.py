@@ -0,0 +1,242 @@
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PATH_PREFIX = '/captcha-callback/'
+DEFAULT_FALLBACK_INTERVAL = 30
+DEFAULT_UNMATCHED_TTL = 60
+DEFAULT_MAX_UNMATCHED = 1000
+DEFAULT_TASK_ID_KEYS = ('taskId', 'id')
+MAX_PAYLOAD_SIZE = 64 * 1024
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    receiver: 'CallbackReceiver' = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+
+        self.end_headers()
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+
+        except ValueError:
+            length = -1
+
+        # A body that is not read would be taken for the next request, so the connection is closed instead.
+        if length < 0 or length > MAX_PAYLOAD_SIZE:
+            self.receiver.rejected += 1
+            self.close_connection = True
+            self._reply(400 if length < 0 else 413)
+            return
+
+        body = self.rfile.read(length).decode(errors='replace')
+
+        if self.path.split('?', 1)[0] != self.receiver.path:
+            self.receiver.rejected += 1
+            self._reply(404)
+            return
+
+        try:
+            payload = json.loads(body) if body.lstrip().startswith('{') else dict(parse_qsl(body))
+
+        except ValueError:
+            self.receiver.rejected += 1
+            self._reply(400)
+            return
+
+        self.receiver.deliver(payload)
+        self._reply(200)
+
+
+class CallbackReceiver:
+    """
+    Embedded HTTP server receiving the results providers push to a callback url (2Captcha pingbacks), so solves wait
+    for their result instead of polling getTaskResult.
+
+    Give it to a generator and every task it creates carries the receiver's ``callback_url``. The solve then blocks on
+    the matching callback and only checks the result itself every ``fallback_interval`` seconds, as a safety net for
+    lost callbacks. A callback carrying the solution completes the solve without any getTaskResult call; one carrying
+    only the task id triggers a single check. Callbacks arriving before their task id is known are kept for
+    ``unmatched_ttl`` seconds.
+
+    The url path ends with a random secret, so only the provider knows where to post. The provider must be able to
+    reach ``public_url``: behind NAT or a reverse proxy, bind locally and give the externally visible url. To feed
+    callbacks received by an existing web server instead, create the receiver with ``start=False`` and call
+    ``deliver`` with each payload.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = 0, public_url: str = None, path: str = None,
+                 fallback_interval: float = DEFAULT_FALLBACK_INTERVAL, unmatched_ttl: float = DEFAULT_UNMATCHED_TTL,
+                 max_unmatched: int = DEFAULT_MAX_UNMATCHED, task_id_keys: Sequence[str] = DEFAULT_TASK_ID_KEYS,
+                 start: bool = True):
+        """
+        :param host: Interface to listen on
+        :param port: Port to listen on, any free port if 0
+        :param public_url: Url root the provider posts to. Defaults to the address the receiver listens on.
+        :param path: Url path of callbacks. Defaults to a random path, so callbacks cannot be forged.
+        :param fallback_interval: Seconds between result checks of a task while waiting for its callback
+        :param unmatched_ttl: Seconds a callback for an unknown task id is kept
+        :param max_unmatched: Maximum number of callbacks kept for unknown task ids
+        :param task_id_keys: Payload keys holding the task id, tried in order
+        :param start: Start listening now
+        """
+        self.host: str = host
+        self.port: int = port
+        self.path: str = path if path is not None else DEFAULT_PATH_PREFIX + secrets.token_urlsafe(16)
+        self.fallback_interval: float = fallback_interval
+        self.unmatched_ttl: float = unmatched_ttl
+        self.max_unmatched: int = max_unmatched
+        self.task_id_keys: Sequence[str] = tuple(task_id_keys)
+        self._public_url: Optional[str] = public_url.rstrip('/') if public_url is not None else None
+
+        self.received: int = 0
+        self.matched: int = 0
+        self.rejected: int = 0
+
+        self._waiters: Dict[str, Future] = dict()
+        self._unmatched: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        if start:
+            self.start()
+
+    @property
+    def callback_url(self) -> str:
+        if self._public_url is None:
+            return f'http://{self.host}:{self.port}{self.path}'
+
+        return self._public_url + self.path
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def start(self):
+        if self._server is not None:
+            return
+
+        handler = type('BoundCallbackHandler', (_CallbackHandler,), dict(receiver=self))
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs=dict(poll_interval=0.5),
+                                        name='captcha-callback', daemon=True)
+        self._thread.start()
+        logger.debug(f'Listening for callbacks on port {self.port}.')
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+
+        with self._lock:
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+
+        for waiter in waiters:
+            waiter.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def expect(self, task_id) -> Future:
+        """
+        :return: Future resolved with the payload of the first callback for the task
+        """
+        key = str(task_id)
+        future = Future()
+
+        with self._lock:
+            unmatched = self._unmatched.pop(key, None)
+
+            if unmatched is None:
+                self._waiters[key] = future
+
+        if unmatched is not None:
+            future.set_result(unmatched[1])
+
+        return future
+
+    def discard(self, task_id):
+        """
+        Stops waiting for the callback of a task, cancelling its future.
+        """
+        with self._lock:
+            future = self._waiters.pop(str(task_id), None)
+
+        if future is not None:
+            future.cancel()
+
+    def deliver(self, payload: dict) -> bool:
+        """
+        Hands a callback payload to the solve waiting for it.
+
+        :return: True if a solve was waiting for the task
+        """
+        task_id = next((payload[key] for key in self.task_id_keys if payload.get(key) is not None), None)
+
+        if task_id is None:
+            self.rejected += 1
+            logger.debug(f'Ignoring a callback without task id: {payload}')
+            return False
+
+        key = str(task_id)
+        now = time.monotonic()
+
+        with self._lock:
+            self.received += 1
+            future = self._waiters.pop(key, None)
+
+            if future is None:
+                self._unmatched[key] = (now, payload)
+
+                while self._unmatched and (len(self._unmatched) > self.max_unmatched
+                                           or now - next(iter(self._unmatched.values()))[0] >= self.unmatched_ttl):
+                    self._unmatched.popitem(last=False)
+
+                return False
+
+            self.matched += 1
+
+        # The solve may have given up on the task meanwhile.
+        if future.set_running_or_notify_cancel():
+            future.set_result(payload)
+
+        return True
+
+    def metrics(self) -> dict:
+        metrics = dict()
+        metrics['received'] = self.received
+        metrics['matched'] = self.matched
+        metrics['rejected'] = self.rejected
+        metrics['pending'] = self.pending
+
+        return metrics
@@ -1,16 +1,36 @@
-import requests
-import time
+from __future__ import annotations
+import concurrent.futures
+import logging
 from . import capsolverconstants as const
-from .base import BaseHCaptchaResult
-from proxy import ProxyConfig
+from .balance import BalanceMonitor, SolveBudget
+from .base import BaseHCaptchaResult, intern_user_agent, proxy_key
+from .engine import (DEFAULT_ACCEPTED_STATUS_CODES, TASK_STATE_PROCESSING, TASK_STATE_READY, ProviderAdapter,
+                     ProviderClient, SolvingEngine, TaskFragmentCache)
+from .handle import CancelToken, SolveHandle, submit_solve
+from .instrumentation import SolveListener
+from .journal import TaskJournal
+from .poller import TaskPoller
+from .polling import PollingStrategy
+from .ratelimit import ProviderLimiter
+from .retry import RetryPolicy
+from .transport import DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT
 from abc import ABC, abstractmethod
-from typing import Optional, TypeVar
+from functools import partial
+from typing import TYPE_CHECKING, Iterable, Mapping, Optional, TypeVar
+
+if TYPE_CHECKING:
+    import requests
+    from proxy import ProxyConfig
+
+logger = logging.getLogger(__name__)
 
 CapSolverResultT = TypeVar('CapSolverResultT', bound='CapSolverResul')
 
 
 class CapSolverException(Exception):
-    pass
+    def __init__(self, *args, error_code: str = None):
+        super().__init__(*args)
+        self.error_code: Optional[str] = error_code
 
 
 class CapSolverRequestProcessing(CapSolverException):
@@ -21,131 +41,177 @@ class CapSolverRequestFailed(CapSolverException):
     pass
 
 
-def generate_request_proxy_dict(proxy_config: ProxyConfig) -> dict:
-    new_dict = dict()
-    # TODO: Improve this to include other protocols
-    new_dict[const.CAP_SOLVER_TASK_KEY_PROXY_TYPE] = 'http'
-
-    new_dict[const.CAP_SOLVER_TASK_KEY_PROXY_ADDRESS] = proxy_config.hostname
-    new_dict[const.CAP_SOLVER_TASK_KEY_PROXY_PORT] = proxy_config.port
-
-    if proxy_config.has_username():
-        new_dict[const.CAP_SOLVER_TASK_KEY_PROXY_USERNAME] = proxy_config.username
+CAP_SOLVER_ADAPTER = ProviderAdapter(
+    name=const.CAP_SOLVER_PROVIDER_NAME,
+    base_url=const.CAP_SOLVER_URL_BASE,
+    create_task_path=const.CAP_SOLVER_PATH_CREATE_TASK,
+    check_result_path=const.CAP_SOLVER_PATH_CHECK_RESULT,
+    balance_path=const.CAP_SOLVER_PATH_GET_BALANCE,
+    failed_exception=CapSolverRequestFailed,
+    processing_exception=CapSolverRequestProcessing,
+    request_key_api_token=const.CAP_SOLVER_REQUEST_KEY_API_TOKEN,
+    request_key_task=const.CAP_SOLVER_REQUEST_KEY_TASK,
+    request_key_task_id=const.CAP_SOLVER_REQUEST_KEY_TASK_ID,
+    response_key_error_id=const.CAP_SOLVER_RESPONSE_KEY_ERROR_ID,
+    response_key_error_code=const.CAP_SOLVER_RESPONSE_KEY_ERROR_CODE,
+    response_key_task_id=const.CAP_SOLVER_RESPONSE_KEY_TASK_ID,
+    response_key_status=const.CAP_SOLVER_RESPONSE_KEY_STATUS,
+    response_key_solution=const.CAP_SOLVER_RESPONSE_KEY_SOLUTION,
+    response_key_balance=const.CAP_SOLVER_RESPONSE_KEY_BALANCE,
+    statuses={
+        const.CAP_SOLVER_RESPONSE_STATUS_IDLE: TASK_STATE_PROCESSING,
+        const.CAP_SOLVER_RESPONSE_STATUS_PROCESSING: TASK_STATE_PROCESSING,
+        const.CAP_SOLVER_RESPONSE_STATUS_READY: TASK_STATE_READY,
+    },
+    task_key_captcha_type=const.CAP_SOLVER_TASK_KEY_CAPTCHA_TYPE,
+    task_key_website_url=const.CAP_SOLVER_TASK_KEY_WEBSITE_URL,
+    task_key_proxy_type=const.CAP_SOLVER_TASK_KEY_PROXY_TYPE,
+    task_key_proxy_address=const.CAP_SOLVER_TASK_KEY_PROXY_ADDRESS,
+    task_key_proxy_port=const.CAP_SOLVER_TASK_KEY_PROXY_PORT,
+    task_key_proxy_username=const.CAP_SOLVER_TASK_KEY_PROXY_USERNAME,
+    task_key_proxy_password=const.CAP_SOLVER_TASK_KEY_PROXY_PASSWORD,
+    fatal_error_codes=const.CAP_SOLVER_FATAL_ERROR_CODES,
+    zero_balance_error_codes=const.CAP_SOLVER_ZERO_BALANCE_ERROR_CODES,
+    proxy_types=const.CAP_SOLVER_PROXY_TYPES,
+    proxy_error_codes=const.CAP_SOLVER_PROXY_ERROR_CODES,
+    # CapSolver reports task errors with a 400 status and a regular error body.
+    accepted_status_codes=DEFAULT_ACCEPTED_STATUS_CODES | {400},
+    poll_interval=2,
+)
 
-    if proxy_config.has_password():
-        new_dict[const.CAP_SOLVER_TASK_KEY_PROXY_PASSWORD] = proxy_config.password
 
-    return new_dict
+def generate_request_proxy_dict(proxy_config: ProxyConfig) -> dict:
+    return CAP_SOLVER_ADAPTER.proxy_fields(proxy_config)
 
 
 class CapSolverResult:
-    def __init__(self, raw_solution: dict):
-        self.raw_solution = raw_solution
+    __slots__ = ()
+
+    @property
+    def raw_solution(self) -> Optional[dict]:
+        """
+        The solution as returned by CapSolver, or None if the generator was created with keep_raw_solution=False.
+        """
+        return self._raw_solution
 
 
 class CapSolverGenerator(ABC):
-    def __init__(self, api_key: str, website_url: str, max_auto_retry: int = 0):
+    """
+    Generators are safe to share between threads and coroutines. They hold no per-call state: every call builds its own
+    task dict and solve context, and everything shared (the client and its connection pool, the fragment cache, the
+    engine and its poller, polling strategy, journal and limiters) is thread safe.
+    """
+
+    def __init__(self, api_key: str, website_url: str, max_auto_retry: int = 0, session: requests.Session = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, async_session=None, poller: TaskPoller = None,
+                 polling_strategy: PollingStrategy = None, retry_policy: RetryPolicy = None,
+                 rate_limiter: ProviderLimiter = None, listeners: Iterable[SolveListener] = None,
+                 base_url: str = const.CAP_SOLVER_URL_BASE, journal: TaskJournal = None,
+                 keep_raw_solution: bool = True, balance_monitor: BalanceMonitor = None,
+                 task_costs: Mapping[str, float] = None, request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT):
+        """
+        :param max_auto_retry: Number of times a failed task is recreated. Ignored if retry_policy is given.
+        :param rate_limiter: Limits to apply. Defaults to the limiter shared by all CapSolver generators using the same
+            API key.
+        :param listeners: Listeners notified of every solve phase and HTTP response
+        :param base_url: API root, e.g. to point the generator at a local stub server
+        :param journal: Journal of created tasks, used to resume tasks left pending by a previous run
+        :param keep_raw_solution: Keep the provider solution on results. Disable to shrink results held in pools.
+        :param balance_monitor: Balance of the account. Solves are rejected without a request once it runs low.
+        :param task_costs: Price of a task by task type, needed to enforce the max_cost of a SolveBudget
+        :param request_timeout: Seconds to wait for each HTTP response, None to wait forever
+        """
         self.api_key: str = api_key
         self.website_url: str = website_url
         self.max_auto_retry: int = max_auto_retry
+        self.keep_raw_solution: bool = keep_raw_solution
+        self.task_fragments: TaskFragmentCache = TaskFragmentCache()
+        self.client: ProviderClient = ProviderClient(CAP_SOLVER_ADAPTER, api_key, session=session, pool_size=pool_size,
+                                                     async_session=async_session, rate_limiter=rate_limiter,
+                                                     listeners=listeners, base_url=base_url,
+                                                     request_timeout=request_timeout)
+        self.engine: SolvingEngine = SolvingEngine(
+            self.client, poller=poller, polling_strategy=polling_strategy,
+            retry_policy=retry_policy if retry_policy is not None else RetryPolicy(max_attempts=max_auto_retry + 1),
+            journal=journal, balance_monitor=balance_monitor, task_costs=task_costs)
 
-    def _create_task(self, task_body: dict) -> str:
-        if const.CAP_SOLVER_TASK_KEY_WEBSITE_URL not in task_body:
-            task_body[const.CAP_SOLVER_TASK_KEY_WEBSITE_URL] = self.website_url
-
-        request_data = dict()
-        request_data[const.CAP_SOLVER_REQUEST_KEY_API_TOKEN] = self.api_key
-        request_data[const.CAP_SOLVER_REQUEST_KEY_TASK] = task_body
-
-        response = requests.post(const.CAP_SOLVER_URL_CREATE_TASK, json=request_data)
+    def close(self):
+        self.client.close()
 
-        if (response.status_code < 200 or response.status_code > 299) and response.status_code != 400:
-            raise (CapSolverRequestFailed(
-                f'Create task request did not return 2XX code. Status code: {response.status_code}'))
+    async def aclose(self):
+        await self.client.aclose()
 
-        response_json: dict = response.json()
-        # print(json.dumps(response.json(), sort_keys=True, indent=4))
-        response_id = response_json[const.CAP_SOLVER_RESPONSE_KEY_ERROR_ID]
+    def __enter__(self):
+        return self
 
-        if response_id != 0:
-            error_code = response_json[const.CAP_SOLVER_RESPONSE_KEY_ERROR_CODE]
-            raise (CapSolverRequestFailed(f'Task create did not return error id of 0. Error code: {error_code}'))
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
-        return response_json[const.CAP_SOLVER_REQUEST_KEY_TASK_ID]
+    async def __aenter__(self):
+        return self
 
-    def _get_result(self, task_id: str) -> dict:
-        request_data = dict()
-        request_data[const.CAP_SOLVER_REQUEST_KEY_API_TOKEN] = self.api_key
-        request_data[const.CAP_SOLVER_REQUEST_KEY_TASK_ID] = task_id
-
-        response = requests.post(const.CAP_SOLVER_URL_CHECK_RESULT, json=request_data)
-
-        if (response.status_code < 200 or response.status_code > 299) and response.status_code != 400:
-            raise (CapSolverRequestFailed(
-                f'Create task request did not return 2XX code. Status code: {response.status_code}'))
-
-        response_json: dict = response.json()
-        # print(json.dumps(response.json(), sort_keys=True, indent=4))
-        response_id = response_json[const.CAP_SOLVER_RESPONSE_KEY_ERROR_ID]
-
-        if response_id != 0:
-            error_code = response_json[const.CAP_SOLVER_RESPONSE_KEY_ERROR_CODE]
-            raise (CapSolverRequestFailed(f'Task did not return error id of 0. Error code: {error_code}'))
-
-        if response_json.get(const.CAP_SOLVER_RESPONSE_KEY_STATUS) != const.CAP_SOLVER_RESPONSE_STATUS_READY:
-            raise (CapSolverRequestProcessing(f'Request still processing. Task id: {task_id}'))
-
-        return response_json.get(const.CAP_SOLVER_RESPONSE_KEY_SOLUTION)
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
 
     @abstractmethod
     def _process_solution(self, raw_solution: dict) -> CapSolverResult:
         pass
 
-    def _get_solution(self, task_body: dict) -> CapSolverResultT:
-        # TODO: Better retry handling
-        solution: Optional[dict] = None
+    def _prepare_task(self, task_body: dict) -> dict:
+        task_body.setdefault(const.CAP_SOLVER_TASK_KEY_WEBSITE_URL, self.website_url)
 
-        while solution is None:
-            task_id = self._create_task(task_body)
-            print(f'Task created. Id: {task_id}')
+        return task_body
 
-            while True:
-                try:
-                    solution = self._get_result(task_id)
-                    break
+    def _get_solution(self, task_body: dict, cancel_token: CancelToken = None,
+                      budget: SolveBudget = None) -> CapSolverResultT:
+        return self.engine.solve(self._prepare_task(task_body), self._process_solution, cancel_token, budget)
 
-                except CapSolverRequestProcessing:
-                    print(f'Request "{task_id}" is still being processed. Will retry in 3 seconds.')
-                    time.sleep(2)
-                    continue
+    async def _aget_solution(self, task_body: dict, budget: SolveBudget = None) -> CapSolverResultT:
+        return await self.engine.asolve(self._prepare_task(task_body), self._process_solution, budget)
 
-                except CapSolverRequestFailed as e:
-                    print(f'Request for task "{task_id} failed. Reason: {e}')
-                    break
 
-            # TODO: Implement auto retry
+class CapSolverHCaptchaResult(BaseHCaptchaResult, CapSolverResult):
+    __slots__ = ('_raw_solution',)
 
-        return self._process_solution(solution)
+    def __init__(self, raw_solution: dict, keep_raw_solution: bool = True):
+        self._response_key: str = raw_solution[const.CAP_SOLVER_RESPONSE_H_CAPTCHA_RESPONSE_KEY]
+        self._raw_solution: Optional[dict] = raw_solution if keep_raw_solution else None
 
+        # Without the raw solution the remaining fields cannot be parsed on access, so they are extracted now.
+        if not keep_raw_solution:
+            self._request_key: Optional[str] = raw_solution.get(const.CAP_SOLVER_RESPONSE_H_CAPTCHA_REQUEST_KEY)
+            self._user_agent: Optional[str] = \
+                intern_user_agent(raw_solution.get(const.CAP_SOLVER_RESPONSE_H_CAPTCHA_USER_AGENT))
 
-class CapSolverHCaptchaResult(BaseHCaptchaResult, CapSolverResult):
-    def __init__(self, raw_solution: dict):
-        response_key: str = raw_solution[const.CAP_SOLVER_RESPONSE_H_CAPTCHA_RESPONSE_KEY]
-        request_key: str = raw_solution[const.CAP_SOLVER_RESPONSE_H_CAPTCHA_REQUEST_KEY]
-        user_agent: str = raw_solution[const.CAP_SOLVER_RESPONSE_H_CAPTCHA_USER_AGENT]
+    def _parse_request_key(self) -> Optional[str]:
+        return self._raw_solution.get(const.CAP_SOLVER_RESPONSE_H_CAPTCHA_REQUEST_KEY)
 
-        BaseHCaptchaResult.__init__(self, response_key, request_key, user_agent)
-        CapSolverResult.__init__(self, raw_solution)
+    def _parse_user_agent(self) -> Optional[str]:
+        return self._raw_solution.get(const.CAP_SOLVER_RESPONSE_H_CAPTCHA_USER_AGENT)
 
 
 class CapSolverHCaptchaGenerator(CapSolverGenerator):
-    def __init__(self, api_key: str, website_url: str, max_auto_retry: int = 0):
-        super().__init__(api_key, website_url, max_auto_retry=max_auto_retry)
+    def __init__(self, api_key: str, website_url: str, max_auto_retry: int = 0, session: requests.Session = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, async_session=None, poller: TaskPoller = None,
+                 polling_strategy: PollingStrategy = None, retry_policy: RetryPolicy = None,
+                 rate_limiter: ProviderLimiter = None, listeners: Iterable[SolveListener] = None,
+                 base_url: str = const.CAP_SOLVER_URL_BASE, journal: TaskJournal = None,
+                 keep_raw_solution: bool = True, balance_monitor: BalanceMonitor = None,
+                 task_costs: Mapping[str, float] = None, request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT):
+        super().__init__(api_key, website_url, max_auto_retry=max_auto_retry, session=session, pool_size=pool_size,
+                         async_session=async_session, poller=poller, polling_strategy=polling_strategy,
+                         retry_policy=retry_policy, rate_limiter=rate_limiter, listeners=listeners,
+                         base_url=base_url, journal=journal, keep_raw_solution=keep_raw_solution,
+                         balance_monitor=balance_monitor, task_costs=task_costs, request_timeout=request_timeout)
     
     def _process_solution(self, raw_solution: dict) -> CapSolverResult:
-        return CapSolverHCaptchaResult(raw_solution)
+        return CapSolverHCaptchaResult(raw_solution, self.keep_raw_solution)
 
-    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+    def _generate_task_body(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> dict:
+        return self.task_fragments.get((site_key, proxy_key(captcha_proxy), invisible),
+                                       partial(self._build_task_body, site_key, captcha_proxy, invisible))
+
+    def _build_task_body(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> dict:
         captcha_type = const.CAP_SOLVER_TASK_TYPE_H_CAPTCHA
         task_body = dict()
 
@@ -159,5 +225,28 @@ class CapSolverHCaptchaGenerator(CapSolverGenerator):
             task_body[const.CAP_SOLVER_TASK_H_CAPTCHA_INVISIBLE] = True
 
         task_body[const.CAP_SOLVER_TASK_KEY_CAPTCHA_TYPE] = captcha_type
-
-        return self._get_solution(task_body)
+        task_body[const.CAP_SOLVER_TASK_KEY_WEBSITE_URL] = self.website_url
+
+        return task_body
+
+    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False,
+                 budget: SolveBudget = None) -> BaseHCaptchaResult:
+        """
+        :param budget: Maximum cost and latency of this solve
+        """
+        return self._get_solution(self._generate_task_body(site_key, captcha_proxy, invisible), budget=budget)
+
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False,
+                        budget: SolveBudget = None) -> BaseHCaptchaResult:
+        return await self._aget_solution(self._generate_task_body(site_key, captcha_proxy, invisible), budget)
+
+    def submit(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False,
+               executor: concurrent.futures.Executor = None, budget: SolveBudget = None) -> SolveHandle:
+        """
+        Starts solving in the background and returns immediately. The token is collected with ``result()`` on the
+        returned handle.
+
+        :param executor: Executor to run the solve on. Defaults to an executor shared by all generators.
+        """
+        return submit_solve(partial(self._get_solution, self._generate_task_body(site_key, captcha_proxy, invisible),
+                                    budget=budget), executor)
@@ -1,6 +1,15 @@
+# Provider
+CAP_SOLVER_PROVIDER_NAME = 'capsolver'
+
 # URLS
-CAP_SOLVER_URL_CREATE_TASK = 'https://api.capsolver.com/createTask'
-CAP_SOLVER_URL_CHECK_RESULT = 'https://api.capsolver.com/getTaskResult'
+CAP_SOLVER_URL_BASE = 'https://api.capsolver.com'
+CAP_SOLVER_PATH_CREATE_TASK = '/createTask'
+CAP_SOLVER_PATH_CHECK_RESULT = '/getTaskResult'
+CAP_SOLVER_PATH_GET_BALANCE = '/getBalance'
+
+CAP_SOLVER_URL_CREATE_TASK = CAP_SOLVER_URL_BASE + CAP_SOLVER_PATH_CREATE_TASK
+CAP_SOLVER_URL_CHECK_RESULT = CAP_SOLVER_URL_BASE + CAP_SOLVER_PATH_CHECK_RESULT
+CAP_SOLVER_URL_GET_BALANCE = CAP_SOLVER_URL_BASE + CAP_SOLVER_PATH_GET_BALANCE
 
 # Generic request keys
 CAP_SOLVER_REQUEST_KEY_API_TOKEN = 'clientKey'
@@ -13,6 +22,7 @@ CAP_SOLVER_RESPONSE_KEY_ERROR_CODE = 'errorCode'
 CAP_SOLVER_RESPONSE_KEY_TASK_ID = 'taskId'
 CAP_SOLVER_RESPONSE_KEY_STATUS = 'status'
 CAP_SOLVER_RESPONSE_KEY_SOLUTION = 'solution'
+CAP_SOLVER_RESPONSE_KEY_BALANCE = 'balance'
 
 CAP_SOLVER_RESPONSE_STATUS_IDLE = 'idle'
 CAP_SOLVER_RESPONSE_STATUS_PROCESSING = 'processing'
@@ -25,6 +35,14 @@ CAP_SOLVER_TASK_KEY_PROXY_PORT = 'proxyPort'
 CAP_SOLVER_TASK_KEY_PROXY_USERNAME = 'proxyLogin'
 CAP_SOLVER_TASK_KEY_PROXY_PASSWORD = 'proxyPassword'
 
+# Proxy types by proxy protocol
+CAP_SOLVER_PROXY_TYPES = {
+    'http': 'http',
+    'https': 'https',
+    'socks4': 'socks4',
+    'socks5': 'socks5',
+}
+
 # Generic task keys
 CAP_SOLVER_TASK_KEY_CAPTCHA_TYPE = 'type'
 CAP_SOLVER_TASK_KEY_WEBSITE_URL = 'websiteURL'
@@ -38,4 +56,31 @@ CAP_SOLVER_TASK_H_CAPTCHA_INVISIBLE = 'isInvisible'
 
 CAP_SOLVER_RESPONSE_H_CAPTCHA_RESPONSE_KEY = 'gRecaptchaResponse'
 CAP_SOLVER_RESPONSE_H_CAPTCHA_REQUEST_KEY = 'captchaKey'
-CAP_SOLVER_RESPONSE_H_CAPTCHA_USER_AGENT = 'userAgent'
\ No newline at end of file
+CAP_SOLVER_RESPONSE_H_CAPTCHA_USER_AGENT = 'userAgent'
+
+# Error codes that will fail again if the task is recreated
+CAP_SOLVER_FATAL_ERROR_CODES = frozenset((
+    'ERROR_KEY_DENIED_ACCESS',
+    'ERROR_KEY_TEMP_BLOCKED',
+    'ERROR_ZERO_BALANCE',
+    'ERROR_SETTLEMENT_FAILED',
+    'ERROR_IP_BANNED',
+    'ERROR_INVALID_TASK_DATA',
+    'ERROR_BAD_REQUEST',
+    'ERROR_TASK_NOT_SUPPORTED',
+))
+
+# Error codes meaning the account has run out of funds
+CAP_SOLVER_ZERO_BALANCE_ERROR_CODES = frozenset((
+    'ERROR_ZERO_BALANCE',
+))
+
+# Error codes blaming the proxy a task was sent through
+CAP_SOLVER_PROXY_ERROR_CODES = frozenset((
+    'ERROR_PROXY_BANNED',
+    'ERROR_PROXY_CONNECT_REFUSED',
+    'ERROR_PROXY_CONNECT_TIMEOUT',
+    'ERROR_PROXY_READ_TIMEOUT',
+    'ERROR_PROXY_TRANSPARENT',
+    'ERROR_PROXY_NOT_AUTHORISED',
+))
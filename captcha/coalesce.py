@@ -0,0 +1,348 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from .base import (BaseFunCaptchaGenerator, BaseFunCaptchaResult, BaseHCaptchaGenerator, BaseHCaptchaResult,
+                   proxy_key)
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BURST = None
+DEFAULT_TOKEN_TTL = 100
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_NEGATIVE_TTL = 30
+DEFAULT_MAX_WORKERS = 64
+DEFAULT_SWEEP_INTERVAL = 5
+
+
+def generator_provider(generator) -> str:
+    """
+    Name of the provider behind a generator, or its class name for generators not built on a SolvingEngine.
+    """
+    engine = getattr(generator, 'engine', None)
+
+    return engine.adapter.name if engine is not None else type(generator).__name__
+
+
+class _Flight:
+    def __init__(self, key: Hashable, solve: Callable[[], object]):
+        self.key: Hashable = key
+        self.solve: Callable[[], object] = solve
+        self.waiters: Deque[Future] = deque()
+        self.spare: Deque[Tuple[float, object]] = deque()
+        self.in_flight: int = 0
+        self.failures: int = 0
+        self.blocked_until: float = 0.0
+        self.error: Optional[Exception] = None
+        self.last_used: float = time.monotonic()
+
+    def demand(self) -> int:
+        while self.waiters and self.waiters[0].done():
+            self.waiters.popleft()
+
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    def next_waiter(self) -> Optional[Future]:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+
+            # Marks the waiter running, so it can no longer be cancelled once it has been picked.
+            if waiter.set_running_or_notify_cancel():
+                return waiter
+
+        return None
+
+    def expire_spare(self, now: float, token_ttl: float):
+        while self.spare and now - self.spare[0][0] >= token_ttl:
+            self.spare.popleft()
+
+    def idle(self) -> bool:
+        return not self.waiters and not self.in_flight and not self.spare and not self.failures
+
+    def stale(self, now: float, token_ttl: float, negative_ttl: float) -> bool:
+        """
+        :return: True if nothing is pending and the failure streak and spare tokens have expired
+        """
+        self.expire_spare(now, token_ttl)
+
+        if self.demand() or self.in_flight or self.spare:
+            return False
+
+        if self.error is not None:
+            return now >= self.blocked_until
+
+        return not self.failures or now - self.last_used >= negative_ttl
+
+
+class RequestCoalescer:
+    """
+    Demand-sized solving per key. Tokens are single use, so one task can never serve several callers: each caller
+    waiting for a key needs a token of its own, and the burst of tasks started for a key is the number of callers
+    waiting minus the tasks already in flight. What callers of a key do share is the tasks in flight, which are not
+    tied to a caller: every token goes to the longest waiting caller, and a token finishing after its caller gave up
+    is kept for ``token_ttl`` seconds and handed to the next caller instead of starting a new task.
+
+    The burst is not capped by default. ``max_burst`` caps the tasks in flight per key, which bounds spending on a key
+    but saves no tasks: the extra callers wait for a running task to finish before theirs is created, so N concurrent
+    callers take about N / max_burst solve times instead of one. Tasks run on ``max_workers`` threads shared by all
+    keys, which bounds them the same way.
+
+    Keys whose tasks fail ``failure_threshold`` times in a row are negatively cached for ``negative_ttl`` seconds:
+    every waiting caller gets the last error, and new callers get it straight away without creating a task.
+
+    Keys include the proxy, so with rotating proxies most keys are used once. Every ``sweep_interval`` seconds, keys
+    with nothing in flight are forgotten once their spare tokens expired and their negative cache or failure streak is
+    older than ``negative_ttl``.
+    """
+
+    def __init__(self, max_burst: Optional[int] = DEFAULT_MAX_BURST, token_ttl: float = DEFAULT_TOKEN_TTL,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+                 max_workers: int = DEFAULT_MAX_WORKERS, sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        self.max_burst: Optional[int] = max_burst
+        self.token_ttl: float = token_ttl
+        self.failure_threshold: int = failure_threshold
+        self.negative_ttl: float = negative_ttl
+        self.sweep_interval: float = sweep_interval
+        self._next_sweep: float = time.monotonic() + sweep_interval
+
+        self._flights: Dict[Hashable, _Flight] = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='captcha-coalesce')
+
+        self._requests: int = 0
+        self._tasks: int = 0
+        self._spare_hits: int = 0
+        self._failures: int = 0
+        self._rejected: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self._requests
+
+    @property
+    def tasks(self) -> int:
+        return self._tasks
+
+    @property
+    def spare_hits(self) -> int:
+        return self._spare_hits
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def rejected(self) -> int:
+        return self._rejected
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _sweep(self, now: float):
+        """
+        Forgets stale keys. Called with the lock held.
+        """
+        if now < self._next_sweep:
+            return
+
+        self._next_sweep = now + self.sweep_interval
+
+        for key, flight in list(self._flights.items()):
+            if flight.stale(now, self.token_ttl, self.negative_ttl):
+                del self._flights[key]
+
+    def _acquire(self, key: Hashable, solve: Callable[[], object]) -> Future:
+        now = time.monotonic()
+        future = Future()
+
+        with self._lock:
+            self._requests += 1
+            self._sweep(now)
+            flight = self._flights.get(key)
+
+            if flight is None:
+                flight = _Flight(key, solve)
+                self._flights[key] = flight
+
+            flight.last_used = now
+
+            if flight.error is not None:
+                if now < flight.blocked_until:
+                    self._rejected += 1
+                    future.set_exception(flight.error)
+
+                    return future
+
+                flight.error = None
+                flight.failures = 0
+
+            flight.expire_spare(now, self.token_ttl)
+
+            if flight.spare:
+                self._spare_hits += 1
+                future.set_result(flight.spare.popleft()[1])
+
+                return future
+
+            flight.waiters.append(future)
+            self._launch(flight)
+
+        return future
+
+    def _launch(self, flight: _Flight):
+        demand = flight.demand()
+        missing = (demand if self.max_burst is None else min(demand, self.max_burst)) - flight.in_flight
+
+        for _ in range(missing):
+            flight.in_flight += 1
+            self._tasks += 1
+            self._executor.submit(self._run, flight)
+
+    def _run(self, flight: _Flight):
+        token = None
+        error: Optional[Exception] = None
+
+        try:
+            token = flight.solve()
+
+        except Exception as e:
+            error = e
+
+        deliveries: List[Future] = list()
+
+        with self._lock:
+            now = time.monotonic()
+            flight.in_flight -= 1
+            flight.last_used = now
+
+            if error is None:
+                flight.failures = 0
+                waiter = flight.next_waiter()
+
+                if waiter is not None:
+                    deliveries.append(waiter)
+                else:
+                    flight.spare.append((now, token))
+
+            else:
+                self._failures += 1
+                flight.failures += 1
+
+                if flight.failures >= self.failure_threshold:
+                    logger.warning(f'{flight.failures} solves failed in a row, failing fast for {self.negative_ttl}s. '
+                                   f'Reason: {error}')
+                    flight.blocked_until = now + self.negative_ttl
+                    flight.error = error
+
+                    while True:
+                        waiter = flight.next_waiter()
+
+                        if waiter is None:
+                            break
+
+                        deliveries.append(waiter)
+
+                else:
+                    waiter = flight.next_waiter()
+
+                    if waiter is not None:
+                        deliveries.append(waiter)
+
+            if flight.error is None:
+                self._launch(flight)
+
+            if flight.idle() and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+            self._sweep(now)
+
+        for waiter in deliveries:
+            if error is None:
+                waiter.set_result(token)
+            else:
+                waiter.set_exception(error)
+
+    def _generate(self, key: Hashable, solve: Callable[[], object]):
+        return self._acquire(key, solve).result()
+
+    async def _agenerate(self, key: Hashable, solve: Callable[[], object]):
+        import asyncio
+
+        return await asyncio.wrap_future(self._acquire(key, solve))
+
+
+class CoalescingHCaptchaGenerator(RequestCoalescer):
+    """
+    Coalescing wrapper implementing BaseHCaptchaGenerator. Solves are keyed on (provider, website url, site key,
+    proxy, invisible).
+    """
+
+    def __init__(self, generator: BaseHCaptchaGenerator, max_burst: Optional[int] = DEFAULT_MAX_BURST,
+                 token_ttl: float = DEFAULT_TOKEN_TTL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, max_workers: int = DEFAULT_MAX_WORKERS,
+                 sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        super().__init__(max_burst=max_burst, token_ttl=token_ttl, failure_threshold=failure_threshold,
+                         negative_ttl=negative_ttl, max_workers=max_workers, sweep_interval=sweep_interval)
+        self.generator: BaseHCaptchaGenerator = generator
+        self.provider: str = generator_provider(generator)
+        self.website_url: Optional[str] = getattr(generator, 'website_url', None)
+
+    def _key(self, site_key: str, captcha_proxy: ProxyConfig, invisible: bool) -> tuple:
+        return self.provider, self.website_url, site_key, proxy_key(captcha_proxy), invisible
+
+    def _solver(self, site_key: str, captcha_proxy: ProxyConfig, invisible: bool) -> Callable[[], BaseHCaptchaResult]:
+        return partial(self.generator.generate, site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible)
+
+    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+        return self._generate(self._key(site_key, captcha_proxy, invisible),
+                              self._solver(site_key, captcha_proxy, invisible))
+
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None,
+                        invisible: bool = False) -> BaseHCaptchaResult:
+        return await self._agenerate(self._key(site_key, captcha_proxy, invisible),
+                                     self._solver(site_key, captcha_proxy, invisible))
+
+
+class CoalescingFunCaptchaGenerator(RequestCoalescer):
+    """
+    Coalescing wrapper implementing BaseFunCaptchaGenerator. Solves are keyed on (provider, website url, public key,
+    proxy).
+    """
+
+    def __init__(self, generator: BaseFunCaptchaGenerator, max_burst: Optional[int] = DEFAULT_MAX_BURST,
+                 token_ttl: float = DEFAULT_TOKEN_TTL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, max_workers: int = DEFAULT_MAX_WORKERS,
+                 sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        super().__init__(max_burst=max_burst, token_ttl=token_ttl, failure_threshold=failure_threshold,
+                         negative_ttl=negative_ttl, max_workers=max_workers, sweep_interval=sweep_interval)
+        self.generator: BaseFunCaptchaGenerator = generator
+        self.provider: str = generator_provider(generator)
+        self.website_url: Optional[str] = getattr(generator, 'website_url', None)
+        self.public_key: Optional[str] = getattr(generator, 'captcha_public_key', None)
+
+    def _key(self, captcha_proxy: ProxyConfig) -> tuple:
+        return self.provider, self.website_url, self.public_key, proxy_key(captcha_proxy)
+
+    def generate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        return self._generate(self._key(captcha_proxy), partial(self.generator.generate, captcha_proxy=captcha_proxy))
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        return await self._agenerate(self._key(captcha_proxy),
+                                     partial(self.generator.generate, captcha_proxy=captcha_proxy))
@@ -0,0 +1,853 @@
+from __future__ import annotations
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Collection, Hashable, Iterable, Mapping, Optional, Type, TypeVar
+from .balance import ERROR_BUDGET_EXCEEDED, ERROR_INSUFFICIENT_BALANCE, BalanceMonitor, SolveBudget
+from .base import (PROXY_PROTOCOL_HTTP, PROXY_PROTOCOL_HTTPS, PROXY_PROTOCOL_SOCKS4, PROXY_PROTOCOL_SOCKS5,
+                   proxy_protocol)
+from .handle import CancelToken
+from .instrumentation import SolveContext, SolveEvents, SolveListener
+from .journal import JOURNAL_STATE_FAILED, JOURNAL_STATE_READY, TaskJournal, task_key
+from .poller import TaskPoller
+from .polling import FixedPolling, PollingStrategy
+from .ratelimit import ProviderLimiter, get_limiter
+from .retry import RetryPolicy
+from .transport import DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT, AsyncHTTPTransport, HTTPTransport
+
+if TYPE_CHECKING:
+    import requests
+    from proxy import ProxyConfig
+    from .callback import CallbackReceiver
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar('ResultT')
+
+TASK_STATE_PROCESSING = 'processing'
+TASK_STATE_READY = 'ready'
+
+DEFAULT_ACCEPTED_STATUS_CODES = frozenset(range(200, 300))
+DEFAULT_PROXY_TYPES = {
+    PROXY_PROTOCOL_HTTP: 'http',
+    PROXY_PROTOCOL_HTTPS: 'https',
+    PROXY_PROTOCOL_SOCKS4: 'socks4',
+    PROXY_PROTOCOL_SOCKS5: 'socks5',
+}
+DEFAULT_FRAGMENT_CACHE_SIZE = 4096
+
+
+class TaskFragmentCache:
+    """
+    LRU cache of the parts of a task that only depend on the solve parameters (type, site key, proxy fields...), so
+    building a task for parameters seen before is a single dict copy. Safe to share between threads.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_FRAGMENT_CACHE_SIZE):
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._fragments: 'OrderedDict[Hashable, dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get(self, key: Hashable, build: Callable[[], dict]) -> dict:
+        """
+        :return: A copy of the fragment cached for ``key``, built with ``build`` on a miss. The copy is the caller's
+            to modify.
+        """
+        with self._lock:
+            fragment = self._fragments.get(key)
+
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+
+                return dict(fragment)
+
+            self.misses += 1
+
+        fragment = build()
+
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+
+            while len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+
+        return dict(fragment)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+
+class ProviderAdapter:
+    """
+    Declarative description of a provider speaking the createTask / getTaskResult protocol: where to send requests,
+    which keys hold what, how task statuses map to engine states and which errors are fatal. The engine does all the
+    work, so a new provider only needs an adapter and its result types.
+    """
+
+    def __init__(self, name: str, base_url: str, create_task_path: str, check_result_path: str,
+                 failed_exception: Type[Exception], processing_exception: Type[Exception],
+                 request_key_api_token: str, request_key_task: str, request_key_task_id: str,
+                 response_key_error_id: str, response_key_error_code: str, response_key_task_id: str,
+                 response_key_status: str, response_key_solution: str, statuses: Mapping[str, str],
+                 task_key_captcha_type: str, task_key_website_url: str,
+                 task_key_proxy_type: str, task_key_proxy_address: str, task_key_proxy_port: str,
+                 task_key_proxy_username: str, task_key_proxy_password: str,
+                 fatal_error_codes: Collection[str] = frozenset(),
+                 accepted_status_codes: Collection[int] = DEFAULT_ACCEPTED_STATUS_CODES,
+                 unknown_status: str = TASK_STATE_PROCESSING, poll_interval: float = 3,
+                 balance_path: str = None, response_key_balance: str = None,
+                 zero_balance_error_codes: Collection[str] = frozenset(),
+                 proxy_types: Mapping[str, str] = None, proxy_error_codes: Collection[str] = frozenset(),
+                 request_key_callback_url: str = None):
+        """
+        :param failed_exception: Raised when a request or task fails. Must accept an ``error_code`` keyword.
+        :param processing_exception: Raised by get_result while the task is still being solved
+        :param statuses: Maps provider task statuses to TASK_STATE_PROCESSING or TASK_STATE_READY
+        :param accepted_status_codes: HTTP status codes whose body is parsed. Others fail the request outright.
+        :param unknown_status: Engine state of statuses missing from ``statuses``
+        :param poll_interval: Default seconds between result checks
+        :param balance_path: Path of the getBalance endpoint, if the provider has one
+        :param zero_balance_error_codes: Error codes meaning the account has run out of funds
+        :param proxy_types: Proxy type sent to the provider by proxy protocol. Protocols missing from it are rejected.
+        :param proxy_error_codes: Error codes blaming the proxy of the task rather than the task itself
+        :param request_key_callback_url: createTask key of the url results are pushed to, if the provider supports it
+        """
+        self.name: str = name
+        self.base_url: str = base_url
+        self.create_task_path: str = create_task_path
+        self.check_result_path: str = check_result_path
+        self.failed_exception: Type[Exception] = failed_exception
+        self.processing_exception: Type[Exception] = processing_exception
+
+        self.request_key_api_token: str = request_key_api_token
+        self.request_key_task: str = request_key_task
+        self.request_key_task_id: str = request_key_task_id
+        self.request_key_callback_url: Optional[str] = request_key_callback_url
+
+        self.response_key_error_id: str = response_key_error_id
+        self.response_key_error_code: str = response_key_error_code
+        self.response_key_task_id: str = response_key_task_id
+        self.response_key_status: str = response_key_status
+        self.response_key_solution: str = response_key_solution
+        self.statuses: Mapping[str, str] = statuses
+        self.unknown_status: str = unknown_status
+
+        self.task_key_captcha_type: str = task_key_captcha_type
+        self.task_key_website_url: str = task_key_website_url
+        self.task_key_proxy_type: str = task_key_proxy_type
+        self.task_key_proxy_address: str = task_key_proxy_address
+        self.task_key_proxy_port: str = task_key_proxy_port
+        self.task_key_proxy_username: str = task_key_proxy_username
+        self.task_key_proxy_password: str = task_key_proxy_password
+        self.proxy_types: Mapping[str, str] = proxy_types if proxy_types is not None else DEFAULT_PROXY_TYPES
+        self.proxy_error_codes: Collection[str] = frozenset(proxy_error_codes)
+
+        self.balance_path: Optional[str] = balance_path
+        self.response_key_balance: Optional[str] = response_key_balance
+
+        self.fatal_error_codes: Collection[str] = frozenset(fatal_error_codes)
+        self.zero_balance_error_codes: Collection[str] = frozenset(zero_balance_error_codes)
+        self.accepted_status_codes: Collection[int] = frozenset(accepted_status_codes)
+        self.poll_interval: float = poll_interval
+
+    def proxy_fields(self, proxy_config: ProxyConfig) -> dict:
+        protocol = proxy_protocol(proxy_config)
+        proxy_type = self.proxy_types.get(protocol)
+
+        if proxy_type is None:
+            raise (ValueError(f'{self.name} does not support {protocol} proxies.'))
+
+        new_dict = dict()
+        new_dict[self.task_key_proxy_type] = proxy_type
+
+        new_dict[self.task_key_proxy_address] = proxy_config.hostname
+        new_dict[self.task_key_proxy_port] = proxy_config.port
+
+        if proxy_config.has_username():
+            new_dict[self.task_key_proxy_username] = proxy_config.username
+
+        if proxy_config.has_password():
+            new_dict[self.task_key_proxy_password] = proxy_config.password
+
+        return new_dict
+
+    def proxy_endpoint(self, task: dict) -> Optional[tuple]:
+        """
+        :return: Identity of the proxy a task is sent through, as returned by ``base.proxy_endpoint``, or None.
+        """
+        address = task.get(self.task_key_proxy_address)
+
+        if address is None:
+            return None
+
+        return str(address), str(task.get(self.task_key_proxy_port)), task.get(self.task_key_proxy_username)
+
+    def create_task_request(self, api_key: str, task: dict, callback_url: str = None) -> dict:
+        request_data = dict()
+        request_data[self.request_key_api_token] = api_key
+        request_data[self.request_key_task] = task
+
+        if callback_url is not None:
+            if self.request_key_callback_url is None:
+                raise (ValueError(f'{self.name} does not support result callbacks.'))
+
+            request_data[self.request_key_callback_url] = callback_url
+
+        return request_data
+
+    def get_result_request(self, api_key: str, task_id) -> dict:
+        request_data = dict()
+        request_data[self.request_key_api_token] = api_key
+        request_data[self.request_key_task_id] = task_id
+
+        return request_data
+
+    def balance_request(self, api_key: str) -> dict:
+        request_data = dict()
+        request_data[self.request_key_api_token] = api_key
+
+        return request_data
+
+    def _response_json(self, response, request_name: str) -> dict:
+        if response.status_code not in self.accepted_status_codes:
+            raise (self.failed_exception(
+                f'{request_name} request did not return 2XX code. Status code: {response.status_code}'))
+
+        response_json: dict = response.json()
+        error_id = response_json.get(self.response_key_error_id)
+
+        if error_id != 0:
+            logger.debug(json.dumps(response_json, sort_keys=True, indent=4))
+            error_code = response_json.get(self.response_key_error_code)
+            raise (self.failed_exception(f'{request_name} request failed. Error id: {error_id}, '
+                                         f'error code: {error_code}', error_code=error_code))
+
+        return response_json
+
+    def parse_create_task_response(self, response):
+        """
+        :return: Id of the created task
+        """
+        return self._response_json(response, 'Create task')[self.response_key_task_id]
+
+    def parse_get_result_response(self, task_id, response) -> dict:
+        """
+        :return: Solution of the task
+        :except processing_exception: Raised if the task is still being processed, or if the provider failed to answer
+            (5XX), which says nothing about the task
+        """
+        if response.status_code >= 500:
+            raise (self.processing_exception(
+                f'Get result request returned status code {response.status_code}. Task id: {task_id}'))
+
+        response_json = self._response_json(response, 'Get result')
+        status = response_json.get(self.response_key_status)
+
+        if self.statuses.get(status, self.unknown_status) != TASK_STATE_READY:
+            raise (self.processing_exception(f'Request still processing. Task id: {task_id}'))
+
+        return response_json.get(self.response_key_solution)
+
+    def parse_callback(self, task_id, payload: dict) -> Optional[dict]:
+        """
+        :return: Solution carried by a result callback, or None if the callback only notifies that the task finished.
+        :except failed_exception: Raised if the callback reports that the task failed
+        """
+        error_id = payload.get(self.response_key_error_id)
+
+        if error_id not in (None, 0, '0'):
+            error_code = payload.get(self.response_key_error_code)
+            raise (self.failed_exception(f'Task "{task_id}" failed. Error id: {error_id}, error code: {error_code}',
+                                         error_code=error_code))
+
+        solution = payload.get(self.response_key_solution)
+
+        if not isinstance(solution, dict) \
+                or self.statuses.get(payload.get(self.response_key_status), self.unknown_status) != TASK_STATE_READY:
+            return None
+
+        return solution
+
+    def parse_balance_response(self, response) -> float:
+        return float(self._response_json(response, 'Get balance')[self.response_key_balance])
+
+
+class ProviderClient:
+    """
+    Sends createTask and getTaskResult requests for one API key of a provider, through a pooled transport and the
+    provider's rate limits. Safe to share between threads and generators.
+    """
+
+    def __init__(self, adapter: ProviderAdapter, api_key: str, session: requests.Session = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, async_session=None, rate_limiter: ProviderLimiter = None,
+                 listeners: Iterable[SolveListener] = None, base_url: str = None,
+                 request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT):
+        """
+        :param session: Optional session to send requests with. Injected sessions are not closed by close().
+        :param pool_size: Maximum number of keep-alive connections when no session is provided
+        :param async_session: Optional ``aiohttp.ClientSession`` used by the async methods
+        :param rate_limiter: Limits to apply. Defaults to the limiter shared by everything using the same provider and
+            API key.
+        :param listeners: Listeners notified of every HTTP response
+        :param base_url: API root, the adapter's default if None
+        :param request_timeout: Seconds to wait for the connection and for each response, None to wait forever
+        """
+        self.adapter: ProviderAdapter = adapter
+        self.api_key: str = api_key
+        base_url = base_url if base_url is not None else adapter.base_url
+        self.create_task_url: str = base_url + adapter.create_task_path
+        self.check_result_url: str = base_url + adapter.check_result_path
+        self.balance_url: Optional[str] = base_url + adapter.balance_path if adapter.balance_path is not None else None
+        self.rate_limiter: ProviderLimiter = \
+            rate_limiter if rate_limiter is not None else get_limiter(adapter.name, api_key)
+        self.events: SolveEvents = SolveEvents(listeners)
+        self.transport: HTTPTransport = HTTPTransport(session=session, pool_size=pool_size, timeout=request_timeout,
+                                                      provider=adapter.name, events=self.events)
+        self.async_transport: AsyncHTTPTransport = AsyncHTTPTransport(session=async_session, pool_size=pool_size,
+                                                                      timeout=request_timeout, provider=adapter.name,
+                                                                      events=self.events)
+
+    def close(self):
+        self.transport.close()
+
+    async def aclose(self):
+        self.transport.close()
+        await self.async_transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def create_task(self, task: dict, callback_url: str = None):
+        """
+        Creates a task and returns its id. Does not wait for the task to complete.
+
+        :param callback_url: Url the provider pushes the result to once the task finishes
+        """
+        self.rate_limiter.create.acquire()
+        response = self.transport.post(self.create_task_url,
+                                       json=self.adapter.create_task_request(self.api_key, task, callback_url))
+
+        return self.adapter.parse_create_task_response(response)
+
+    def get_result(self, task_id) -> dict:
+        """
+        Single result check. Raises the adapter's processing exception while the task is still being solved, and when
+        the check itself fails transiently (connection error, timeout, 5XX), as the task may still complete and is
+        already paid for.
+        """
+        self.rate_limiter.poll.acquire()
+
+        try:
+            response = self.transport.post(self.check_result_url,
+                                           json=self.adapter.get_result_request(self.api_key, task_id))
+
+        except self.transport.transient_errors as e:
+            raise (self.adapter.processing_exception(f'Get result request failed: {e!r}. Task id: {task_id}')) from e
+
+        return self.adapter.parse_get_result_response(task_id, response)
+
+    def check_result(self, task_id) -> Optional[dict]:
+        """
+        Single result check suitable for TaskPoller. Returns None while the task is still being processed.
+        """
+        try:
+            return self.get_result(task_id)
+
+        except self.adapter.processing_exception as e:
+            if e.__cause__ is not None:
+                logger.debug(str(e))
+
+            return None
+
+    def get_balance(self) -> float:
+        """
+        :return: Current account balance, in the provider's currency
+        """
+        if self.balance_url is None:
+            raise (NotImplementedError(f'{self.adapter.name} has no balance endpoint.'))
+
+        response = self.transport.post(self.balance_url, json=self.adapter.balance_request(self.api_key))
+
+        return self.adapter.parse_balance_response(response)
+
+    async def acreate_task(self, task: dict, callback_url: str = None):
+        await self.rate_limiter.create.aacquire()
+        response = await self.async_transport.post(
+            self.create_task_url, json=self.adapter.create_task_request(self.api_key, task, callback_url))
+
+        return self.adapter.parse_create_task_response(response)
+
+    async def aget_result(self, task_id) -> dict:
+        await self.rate_limiter.poll.aacquire()
+
+        try:
+            response = await self.async_transport.post(self.check_result_url,
+                                                       json=self.adapter.get_result_request(self.api_key, task_id))
+
+        except self.async_transport.transient_errors as e:
+            raise (self.adapter.processing_exception(f'Get result request failed: {e!r}. Task id: {task_id}')) from e
+
+        return self.adapter.parse_get_result_response(task_id, response)
+
+    async def acheck_result(self, task_id) -> Optional[dict]:
+        try:
+            return await self.aget_result(task_id)
+
+        except self.adapter.processing_exception:
+            return None
+
+
+class SolvingEngine:
+    """
+    Runs solves against a ProviderClient: creates the task, polls it until ready, retries failed attempts, and reports
+    every phase to the listeners. Every generator is a thin layer building task dicts and parsing solutions on top of
+    an engine, so improvements here apply to all providers at once.
+
+    With a balance monitor, a solve is rejected before each task it would create once the monitor reports that funds
+    are too low, with the ``ERROR_INSUFFICIENT_BALANCE`` code. A solve may also carry a SolveBudget; a task that would
+    take it over its maximum cost is never created and the solve fails with ``ERROR_BUDGET_EXCEEDED``. Neither code is
+    retried, so a router fails over to its next generator straight away.
+
+    With a callback receiver, tasks are created with its callback url and solves wait for the provider to push the
+    result, checking it themselves only every ``fallback_interval`` seconds of the receiver. Tasks resumed from the
+    journal are polled, as their callback may have been sent to a previous run.
+    """
+
+    def __init__(self, client: ProviderClient, poller: TaskPoller = None, polling_strategy: PollingStrategy = None,
+                 retry_policy: RetryPolicy = None, events: SolveEvents = None, journal: TaskJournal = None,
+                 balance_monitor: BalanceMonitor = None, task_costs: Mapping[str, float] = None,
+                 callback_receiver: CallbackReceiver = None):
+        """
+        :param poller: Shared poller to register tasks with. Each solve polls on its own thread when None.
+        :param polling_strategy: Delays between result checks. Fixed at the adapter's poll interval when None.
+        :param retry_policy: Retry policy. A single attempt when None.
+        :param events: Listeners of solve phases. Defaults to the listeners of the client.
+        :param journal: Journal of created tasks, used to resume tasks left pending by a previous run
+        :param balance_monitor: Balance of the account, checked before every task is created
+        :param task_costs: Price of a task by task type, used for admission and cost budgets
+        :param callback_receiver: Receiver of pushed results, replacing polling. The provider must support callbacks.
+        """
+        self.client: ProviderClient = client
+        self.adapter: ProviderAdapter = client.adapter
+        self.poller: Optional[TaskPoller] = poller
+        self.polling_strategy: PollingStrategy = \
+            polling_strategy if polling_strategy is not None else FixedPolling(client.adapter.poll_interval)
+        self.polling_strategy.set_default_interval(client.adapter.name, client.adapter.poll_interval)
+        self.retry_policy: RetryPolicy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.events: SolveEvents = events if events is not None else client.events
+        self.journal: Optional[TaskJournal] = journal
+        self.balance_monitor: Optional[BalanceMonitor] = balance_monitor
+        self.task_costs: Mapping[str, float] = task_costs if task_costs is not None else dict()
+
+        if callback_receiver is not None and client.adapter.request_key_callback_url is None:
+            raise (ValueError(f'{client.adapter.name} does not support result callbacks.'))
+
+        self.callback_receiver: Optional[CallbackReceiver] = callback_receiver
+
+    def _context(self, task: dict) -> SolveContext:
+        context = SolveContext(self.adapter.name, task[self.adapter.task_key_captcha_type])
+        context.proxy = self.adapter.proxy_endpoint(task)
+
+        return context
+
+    def _journal_key(self, task: dict) -> Optional[str]:
+        return task_key(self.adapter.name, self.client.api_key, task) if self.journal is not None else None
+
+    def _admit(self, context: SolveContext, budget: Optional[SolveBudget]):
+        """
+        Raises the failed exception if the next task of the solve should not be created.
+        """
+        cost = self.task_costs.get(context.task_type)
+
+        if self.balance_monitor is not None and not self.balance_monitor.admits(cost):
+            raise (self.adapter.failed_exception(
+                f'{self.adapter.name} balance too low to create a task. Balance: {self.balance_monitor.balance}',
+                error_code=ERROR_INSUFFICIENT_BALANCE))
+
+        if budget is not None and budget.max_cost is not None and cost is not None \
+                and context.cost + cost > budget.max_cost:
+            raise (self.adapter.failed_exception(
+                f'Another task would exceed the solve budget. Spent: {context.cost}, budget: {budget.max_cost}',
+                error_code=ERROR_BUDGET_EXCEEDED))
+
+    def _task_started(self, context: SolveContext, task_id, journal_key: Optional[str], resumed: bool,
+                      latency: float):
+        context.task_id = task_id
+        context.task_polls = 0
+        context.last_pending_at = None
+        context.polled_ready = False
+
+        if resumed:
+            logger.info(f'Resuming task "{task_id}" from the journal.')
+            return
+
+        cost = self.task_costs.get(context.task_type)
+
+        if cost is not None:
+            context.cost += cost
+
+            if self.balance_monitor is not None:
+                self.balance_monitor.charge(cost)
+
+        self.events.emit('on_task_created', context, task_id, latency)
+        logger.debug(f'Task created. Id: {task_id}')
+
+        if journal_key is not None:
+            self.journal.record_created(journal_key, task_id, context.provider, context.task_type)
+
+    def _task_failed(self, context: SolveContext, task_id, error: Exception):
+        if task_id is not None and self.journal is not None:
+            self.journal.record_finished(task_id, JOURNAL_STATE_FAILED)
+
+        if self.balance_monitor is not None and error.error_code in self.adapter.zero_balance_error_codes:
+            self.balance_monitor.mark_exhausted()
+
+        self.events.emit('on_task_failed', context, task_id, error)
+
+    def _task_ready(self, context: SolveContext, task_id, resumed: bool, created_at: float):
+        elapsed = time.monotonic() - created_at
+
+        if self.journal is not None:
+            self.journal.record_finished(task_id, JOURNAL_STATE_READY)
+
+        # A resumed task was created before the restart, so its time to ready says nothing about solve times.
+        if not resumed:
+            pending_until = None
+
+            if context.polled_ready:
+                pending_until = context.last_pending_at - created_at if context.last_pending_at is not None else 0.0
+
+            self.polling_strategy.record(context.provider, context.task_type, elapsed, pending_until)
+
+        self.events.emit('on_task_ready', context, task_id, elapsed)
+
+    def _deadline_exceeded(self, task_id) -> Exception:
+        return self.adapter.failed_exception(f'Deadline exceeded while waiting for task "{task_id}".')
+
+    def _poll_check(self, context: SolveContext, task_id) -> Optional[dict]:
+        context.polls += 1
+        context.task_polls += 1
+        result = self.client.check_result(task_id)
+
+        if result is None:
+            context.last_pending_at = time.monotonic()
+        else:
+            context.polled_ready = True
+
+        self.events.emit('on_poll', context, task_id, result is not None)
+
+        return result
+
+    async def _apoll_check(self, context: SolveContext, task_id) -> Optional[dict]:
+        context.polls += 1
+        context.task_polls += 1
+        result = await self.client.acheck_result(task_id)
+
+        if result is None:
+            context.last_pending_at = time.monotonic()
+        else:
+            context.polled_ready = True
+
+        self.events.emit('on_poll', context, task_id, result is not None)
+
+        return result
+
+    def _callback_solution(self, context: SolveContext, task_id, payload: Optional[dict]) -> Optional[dict]:
+        """
+        :param payload: Callback received for the task, or None if none arrived before the fallback check was due
+        """
+        solution = self.adapter.parse_callback(task_id, payload) if payload is not None else None
+
+        return solution if solution is not None else self._poll_check(context, task_id)
+
+    def _callback_timeout(self, context: SolveContext, policy: RetryPolicy) -> float:
+        remaining = policy.remaining(context.elapsed)
+        interval = self.callback_receiver.fallback_interval
+
+        return interval if remaining is None else min(interval, remaining)
+
+    def _wait_callback(self, context: SolveContext, task_id, policy: RetryPolicy, cancel_token: CancelToken) -> dict:
+        waiter = self.callback_receiver.expect(task_id)
+        cancel_token.on_cancel(waiter.cancel)
+
+        try:
+            while True:
+                try:
+                    payload = waiter.result(timeout=self._callback_timeout(context, policy))
+
+                except concurrent.futures.CancelledError:
+                    cancel_token.raise_if_cancelled()
+                    raise
+
+                except concurrent.futures.TimeoutError:
+                    if policy.deadline_exceeded(context.elapsed):
+                        raise (self._deadline_exceeded(task_id))
+
+                    payload = None
+
+                solution = self._callback_solution(context, task_id, payload)
+
+                if solution is not None:
+                    return solution
+
+                if waiter.done():
+                    waiter = self.callback_receiver.expect(task_id)
+                    cancel_token.on_cancel(waiter.cancel)
+
+                logger.debug(f'Request "{task_id}" is still being processed.')
+
+        finally:
+            self.callback_receiver.discard(task_id)
+
+    async def _await_callback(self, context: SolveContext, task_id, policy: RetryPolicy) -> dict:
+        import asyncio
+
+        waiter = asyncio.wrap_future(self.callback_receiver.expect(task_id))
+
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(asyncio.shield(waiter), self._callback_timeout(context, policy))
+
+                except asyncio.TimeoutError:
+                    if policy.deadline_exceeded(context.elapsed):
+                        raise (self._deadline_exceeded(task_id))
+
+                    payload = None
+
+                solution = self.adapter.parse_callback(task_id, payload) if payload is not None else None
+
+                if solution is None:
+                    solution = await self._apoll_check(context, task_id)
+
+                if solution is not None:
+                    return solution
+
+                if waiter.done():
+                    waiter = asyncio.wrap_future(self.callback_receiver.expect(task_id))
+
+        finally:
+            self.callback_receiver.discard(task_id)
+
+    def _solve_task(self, task: dict, context: SolveContext, policy: RetryPolicy, cancel_token: CancelToken) -> dict:
+        schedule = partial(self.polling_strategy.delay, context.provider, context.task_type)
+        callback_url = self.callback_receiver.callback_url if self.callback_receiver is not None else None
+        requested_at = time.monotonic()
+        journal_key = self._journal_key(task)
+        task_id = None
+
+        try:
+            task_id = self.journal.claim(journal_key) if journal_key is not None else None
+            resumed = task_id is not None
+
+            if not resumed:
+                task_id = self.client.create_task(task, callback_url=callback_url)
+
+            created_at = time.monotonic()
+            self._task_started(context, task_id, journal_key, resumed, created_at - requested_at)
+            check = partial(self._poll_check, context, task_id)
+
+            if callback_url is not None and not resumed:
+                solution = self._wait_callback(context, task_id, policy, cancel_token)
+
+            elif self.poller is not None:
+                future = self.poller.register(task_id, check, schedule)
+                cancel_token.on_cancel(future.cancel)
+
+                try:
+                    solution = future.result(timeout=policy.remaining(context.elapsed))
+
+                except concurrent.futures.CancelledError:
+                    cancel_token.raise_if_cancelled()
+                    raise
+
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    raise (self._deadline_exceeded(task_id))
+
+            else:
+                while True:
+                    delay = schedule(context.task_polls, time.monotonic() - created_at)
+
+                    if policy.deadline_exceeded(context.elapsed + delay):
+                        raise (self._deadline_exceeded(task_id))
+
+                    cancel_token.sleep(delay)
+                    solution = check()
+
+                    if solution is not None:
+                        break
+
+                    logger.debug(f'Request "{task_id}" is still being processed.')
+
+        except self.adapter.failed_exception as e:
+            self._task_failed(context, task_id, e)
+            raise
+
+        self._task_ready(context, task_id, resumed, created_at)
+
+        return solution
+
+    async def _asolve_task(self, task: dict, context: SolveContext, policy: RetryPolicy) -> dict:
+        import asyncio
+
+        schedule = partial(self.polling_strategy.delay, context.provider, context.task_type)
+        callback_url = self.callback_receiver.callback_url if self.callback_receiver is not None else None
+        requested_at = time.monotonic()
+        journal_key = self._journal_key(task)
+        task_id = None
+
+        try:
+            task_id = self.journal.claim(journal_key) if journal_key is not None else None
+            resumed = task_id is not None
+
+            if not resumed:
+                task_id = await self.client.acreate_task(task, callback_url=callback_url)
+
+            created_at = time.monotonic()
+            self._task_started(context, task_id, journal_key, resumed, created_at - requested_at)
+
+            if callback_url is not None and not resumed:
+                solution = await self._await_callback(context, task_id, policy)
+
+            elif self.poller is not None:
+                future = self.poller.register(task_id, partial(self._poll_check, context, task_id), schedule)
+
+                try:
+                    solution = await asyncio.wait_for(asyncio.wrap_future(future), policy.remaining(context.elapsed))
+
+                except asyncio.TimeoutError:
+                    raise (self._deadline_exceeded(task_id))
+
+            else:
+                while True:
+                    delay = schedule(context.task_polls, time.monotonic() - created_at)
+
+                    if policy.deadline_exceeded(context.elapsed + delay):
+                        raise (self._deadline_exceeded(task_id))
+
+                    await asyncio.sleep(delay)
+                    solution = await self._apoll_check(context, task_id)
+
+                    if solution is not None:
+                        break
+
+        except self.adapter.failed_exception as e:
+            self._task_failed(context, task_id, e)
+            raise
+
+        self._task_ready(context, task_id, resumed, created_at)
+
+        return solution
+
+    def solve(self, task: dict, parse: Callable[[dict], ResultT], cancel_token: CancelToken = None,
+              budget: SolveBudget = None) -> ResultT:
+        """
+        Solves a task, retrying failed attempts as allowed by the retry policy.
+
+        :param task: Complete task dict, including the captcha type
+        :param parse: Turns the provider solution into a result
+        :param cancel_token: Token stopping the solve when cancelled
+        :param budget: Maximum cost and latency of the solve
+        """
+        if cancel_token is None:
+            cancel_token = CancelToken()
+
+        policy = self.retry_policy.with_deadline(budget.max_latency if budget is not None else None)
+        context = self._context(task)
+        self.events.emit('on_solve_started', context)
+        error: Optional[Exception] = None
+
+        try:
+            # Checked before waiting for a slot too, so rejected solves fail without queueing.
+            self._admit(context, budget)
+
+            with self.client.rate_limiter.governor.slot():
+                while True:
+                    cancel_token.raise_if_cancelled()
+                    self._admit(context, budget)
+                    context.attempts += 1
+
+                    try:
+                        solution = self._solve_task(task, context, policy, cancel_token)
+                        break
+
+                    except self.adapter.failed_exception as e:
+                        if not policy.should_retry(context.attempts, e.error_code, context.elapsed,
+                                                   self.adapter.fatal_error_codes):
+                            raise
+
+                        logger.info(f'Attempt {context.attempts} failed. Reason: {e}')
+                        self.events.emit('on_retry', context, context.attempts, e)
+                        cancel_token.sleep(policy.backoff_delay(context.attempts))
+
+            return parse(solution)
+
+        except Exception as e:
+            error = e
+            raise
+
+        finally:
+            self.events.emit('on_solve_finished', context, error)
+
+    async def asolve(self, task: dict, parse: Callable[[dict], ResultT], budget: SolveBudget = None) -> ResultT:
+        """
+        Async version of solve. Cancel the awaiting task to stop the solve.
+        """
+        import asyncio
+
+        policy = self.retry_policy.with_deadline(budget.max_latency if budget is not None else None)
+        context = self._context(task)
+        self.events.emit('on_solve_started', context)
+        error: Optional[Exception] = None
+
+        try:
+            self._admit(context, budget)
+
+            async with self.client.rate_limiter.governor.aslot():
+                while True:
+                    self._admit(context, budget)
+                    context.attempts += 1
+
+                    try:
+                        solution = await self._asolve_task(task, context, policy)
+                        break
+
+                    except self.adapter.failed_exception as e:
+                        if not policy.should_retry(context.attempts, e.error_code, context.elapsed,
+                                                   self.adapter.fatal_error_codes):
+                            raise
+
+                        logger.info(f'Attempt {context.attempts} failed. Reason: {e}')
+                        self.events.emit('on_retry', context, context.attempts, e)
+                        await asyncio.sleep(policy.backoff_delay(context.attempts))
+
+            return parse(solution)
+
+        except Exception as e:
+            error = e
+            raise
+
+        finally:
+            self.events.emit('on_solve_finished', context, error)
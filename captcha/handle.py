@@ -0,0 +1,144 @@
+import threading
+from concurrent.futures import CancelledError, Executor, Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+DEFAULT_MAX_WORKERS = 64
+
+
+class SolveCancelled(CancelledError):
+    pass
+
+
+class CancelToken:
+    """
+    Cancellation flag shared between a SolveHandle and the solve it runs. Solves check the token between polls and
+    while waiting before a retry, so a cancelled solve stops within one poll interval. Tasks already created are left to
+    finish on the provider side, as neither provider can cancel a task.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = list()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, list()
+
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """
+        Calls ``callback`` once the token is cancelled, or immediately if it already is.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback()
+
+    def sleep(self, seconds: float):
+        """
+        Sleeps for ``seconds``, raising SolveCancelled as soon as the token is cancelled.
+        """
+        if self._event.wait(seconds):
+            raise (SolveCancelled('The solve was cancelled.'))
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise (SolveCancelled('The solve was cancelled.'))
+
+
+class SolveHandle:
+    """
+    Result of a solve started with ``submit``. The solve runs in the background from the moment it is submitted, so
+    the token can be collected later with ``result`` once it is actually needed.
+    """
+
+    def __init__(self, future: Future, cancel_token: CancelToken):
+        self._future: Future = future
+        self._cancel_token: CancelToken = cancel_token
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancelled(self) -> bool:
+        if self._future.cancelled():
+            return True
+
+        return self._future.done() and isinstance(self._future.exception(), CancelledError)
+
+    def result(self, timeout: Optional[float] = None):
+        """
+        Waits for the solve and returns its result.
+
+        :param timeout: Maximum seconds to wait, forever if None
+        :raises concurrent.futures.TimeoutError: If the solve is still running after ``timeout`` seconds
+        :raises concurrent.futures.CancelledError: If the solve was cancelled
+        """
+        return self._future.result(timeout)
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:
+        return self._future.exception(timeout)
+
+    def cancel(self) -> bool:
+        """
+        Cancels the solve. A solve that has not started yet never runs; a running solve stops at its next poll.
+
+        :return: False if the solve had already finished, True otherwise
+        """
+        if self._future.done():
+            return False
+
+        self._cancel_token.cancel()
+        self._future.cancel()
+
+        return True
+
+    def add_done_callback(self, callback: Callable[['SolveHandle'], None]):
+        """
+        Calls ``callback`` with this handle once the solve finishes, is cancelled or fails. The callback runs on the
+        thread that finished the solve, or immediately if the solve already finished.
+        """
+        self._future.add_done_callback(lambda _: callback(self))
+
+
+_default_executor: Optional[ThreadPoolExecutor] = None
+_default_executor_lock = threading.Lock()
+
+
+def default_executor() -> ThreadPoolExecutor:
+    """
+    Executor shared by every ``submit`` call made without an explicit executor. Each running solve holds one of its
+    ``DEFAULT_MAX_WORKERS`` threads, so further submitted solves wait in its queue.
+    """
+    global _default_executor
+
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix='captcha-solve')
+
+        return _default_executor
+
+
+def submit_solve(solve: Callable[[CancelToken], object], executor: Executor = None) -> SolveHandle:
+    """
+    Runs ``solve`` in the background.
+
+    :param solve: Callable taking the CancelToken of the solve and returning its result
+    :param executor: Executor to run the solve on, the shared default executor if None
+    """
+    cancel_token = CancelToken()
+    future = (executor if executor is not None else default_executor()).submit(solve, cancel_token)
+
+    return SolveHandle(future, cancel_token)
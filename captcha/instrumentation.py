@@ -0,0 +1,308 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+DEFAULT_POLL_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+_solve_ids = itertools.count(1)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class SolveContext:
+    """
+    State of a single solve, passed to every listener event of that solve. Listeners may keep their own per-solve
+    state in ``data``.
+    """
+
+    def __init__(self, provider: str, task_type: str):
+        self.solve_id: int = next(_solve_ids)
+        self.provider: str = provider
+        self.task_type: str = task_type
+        self.started_at: float = time.monotonic()
+        self.attempts: int = 0
+        # Result checks of the whole solve, and of the current task only.
+        self.polls: int = 0
+        self.task_polls: int = 0
+        self.task_id = None
+        # Last result check of the current task still finding it processing, and whether a check found it ready.
+        self.last_pending_at: Optional[float] = None
+        self.polled_ready: bool = False
+        self.proxy: Optional[tuple] = None
+        self.cost: float = 0.0
+        self.data: dict = dict()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class SolveListener:
+    """
+    Hooks called around every phase of a solve. All methods do nothing by default, so listeners only override the
+    events they need. Listeners are called synchronously on the solving thread and should return quickly.
+    """
+
+    def on_solve_started(self, context: SolveContext):
+        pass
+
+    def on_task_created(self, context: SolveContext, task_id, latency: float):
+        pass
+
+    def on_poll(self, context: SolveContext, task_id, ready: bool):
+        pass
+
+    def on_task_ready(self, context: SolveContext, task_id, elapsed: float):
+        pass
+
+    def on_task_failed(self, context: SolveContext, task_id, error: Exception):
+        pass
+
+    def on_retry(self, context: SolveContext, attempt: int, error: Exception):
+        pass
+
+    def on_solve_finished(self, context: SolveContext, error: Optional[Exception]):
+        pass
+
+    def on_http_response(self, provider: str, endpoint: str, status_code: int, latency: float):
+        pass
+
+
+class SolveEvents:
+    """
+    Dispatches events to a list of listeners. An exception raised by a listener is logged and never interrupts the
+    solve.
+    """
+
+    def __init__(self, listeners: Iterable[SolveListener] = None):
+        self.listeners: List[SolveListener] = list(listeners) if listeners is not None else list()
+
+    def __bool__(self):
+        return bool(self.listeners)
+
+    def emit(self, event: str, *args):
+        for listener in self.listeners:
+            try:
+                getattr(listener, event)(*args)
+
+            except Exception:
+                logger.exception(f'Listener {listener!r} failed on {event}.')
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        snapshot = dict()
+        snapshot['buckets'] = dict(zip(self.buckets + (float('inf'),), self.counts))
+        snapshot['count'] = self.count
+        snapshot['sum'] = self.sum
+
+        return snapshot
+
+
+class MetricsCollector(SolveListener):
+    """
+    In-memory metrics of every solve, tagged by provider and task type.
+    """
+
+    HISTOGRAMS = {
+        'create_task_seconds': DEFAULT_LATENCY_BUCKETS,
+        'time_to_ready_seconds': DEFAULT_LATENCY_BUCKETS,
+        'solve_seconds': DEFAULT_LATENCY_BUCKETS,
+        'polls_per_task': DEFAULT_POLL_BUCKETS,
+        'http_seconds': DEFAULT_LATENCY_BUCKETS,
+    }
+
+    def __init__(self, namespace: str = 'captcha'):
+        self.namespace: str = namespace
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = dict()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(**labels) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def _increment(self, name: str, **labels):
+        key = (name, self._labels(**labels))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def _observe(self, name: str, value: float, **labels):
+        key = (name, self._labels(**labels))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = Histogram(self.HISTOGRAMS[name])
+                self._histograms[key] = histogram
+
+            histogram.observe(value)
+
+    def on_task_created(self, context: SolveContext, task_id, latency: float):
+        self._increment('tasks_created_total', provider=context.provider, task_type=context.task_type)
+        self._observe('create_task_seconds', latency, provider=context.provider, task_type=context.task_type)
+
+    def on_poll(self, context: SolveContext, task_id, ready: bool):
+        self._increment('polls_total', provider=context.provider, task_type=context.task_type)
+
+    def on_task_ready(self, context: SolveContext, task_id, elapsed: float):
+        self._observe('time_to_ready_seconds', elapsed, provider=context.provider, task_type=context.task_type)
+        self._observe('polls_per_task', context.task_polls, provider=context.provider, task_type=context.task_type)
+
+    def on_task_failed(self, context: SolveContext, task_id, error: Exception):
+        self._increment('task_failures_total', provider=context.provider, task_type=context.task_type,
+                        error_code=getattr(error, 'error_code', None) or 'none')
+
+    def on_retry(self, context: SolveContext, attempt: int, error: Exception):
+        self._increment('retries_total', provider=context.provider, task_type=context.task_type,
+                        error_code=getattr(error, 'error_code', None) or 'none')
+
+    def on_solve_finished(self, context: SolveContext, error: Optional[Exception]):
+        result = 'success' if error is None else 'failure'
+        self._increment('solves_total', provider=context.provider, task_type=context.task_type, result=result)
+        self._observe('solve_seconds', context.elapsed, provider=context.provider, task_type=context.task_type)
+
+    def on_http_response(self, provider: str, endpoint: str, status_code: int, latency: float):
+        self._increment('http_responses_total', provider=provider, endpoint=endpoint, status_code=status_code)
+        self._observe('http_seconds', latency, provider=provider, endpoint=endpoint)
+
+    def snapshot(self) -> dict:
+        """
+        :return: Counters and histograms keyed by metric name, then by label tuple.
+        """
+        snapshot = dict()
+
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                snapshot.setdefault(name, dict())[labels] = value
+
+            for (name, labels), histogram in self._histograms.items():
+                snapshot.setdefault(name, dict())[labels] = histogram.snapshot()
+
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        lines = list()
+
+        def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+            pairs = ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in labels)
+            return f'{{{pairs}}}' if pairs else ''
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+        seen = set()
+
+        for (name, labels), value in counters:
+            metric = f'{self.namespace}_{name}'
+
+            if metric not in seen:
+                lines.append(f'# TYPE {metric} counter')
+                seen.add(metric)
+
+            lines.append(f'{metric}{format_labels(labels)} {value}')
+
+        for (name, labels), histogram in histograms:
+            metric = f'{self.namespace}_{name}'
+
+            if metric not in seen:
+                lines.append(f'# TYPE {metric} histogram')
+                seen.add(metric)
+
+            cumulative = 0
+
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{metric}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+
+            lines.append(f'{metric}_sum{format_labels(labels)} {histogram.sum}')
+            lines.append(f'{metric}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryListener(SolveListener):
+    """
+    Records every solve as an OpenTelemetry span named ``captcha.solve``, with task creation, polls and retries as
+    span events. Requires the ``opentelemetry-api`` package.
+    """
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer('captcha')
+
+        self.tracer = tracer
+
+    def on_solve_started(self, context: SolveContext):
+        attributes = dict()
+        attributes['captcha.provider'] = context.provider
+        attributes['captcha.task_type'] = context.task_type
+
+        context.data['otel_span'] = self.tracer.start_span('captcha.solve', attributes=attributes)
+
+    def on_task_created(self, context: SolveContext, task_id, latency: float):
+        span = context.data.get('otel_span')
+
+        if span is not None:
+            span.add_event('task_created', {'captcha.task_id': str(task_id), 'captcha.latency': latency})
+
+    def on_poll(self, context: SolveContext, task_id, ready: bool):
+        span = context.data.get('otel_span')
+
+        if span is not None:
+            span.add_event('poll', {'captcha.task_id': str(task_id), 'captcha.ready': ready})
+
+    def on_retry(self, context: SolveContext, attempt: int, error: Exception):
+        span = context.data.get('otel_span')
+
+        if span is not None:
+            span.add_event('retry', {'captcha.attempt': attempt, 'captcha.error': str(error)})
+
+    def on_solve_finished(self, context: SolveContext, error: Optional[Exception]):
+        span = context.data.pop('otel_span', None)
+
+        if span is None:
+            return
+
+        span.set_attribute('captcha.attempts', context.attempts)
+        span.set_attribute('captcha.polls', context.polls)
+
+        if error is not None:
+            span.record_exception(error)
+
+            from opentelemetry.trace import Status, StatusCode
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+
+        span.end()
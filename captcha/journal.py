@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.2
+DEFAULT_MAX_AGE = 120
+
+JOURNAL_OP_CREATED = 'created'
+JOURNAL_OP_FINISHED = 'finished'
+
+JOURNAL_STATE_READY = 'ready'
+JOURNAL_STATE_FAILED = 'failed'
+
+
+def task_key(provider: str, api_key: str, task: dict) -> str:
+    """
+    Identity of a task request. Two solves with the same key would create the same task, so a pending task of one can
+    be handed to the other. The key is a digest, so neither the API key nor proxy credentials reach the journal.
+    """
+    canonical = json.dumps(task, sort_keys=True, separators=(',', ':'), default=str)
+
+    return hashlib.sha256(f'{provider}\0{api_key}\0{canonical}'.encode()).hexdigest()
+
+
+class TaskJournal:
+    """
+    Append-only record of the tasks created by this process, so tasks still being solved (and billed) when the process
+    stops are resumed after a restart instead of being created again.
+
+    Every created task is journaled with its key, and again once it is ready or has failed. On open, tasks created
+    less than ``max_age`` seconds ago that never finished become claimable: the next solve with the same key polls the
+    existing task instead of creating a new one. Older tasks are dropped, as their tokens would have expired anyway.
+
+    Records are buffered and written by a background thread every ``flush_interval`` seconds, so journaling adds no
+    I/O to the solving path. With ``fsync`` every batch is also flushed to disk, which survives power loss rather than
+    only process crashes. A ``flush_interval`` of 0 writes every record synchronously.
+    """
+
+    def __init__(self, path: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL, fsync: bool = False,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.fsync: bool = fsync
+        self.max_age: float = max_age
+
+        self._claimable: Dict[str, Deque[Tuple[object, float]]] = dict()
+        self._buffer: List[str] = list()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.recovered: int = 0
+        self.resumed: int = 0
+
+        self._recover()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+        if self.flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='captcha-task-journal', daemon=True)
+            self._thread.start()
+
+    def _recover(self):
+        created: Dict[object, dict] = dict()
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+
+                    except ValueError:
+                        # A torn last line from a crash mid-write.
+                        continue
+
+                    if record.get('op') == JOURNAL_OP_CREATED:
+                        created[record['id']] = record
+
+                    elif record.get('op') == JOURNAL_OP_FINISHED:
+                        created.pop(record['id'], None)
+
+        now = time.time()
+        pending = [record for record in created.values() if now - record['at'] < self.max_age]
+
+        for record in sorted(pending, key=lambda item: item['at']):
+            self._claimable.setdefault(record['key'], deque()).append((record['id'], record['at']))
+
+        self.recovered = len(pending)
+
+        if self.recovered:
+            logger.info(f'Recovered {self.recovered} pending tasks from {self.path}.')
+
+        # Compact the journal down to the still pending tasks, so it does not grow across restarts.
+        temp_path = f'{self.path}.tmp'
+
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for record in pending:
+                file.write(json.dumps(record) + '\n')
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, self.path)
+
+    def claim(self, key: str) -> Optional[object]:
+        """
+        :return: Id of a recovered task with the given key that is still young enough to resume, or None.
+        """
+        now = time.time()
+
+        with self._lock:
+            tasks = self._claimable.get(key)
+
+            while tasks:
+                task_id, created_at = tasks.popleft()
+
+                if now - created_at < self.max_age:
+                    self.resumed += 1
+                    return task_id
+
+            self._claimable.pop(key, None)
+
+        return None
+
+    def pending(self) -> int:
+        """
+        :return: Number of recovered tasks that have not been claimed yet.
+        """
+        with self._lock:
+            return sum(len(tasks) for tasks in self._claimable.values())
+
+    def record_created(self, key: str, task_id, provider: str, task_type: str):
+        self._append(dict(op=JOURNAL_OP_CREATED, id=task_id, key=key, provider=provider, type=task_type,
+                          at=time.time()))
+
+    def record_finished(self, task_id, state: str):
+        self._append(dict(op=JOURNAL_OP_FINISHED, id=task_id, state=state, at=time.time()))
+
+    def _append(self, record: dict):
+        line = json.dumps(record) + '\n'
+
+        with self._lock:
+            if self._closed.is_set():
+                return
+
+            self._buffer.append(line)
+
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, list()
+
+        if not lines:
+            return
+
+        with self._write_lock:
+            self._file.write(''.join(lines))
+            self._file.flush()
+
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+
+            except OSError:
+                logger.exception(f'Could not write task journal {self.path}.')
+
+    def close(self):
+        with self._lock:
+            self._closed.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
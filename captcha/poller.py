@@ -0,0 +1,161 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+DEFAULT_TICK = 0.5
+DEFAULT_MAX_WORKERS = 8
+
+
+class TaskPollerClosed(Exception):
+    pass
+
+
+class _PollEntry:
+    def __init__(self, task_id, check: Callable[[], Optional[dict]], schedule: Callable[[int, float], float]):
+        self.task_id = task_id
+        self.check: Callable[[], Optional[dict]] = check
+        self.schedule: Callable[[int, float], float] = schedule
+        self.attempt: int = 0
+        self.created_at: float = time.monotonic()
+        self.future: Future = Future()
+
+    def next_delay(self) -> float:
+        return self.schedule(self.attempt, time.monotonic() - self.created_at)
+
+
+class TaskPoller:
+    """
+    Polls any number of provider tasks from a single scheduler thread.
+
+    Due times are rounded up to a multiple of ``tick``, so tasks that become due close together are checked in the same
+    wake-up and the scheduler wakes at most once per tick however many tasks are registered. The checks themselves run
+    on a small fixed worker pool, so the number of threads does not grow with the number of in-flight tasks.
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.tick: float = tick
+        self._queue: List[Tuple[float, int, _PollEntry]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='captcha-poller')
+        self._thread: Optional[threading.Thread] = None
+        self._closed: bool = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue)
+
+    def register(self, task_id, check: Callable[[], Optional[dict]],
+                 schedule: Callable[[int, float], float]) -> Future:
+        """
+        Registers a task to be polled until it completes.
+
+        :param task_id: Provider task id, used for identification only
+        :param check: Callable doing a single result check. Returns the solution once ready, None while the task is
+            still processing, and raises if the task failed.
+        :param schedule: Callable taking the number of checks made so far and the seconds since registration, and
+            returning the seconds to wait before the next check
+        :return: Future resolved with the solution, or with the exception raised by ``check``
+        """
+        entry = _PollEntry(task_id, check, schedule)
+        self._schedule(entry, entry.next_delay())
+
+        return entry.future
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            pending = [entry for _, _, entry in self._queue]
+            self._queue.clear()
+            self._condition.notify_all()
+
+        for entry in pending:
+            entry.future.cancel()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _schedule(self, entry: _PollEntry, delay: float):
+        due = math.ceil((time.monotonic() + delay) / self.tick) * self.tick
+
+        with self._condition:
+            if self._closed:
+                raise TaskPollerClosed('Task poller has been closed.')
+
+            heapq.heappush(self._queue, (due, next(self._sequence), entry))
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='captcha-poller-scheduler', daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = time.monotonic()
+
+                    if self._queue and self._queue[0][0] <= now:
+                        break
+
+                    self._condition.wait(self._queue[0][0] - now if self._queue else None)
+
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                batch = list()
+
+                while self._queue and self._queue[0][0] <= now:
+                    batch.append(heapq.heappop(self._queue)[2])
+
+            for entry in batch:
+                if not entry.future.cancelled():
+                    self._executor.submit(self._check, entry)
+
+    def _check(self, entry: _PollEntry):
+        if entry.future.cancelled():
+            return
+
+        try:
+            entry.attempt += 1
+            solution = entry.check()
+
+        except BaseException as e:
+            self._resolve(entry.future, exception=e)
+            return
+
+        if solution is not None:
+            self._resolve(entry.future, result=solution)
+            return
+
+        try:
+            self._schedule(entry, entry.next_delay())
+
+        except TaskPollerClosed:
+            entry.future.cancel()
+
+    @staticmethod
+    def _resolve(future: Future, result: dict = None, exception: BaseException = None):
+        # The caller may cancel the future while a check is running.
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+        except InvalidStateError:
+            pass
@@ -0,0 +1,292 @@
+import atexit
+import json
+import math
+import os
+import random
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+
+class PollingStrategy(ABC):
+    """
+    Decides how long to wait before each getTaskResult call of a task.
+    """
+
+    @abstractmethod
+    def delay(self, provider: str, task_type: str, attempt: int, elapsed: float) -> float:
+        """
+        :param provider: Provider name, e.g. ``capsolver``
+        :param task_type: Provider task type, e.g. ``HCaptchaTaskProxyLess``
+        :param attempt: Number of result checks already made for the task
+        :param elapsed: Seconds since the task was created
+        :return: Seconds to wait before the next result check
+        """
+        pass
+
+    def record(self, provider: str, task_type: str, solve_time: float, pending_until: float = None):
+        """
+        Called once a task is ready, with the seconds elapsed since it was created.
+
+        :param solve_time: Seconds until the task was seen ready. When a check found it, the task finished at some
+            point since the previous check, so this is an upper bound.
+        :param pending_until: Seconds until the last check still finding the task processing, 0 if the first check
+            found it ready, or None if ``solve_time`` is exact (e.g. the result was pushed by a callback)
+        """
+        pass
+
+    def set_default_interval(self, provider: str, interval: float):
+        """
+        Called by every engine using the strategy, with the poll interval its provider recommends.
+        """
+        pass
+
+
+class FixedPolling(PollingStrategy):
+    def __init__(self, interval: float, first_delay: float = None):
+        self.interval: float = interval
+        self.first_delay: float = interval if first_delay is None else first_delay
+
+    def delay(self, provider: str, task_type: str, attempt: int, elapsed: float) -> float:
+        return self.first_delay if attempt == 0 else self.interval
+
+
+class ExponentialBackoffPolling(PollingStrategy):
+    def __init__(self, initial: float = 1, factor: float = 1.5, maximum: float = 10, jitter: float = 0.1):
+        """
+        :param initial: Delay before the first check
+        :param factor: Multiplier applied to the delay after every check
+        :param maximum: Upper bound of the delay before jitter
+        :param jitter: Relative jitter, e.g. 0.1 spreads each delay by +/-10%
+        """
+        self.initial: float = initial
+        self.factor: float = factor
+        self.maximum: float = maximum
+        self.jitter: float = jitter
+
+    def delay(self, provider: str, task_type: str, attempt: int, elapsed: float) -> float:
+        delay = min(self.maximum, self.initial * self.factor ** attempt)
+
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class SolveTimeHistogram:
+    """
+    Fixed-width histogram of solve times. Counts are halved once ``max_samples`` is reached so old observations fade
+    out and the distribution follows provider drift.
+    """
+
+    def __init__(self, bucket_width: float, bucket_count: int, max_samples: int, counts: List[int] = None):
+        self.bucket_width: float = bucket_width
+        self.max_samples: int = max_samples
+        self.counts: List[int] = list(counts) if counts is not None else [0] * bucket_count
+        self.total: int = sum(self.counts)
+
+    def add(self, value: float):
+        index = min(int(value / self.bucket_width), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.total += 1
+
+        if self.total >= self.max_samples:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, fraction: float) -> float:
+        target = fraction * self.total
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if count and seen >= target:
+                return (index + 1) * self.bucket_width
+
+        return len(self.counts) * self.bucket_width
+
+
+DEFAULT_INTERVAL = 3
+
+
+class AdaptivePolling(PollingStrategy):
+    """
+    Learns the solve-time distribution of every (provider, task type) pair and schedules checks against it: the first
+    check lands at ``first_percentile`` of the observed solve times, the following ones at the furthest of
+    ``percentiles`` within ``max_gap``, and past the last percentile checks fall back to ``interval``.
+
+    No check is ever more than ``max_gap`` seconds after the previous one, and the first one is at most ``max_gap``
+    seconds after the ``earliest_percentile`` of solve times. A finished task thus waits no longer to be seen than with
+    fixed polling at ``max_gap``, and checks are only saved where few tasks finish: before the fastest solves, and
+    where percentiles are closer than ``max_gap``.
+
+    A check only tells that a task finished between the previous check and itself, so each solve is recorded at the
+    middle of that interval. Recording when the task was seen ready would never let the learned times go down: a task
+    ready on the first check would count as taking exactly as long as the current estimate. A task ready on the first
+    check is recorded a whole ``max_gap`` earlier instead, as nothing bounds it from below.
+
+    Until ``min_samples`` solves have been seen for a pair, ``fallback`` is used, by default fixed polling at the
+    interval the provider recommends. Histograms are stored as JSON at ``path`` when given, loaded on construction and
+    saved every ``save_every`` recorded solves, on ``close()`` and at interpreter exit.
+    """
+
+    def __init__(self, path: str = None, fallback: PollingStrategy = None, first_percentile: float = 0.5,
+                 percentiles: Tuple[float, ...] = (0.65, 0.8, 0.9, 0.95, 0.99), interval: float = None,
+                 max_gap: float = None, earliest_percentile: float = 0.005, min_interval: float = 0.5,
+                 min_samples: int = 20, max_samples: int = 10000, bucket_width: float = 0.5,
+                 max_solve_time: float = 300, save_every: int = 50):
+        """
+        :param fallback: Strategy used until enough solves are recorded. Fixed at the provider's interval if None.
+        :param interval: Seconds between checks past the last percentile. The provider's interval if None.
+        :param max_gap: Maximum seconds between two checks. ``interval`` if None.
+        """
+        self.path: Optional[str] = path
+        self.fallback: Optional[PollingStrategy] = fallback
+        self.first_percentile: float = first_percentile
+        self.percentiles: Tuple[float, ...] = tuple(sorted(percentiles))
+        self.interval: Optional[float] = interval
+        self.max_gap: Optional[float] = max_gap
+        self.earliest_percentile: float = earliest_percentile
+        self.min_interval: float = min_interval
+        self.min_samples: int = min_samples
+        self.max_samples: int = max_samples
+        self.bucket_width: float = bucket_width
+        self.bucket_count: int = int(math.ceil(max_solve_time / bucket_width))
+        self.save_every: int = save_every
+
+        self._histograms: Dict[str, SolveTimeHistogram] = dict()
+        self._default_intervals: Dict[str, float] = dict()
+        self._unsaved: int = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        if path is not None:
+            if os.path.exists(path):
+                self.load()
+
+            atexit.register(self.close)
+
+    def close(self):
+        """
+        Saves the solves recorded since the last save. Called at interpreter exit too.
+        """
+        if self.path is not None:
+            atexit.unregister(self.close)
+
+            if self._unsaved:
+                self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def set_default_interval(self, provider: str, interval: float):
+        with self._lock:
+            self._default_intervals[provider] = interval
+
+    def _interval(self, provider: str) -> float:
+        return self.interval if self.interval is not None else self._default_intervals.get(provider, DEFAULT_INTERVAL)
+
+    def _max_gap(self, provider: str) -> float:
+        return self.max_gap if self.max_gap is not None else self._interval(provider)
+
+    def _fallback(self, provider: str) -> PollingStrategy:
+        return self.fallback if self.fallback is not None else FixedPolling(self._interval(provider))
+
+    @staticmethod
+    def _key(provider: str, task_type: str) -> str:
+        return f'{provider}:{task_type}'
+
+    def percentile(self, provider: str, task_type: str, fraction: float) -> Optional[float]:
+        """
+        :return: Learned solve time percentile in seconds, or None if not enough solves have been recorded.
+        """
+        with self._lock:
+            histogram = self._histograms.get(self._key(provider, task_type))
+
+            if histogram is None or histogram.total < self.min_samples:
+                return None
+
+            return histogram.percentile(fraction)
+
+    def delay(self, provider: str, task_type: str, attempt: int, elapsed: float) -> float:
+        with self._lock:
+            histogram = self._histograms.get(self._key(provider, task_type))
+
+            if histogram is None or histogram.total < self.min_samples:
+                return self._fallback(provider).delay(provider, task_type, attempt, elapsed)
+
+            interval = self._interval(provider)
+            max_gap = self._max_gap(provider)
+
+            if attempt == 0:
+                # Percentiles are bucket upper edges, the lower edge bounds the earliest solves from below.
+                earliest = histogram.percentile(self.earliest_percentile) - histogram.bucket_width
+                first = min(histogram.percentile(self.first_percentile), earliest + max_gap)
+
+                return max(self.min_interval, first - elapsed)
+
+            if histogram.percentile(self.percentiles[-1]) <= elapsed:
+                return min(max_gap, interval)
+
+            step = max_gap
+
+            for fraction in self.percentiles:
+                target = histogram.percentile(fraction)
+
+                if elapsed < target <= elapsed + max_gap:
+                    step = target - elapsed
+
+            return max(self.min_interval, step)
+
+    def record(self, provider: str, task_type: str, solve_time: float, pending_until: float = None):
+        if self.fallback is not None:
+            self.fallback.record(provider, task_type, solve_time, pending_until)
+
+        if pending_until == 0:
+            # Seen by the first check, the task may have finished long before it. Recording it a whole gap and a
+            # bucket earlier keeps pulling the first check forward while it finds more than the earliest solves done.
+            solve_time = max(0.0, solve_time - self._max_gap(provider) - self.bucket_width)
+        elif pending_until is not None:
+            solve_time = (pending_until + solve_time) / 2
+
+        with self._lock:
+            key = self._key(provider, task_type)
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = SolveTimeHistogram(self.bucket_width, self.bucket_count, self.max_samples)
+                self._histograms[key] = histogram
+
+            histogram.add(solve_time)
+            self._unsaved += 1
+            should_save = self.path is not None and self._unsaved >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            data: dict = json.load(f)
+
+        with self._lock:
+            for key, counts in data.get('histograms', dict()).items():
+                # Histograms saved with a different bucket layout cannot be reused.
+                if data.get('bucket_width') == self.bucket_width and len(counts) == self.bucket_count:
+                    self._histograms[key] = SolveTimeHistogram(self.bucket_width, self.bucket_count,
+                                                               self.max_samples, counts)
+
+    def save(self):
+        with self._lock:
+            data = dict()
+            data['bucket_width'] = self.bucket_width
+            data['histograms'] = {key: list(histogram.counts) for key, histogram in self._histograms.items()}
+            self._unsaved = 0
+
+        temp_path = f'{self.path}.tmp'
+
+        with self._save_lock:
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+
+            os.replace(temp_path, self.path)
@@ -0,0 +1,331 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Collection, Deque, Dict, Hashable, Optional, Tuple
+from .base import (BaseFunCaptchaGenerator, BaseFunCaptchaResult, BaseHCaptchaGenerator, BaseHCaptchaResult,
+                   proxy_key)
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET_SIZE = 2
+DEFAULT_TTL = 100
+DEFAULT_REFRESH_INTERVAL = 1
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_FAILURE_BACKOFF = 30
+
+
+def generator_fatal_error_codes(generator) -> Collection[str]:
+    """
+    Error codes the provider behind a generator reports for errors retrying cannot fix, e.g. a zero balance.
+    """
+    engine = getattr(generator, 'engine', None)
+
+    return engine.adapter.fatal_error_codes if engine is not None else frozenset()
+
+
+class _PoolSlot:
+    def __init__(self, solve: Callable[[], object]):
+        self.solve: Callable[[], object] = solve
+        self.tokens: Deque[Tuple[float, object]] = deque()
+        self.in_flight: int = 0
+        self.failures: int = 0
+        self.blocked_until: float = 0.0
+        self.last_used: float = time.monotonic()
+
+
+class TokenPool:
+    """
+    Keeps ``target_size`` pre-solved tokens per key and refills them in the background.
+
+    A key is registered the first time a token is requested for it (or through ``warm``). Tokens older than ``ttl``
+    seconds are evicted and replaced, and keys that have not been requested for ``idle_timeout`` seconds stop being
+    refilled so unused keys do not keep spending balance.
+
+    Keys whose refills fail ``failure_threshold`` times in a row are not refilled for ``failure_backoff`` seconds, and
+    a failure with one of ``fatal_error_codes`` stops all refills, as retrying cannot fix it. Tokens are then solved
+    on request only, so callers see the provider's errors.
+    """
+
+    def __init__(self, target_size: int = DEFAULT_TARGET_SIZE, ttl: float = DEFAULT_TTL,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT, max_workers: int = DEFAULT_MAX_WORKERS,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, failure_backoff: float = DEFAULT_FAILURE_BACKOFF,
+                 fatal_error_codes: Collection[str] = frozenset()):
+        self.target_size: int = target_size
+        self.ttl: float = ttl
+        self.refresh_interval: float = refresh_interval
+        self.idle_timeout: Optional[float] = idle_timeout
+        self.failure_threshold: int = failure_threshold
+        self.failure_backoff: float = failure_backoff
+        self.fatal_error_codes: Collection[str] = frozenset(fatal_error_codes)
+
+        self._slots: Dict[Hashable, _PoolSlot] = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='captcha-token-pool')
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._fatal_error: Optional[Exception] = None
+
+        self._hits: int = 0
+        self._misses: int = 0
+        self._expired: int = 0
+        self._failures: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def expired(self) -> int:
+        return self._expired
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def fatal_error(self) -> Optional[Exception]:
+        """
+        The error that stopped refills, or None while the pool is refilling.
+        """
+        return self._fatal_error
+
+    def size(self, key: Hashable = None) -> int:
+        """
+        :return: Number of fresh tokens held for ``key``, or for all keys when no key is given.
+        """
+        with self._lock:
+            if key is not None:
+                slot = self._slots.get(key)
+                return len(slot.tokens) if slot is not None else 0
+
+            return sum(len(slot.tokens) for slot in self._slots.values())
+
+    def close(self):
+        with self._lock:
+            self._closed.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _take(self, key: Hashable, solve: Callable[[], object]):
+        now = time.monotonic()
+
+        with self._lock:
+            slot = self._slot(key, solve)
+            slot.last_used = now
+            self._evict(slot, now)
+            token = slot.tokens.popleft()[1] if slot.tokens else None
+
+            if token is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+            self._fill(slot)
+
+        return token
+
+    def _warm(self, key: Hashable, solve: Callable[[], object]):
+        with self._lock:
+            slot = self._slot(key, solve)
+            slot.last_used = time.monotonic()
+            self._fill(slot)
+
+    def _slot(self, key: Hashable, solve: Callable[[], object]) -> _PoolSlot:
+        slot = self._slots.get(key)
+
+        if slot is None:
+            slot = _PoolSlot(solve)
+            self._slots[key] = slot
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='captcha-token-pool-refresh', daemon=True)
+            self._thread.start()
+
+        return slot
+
+    def _evict(self, slot: _PoolSlot, now: float):
+        while slot.tokens and now - slot.tokens[0][0] >= self.ttl:
+            slot.tokens.popleft()
+            self._expired += 1
+
+    def _fill(self, slot: _PoolSlot):
+        if self._closed.is_set() or self._fatal_error is not None or time.monotonic() < slot.blocked_until:
+            return
+
+        missing = self.target_size - len(slot.tokens) - slot.in_flight
+
+        for _ in range(missing):
+            slot.in_flight += 1
+            self._executor.submit(self._refill, slot)
+
+    def _refill(self, slot: _PoolSlot):
+        token = None
+        error: Optional[Exception] = None
+
+        try:
+            token = slot.solve()
+
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            slot.in_flight -= 1
+
+            if error is None:
+                slot.failures = 0
+
+                if token is not None:
+                    slot.tokens.append((time.monotonic(), token))
+
+                return
+
+            self._failures += 1
+            slot.failures += 1
+
+            if getattr(error, 'error_code', None) in self.fatal_error_codes:
+                if self._fatal_error is None:
+                    logger.error(f'Token pool stopped refilling. Reason: {error}')
+
+                self._fatal_error = error
+
+            elif slot.failures >= self.failure_threshold:
+                logger.warning(f'{slot.failures} refills failed in a row, pausing them for {self.failure_backoff}s. '
+                               f'Reason: {error}')
+                slot.blocked_until = time.monotonic() + self.failure_backoff
+
+            else:
+                logger.info(f'Token pool refill failed. Reason: {error}')
+
+    def _run(self):
+        while not self._closed.wait(self.refresh_interval):
+            now = time.monotonic()
+
+            with self._lock:
+                for key, slot in list(self._slots.items()):
+                    self._evict(slot, now)
+
+                    if self.idle_timeout is not None and now - slot.last_used >= self.idle_timeout:
+                        if not slot.tokens and not slot.in_flight:
+                            del self._slots[key]
+
+                        continue
+
+                    self._fill(slot)
+
+
+class HCaptchaTokenPool(TokenPool):
+    """
+    Token pool implementing BaseHCaptchaGenerator. Tokens are pooled per (site key, website url, proxy, invisible).
+    """
+
+    def __init__(self, generator: BaseHCaptchaGenerator, target_size: int = DEFAULT_TARGET_SIZE,
+                 ttl: float = DEFAULT_TTL, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT, max_workers: int = DEFAULT_MAX_WORKERS,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, failure_backoff: float = DEFAULT_FAILURE_BACKOFF,
+                 fatal_error_codes: Collection[str] = None):
+        """
+        :param fatal_error_codes: Error codes stopping refills. Those of the generator's provider if None.
+        """
+        super().__init__(target_size=target_size, ttl=ttl, refresh_interval=refresh_interval,
+                         idle_timeout=idle_timeout, max_workers=max_workers, failure_threshold=failure_threshold,
+                         failure_backoff=failure_backoff,
+                         fatal_error_codes=fatal_error_codes if fatal_error_codes is not None else
+                         generator_fatal_error_codes(generator))
+        self.generator: BaseHCaptchaGenerator = generator
+        self.website_url: Optional[str] = getattr(generator, 'website_url', None)
+
+    def _key(self, site_key: str, captcha_proxy: ProxyConfig, invisible: bool) -> tuple:
+        return site_key, self.website_url, proxy_key(captcha_proxy), invisible
+
+    def _solver(self, site_key: str, captcha_proxy: ProxyConfig, invisible: bool) -> Callable[[], BaseHCaptchaResult]:
+        return partial(self.generator.generate, site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible)
+
+    def warm(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False):
+        """
+        Starts filling the pool for the given parameters without taking a token.
+        """
+        self._warm(self._key(site_key, captcha_proxy, invisible), self._solver(site_key, captcha_proxy, invisible))
+
+    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+        solver = self._solver(site_key, captcha_proxy, invisible)
+        token = self._take(self._key(site_key, captcha_proxy, invisible), solver)
+
+        return token if token is not None else solver()
+
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None,
+                        invisible: bool = False) -> BaseHCaptchaResult:
+        token = self._take(self._key(site_key, captcha_proxy, invisible),
+                           self._solver(site_key, captcha_proxy, invisible))
+
+        if token is not None:
+            return token
+
+        return await self.generator.agenerate(site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible)
+
+
+class FunCaptchaTokenPool(TokenPool):
+    """
+    Token pool implementing BaseFunCaptchaGenerator. Tokens are pooled per (website url, proxy).
+    """
+
+    def __init__(self, generator: BaseFunCaptchaGenerator, target_size: int = DEFAULT_TARGET_SIZE,
+                 ttl: float = DEFAULT_TTL, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT, max_workers: int = DEFAULT_MAX_WORKERS,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, failure_backoff: float = DEFAULT_FAILURE_BACKOFF,
+                 fatal_error_codes: Collection[str] = None):
+        """
+        :param fatal_error_codes: Error codes stopping refills. Those of the generator's provider if None.
+        """
+        super().__init__(target_size=target_size, ttl=ttl, refresh_interval=refresh_interval,
+                         idle_timeout=idle_timeout, max_workers=max_workers, failure_threshold=failure_threshold,
+                         failure_backoff=failure_backoff,
+                         fatal_error_codes=fatal_error_codes if fatal_error_codes is not None else
+                         generator_fatal_error_codes(generator))
+        self.generator: BaseFunCaptchaGenerator = generator
+        self.website_url: Optional[str] = getattr(generator, 'website_url', None)
+
+    def _key(self, captcha_proxy: ProxyConfig) -> tuple:
+        return self.website_url, proxy_key(captcha_proxy)
+
+    def warm(self, captcha_proxy: ProxyConfig = None):
+        """
+        Starts filling the pool for the given proxy without taking a token.
+        """
+        self._warm(self._key(captcha_proxy), partial(self.generator.generate, captcha_proxy=captcha_proxy))
+
+    def generate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        solver = partial(self.generator.generate, captcha_proxy=captcha_proxy)
+        token = self._take(self._key(captcha_proxy), solver)
+
+        return token if token is not None else solver()
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        token = self._take(self._key(captcha_proxy), partial(self.generator.generate, captcha_proxy=captcha_proxy))
+
+        if token is not None:
+            return token
+
+        return await self.generator.agenerate(captcha_proxy=captcha_proxy)
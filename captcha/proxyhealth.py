@@ -0,0 +1,87 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Collection, Iterable, List, Optional, Union
+from .base import proxy_endpoint
+from .capsolverconstants import CAP_SOLVER_PROXY_ERROR_CODES
+from .instrumentation import SolveContext, SolveListener
+from .twocaptchaconstants import TWO_CAPTCHA_PROXY_ERROR_CODES
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+DEFAULT_SMOOTHING = 0.3
+DEFAULT_UNHEALTHY_BELOW = 0.5
+DEFAULT_MAX_PROXIES = 10000
+
+PROXY_ERROR_CODES = CAP_SOLVER_PROXY_ERROR_CODES | TWO_CAPTCHA_PROXY_ERROR_CODES
+
+
+class ProxyHealth(SolveListener):
+    """
+    Health score of every proxy tasks are sent through, fed back from task outcomes. Add it to the listeners of any
+    generator.
+
+    A proxy scores 1 until a task blames it. Every ready task pulls the score of its proxy towards 1 and every task
+    failing with a proxy error code pulls it towards 0, with an exponentially weighted moving average, so a proxy
+    recovers once it works again. Failures unrelated to the proxy (e.g. an unsolvable captcha) do not count. Only the
+    ``max_proxies`` most recently used proxies are tracked, so rotating through many proxies keeps memory bounded.
+    """
+
+    def __init__(self, smoothing: float = DEFAULT_SMOOTHING, unhealthy_below: float = DEFAULT_UNHEALTHY_BELOW,
+                 proxy_error_codes: Collection[str] = PROXY_ERROR_CODES, max_proxies: int = DEFAULT_MAX_PROXIES):
+        self.smoothing: float = smoothing
+        self.unhealthy_below: float = unhealthy_below
+        self.proxy_error_codes: Collection[str] = frozenset(proxy_error_codes)
+        self.max_proxies: int = max_proxies
+        self._scores: 'OrderedDict[tuple, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _endpoint(captcha_proxy: Union[ProxyConfig, tuple]) -> Optional[tuple]:
+        return captcha_proxy if isinstance(captcha_proxy, tuple) else proxy_endpoint(captcha_proxy)
+
+    def _record(self, endpoint: tuple, outcome: float):
+        with self._lock:
+            score = self._scores.pop(endpoint, 1.0)
+            self._scores[endpoint] = self.smoothing * outcome + (1 - self.smoothing) * score
+
+            while len(self._scores) > self.max_proxies:
+                self._scores.popitem(last=False)
+
+    def record_success(self, captcha_proxy: Union[ProxyConfig, tuple]):
+        self._record(self._endpoint(captcha_proxy), 1.0)
+
+    def record_failure(self, captcha_proxy: Union[ProxyConfig, tuple]):
+        self._record(self._endpoint(captcha_proxy), 0.0)
+
+    def score(self, captcha_proxy: Union[ProxyConfig, tuple]) -> float:
+        """
+        :return: Health between 0 and 1 of a proxy, or of the endpoint tuple returned by ``base.proxy_endpoint``.
+        """
+        with self._lock:
+            return self._scores.get(self._endpoint(captcha_proxy), 1.0)
+
+    def is_healthy(self, captcha_proxy: Union[ProxyConfig, tuple]) -> bool:
+        return self.score(captcha_proxy) >= self.unhealthy_below
+
+    def rank(self, proxies: Iterable[ProxyConfig]) -> List[ProxyConfig]:
+        """
+        :return: The given proxies, healthiest first. Proxies with the same score keep their order.
+        """
+        return sorted(proxies, key=lambda captcha_proxy: -self.score(captcha_proxy))
+
+    def unhealthy(self) -> List[tuple]:
+        """
+        :return: Endpoints of the tracked proxies scoring below ``unhealthy_below``.
+        """
+        with self._lock:
+            return [endpoint for endpoint, score in self._scores.items() if score < self.unhealthy_below]
+
+    def on_task_ready(self, context: SolveContext, task_id, elapsed: float):
+        if context.proxy is not None:
+            self._record(context.proxy, 1.0)
+
+    def on_task_failed(self, context: SolveContext, task_id, error: Exception):
+        if context.proxy is not None and getattr(error, 'error_code', None) in self.proxy_error_codes:
+            self._record(context.proxy, 0.0)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Deque, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class TokenBucket:
+    """
+    Token bucket allowing ``rate`` calls per second with bursts of up to ``burst`` calls. A rate of None disables the
+    limit. Callers reserve a token up front and then wait for it, so waiters are served in arrival order in both sync
+    and async code.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: int = None):
+        self.rate: Optional[float] = rate
+        self.burst: int = burst if burst is not None else max(1, int(rate or 1))
+        self._tokens: float = float(self.burst)
+        self._updated_at: float = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.calls: int = 0
+        self.throttled: int = 0
+        self.wait_seconds: float = 0.0
+
+    def _reserve(self) -> float:
+        with self._lock:
+            self.calls += 1
+
+            if self.rate is None:
+                return 0.0
+
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0.0
+
+            wait = -self._tokens / self.rate
+            self.throttled += 1
+            self.wait_seconds += wait
+
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        import asyncio
+
+        wait = self._reserve()
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ConcurrencyGovernor:
+    """
+    Limits the number of solves in flight. Sync and async callers share the same limit; released slots are handed to
+    waiting coroutines first and then to waiting threads. A limit of None disables the governor.
+    """
+
+    def __init__(self, max_in_flight: Optional[int] = None):
+        self.max_in_flight: Optional[int] = max_in_flight
+        self.in_flight: int = 0
+        self.waits: int = 0
+        self._condition = threading.Condition()
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def acquire(self):
+        with self._condition:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                self.waits += 1
+
+                while self.in_flight >= self.max_in_flight:
+                    self._condition.wait()
+
+            self.in_flight += 1
+
+    async def aacquire(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        with self._condition:
+            if self.max_in_flight is None or self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return
+
+            self.waits += 1
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+
+        try:
+            await waiter[1]
+
+        except asyncio.CancelledError:
+            with self._condition:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+                    raise
+
+            # The slot was handed over before the cancellation landed.
+            self.release()
+            raise
+
+    def release(self):
+        with self._condition:
+            while self._async_waiters:
+                loop, future = self._async_waiters.popleft()
+
+                if not future.cancelled():
+                    # The slot is handed over as is, so in_flight does not change.
+                    loop.call_soon_threadsafe(self._wake, future)
+                    return
+
+            self.in_flight -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+
+        try:
+            yield
+
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+
+        try:
+            yield
+
+        finally:
+            self.release()
+
+
+class ProviderLimiter:
+    """
+    Rate limits for the createTask and getTaskResult endpoints of a provider, plus a limit on solves in flight.
+    """
+
+    def __init__(self, create_rate: float = None, create_burst: int = None, poll_rate: float = None,
+                 poll_burst: int = None, max_in_flight: int = None):
+        """
+        :param create_rate: Maximum createTask calls per second
+        :param create_burst: Maximum burst of createTask calls
+        :param poll_rate: Maximum getTaskResult calls per second
+        :param poll_burst: Maximum burst of getTaskResult calls
+        :param max_in_flight: Maximum number of solves in progress at once
+        """
+        self.create: TokenBucket = TokenBucket(create_rate, create_burst)
+        self.poll: TokenBucket = TokenBucket(poll_rate, poll_burst)
+        self.governor: ConcurrencyGovernor = ConcurrencyGovernor(max_in_flight)
+
+    def metrics(self) -> dict:
+        metrics = dict()
+        metrics['create_calls'] = self.create.calls
+        metrics['create_throttled'] = self.create.throttled
+        metrics['create_wait_seconds'] = self.create.wait_seconds
+        metrics['poll_calls'] = self.poll.calls
+        metrics['poll_throttled'] = self.poll.throttled
+        metrics['poll_wait_seconds'] = self.poll.wait_seconds
+        metrics['in_flight'] = self.governor.in_flight
+        metrics['in_flight_waits'] = self.governor.waits
+
+        return metrics
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = dict()
+_limiters_lock = threading.Lock()
+
+
+def configure_limiter(provider: str, api_key: str, create_rate: float = None, create_burst: int = None,
+                      poll_rate: float = None, poll_burst: int = None, max_in_flight: int = None) -> ProviderLimiter:
+    """
+    Sets the limits shared by every generator of ``provider`` using ``api_key`` in this process. Generators created
+    before this call keep the limiter they already hold.
+    """
+    limiter = ProviderLimiter(create_rate=create_rate, create_burst=create_burst, poll_rate=poll_rate,
+                              poll_burst=poll_burst, max_in_flight=max_in_flight)
+
+    with _limiters_lock:
+        _limiters[(provider, api_key)] = limiter
+
+    return limiter
+
+
+def get_limiter(provider: str, api_key: str) -> ProviderLimiter:
+    """
+    Returns the limiter shared by every generator of ``provider`` using ``api_key``. Unless configured through
+    configure_limiter, the limiter has no limits and only collects metrics.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get((provider, api_key))
+
+        if limiter is None:
+            limiter = ProviderLimiter()
+            _limiters[(provider, api_key)] = limiter
+
+        return limiter
@@ -0,0 +1,145 @@
+"""
+Registry building generators from plain configuration, such as a parsed JSON or TOML section::
+
+    generator = create_generator(dict(provider='2captcha', kind='hcaptcha', api_key='...',
+                                      website_url='https://example.com', site_key='...', pool=dict(target_size=4)))
+
+Provider modules are only imported when a generator of theirs is created, and none of them imports an HTTP stack
+before its first network call, so short lived jobs pay only for what they use.
+"""
+import threading
+from typing import Callable, Dict, List, Mapping, Tuple
+from .base import KIND_FUN_CAPTCHA, KIND_H_CAPTCHA
+
+PROVIDER_CAP_SOLVER = 'capsolver'
+PROVIDER_TWO_CAPTCHA = '2captcha'
+PROVIDER_BROKER = 'broker'
+
+CONFIG_KEY_PROVIDER = 'provider'
+CONFIG_KEY_KIND = 'kind'
+CONFIG_KEY_POOL = 'pool'
+CONFIG_KEY_OPTIONS = 'options'
+
+HANDLER_OPTIONS = ('session', 'pool_size', 'async_session', 'rate_limiter', 'listeners', 'base_url', 'request_timeout')
+
+GeneratorFactory = Callable[[Mapping], object]
+
+_factories: Dict[Tuple[str, str], GeneratorFactory] = dict()
+_lock = threading.Lock()
+
+
+def register_provider(provider: str, kind: str, factory: GeneratorFactory):
+    """
+    Registers the factory building generators of a kind of captcha for a provider, replacing any previous one.
+
+    :param factory: Called with the whole configuration. Import the provider module inside it to keep it lazy.
+    """
+    with _lock:
+        _factories[(provider, kind)] = factory
+
+
+def providers() -> List[Tuple[str, str]]:
+    """
+    :return: The registered (provider, kind) pairs
+    """
+    with _lock:
+        return sorted(_factories)
+
+
+def create_generator(config: Mapping):
+    """
+    Builds a generator from its configuration. Besides the keys read by the provider's factory:
+
+    - ``provider``: Registered provider name, e.g. ``capsolver``, ``2captcha`` or ``broker``
+    - ``kind``: ``hcaptcha`` (default) or ``funcaptcha``
+    - ``options``: Extra keyword arguments of the generator, e.g. a polling strategy
+    - ``pool``: Keeps pre-solved tokens when given, either a target size or the keyword arguments of the token pool
+
+    :raises ValueError: If no factory is registered for the provider and kind, or a required key is missing
+    """
+    provider = config.get(CONFIG_KEY_PROVIDER)
+    kind = config.get(CONFIG_KEY_KIND, KIND_H_CAPTCHA)
+
+    with _lock:
+        factory = _factories.get((provider, kind))
+
+    if factory is None:
+        raise (ValueError(f'No generator registered for provider "{provider}" and kind "{kind}".'))
+
+    generator = factory(config)
+    pool = config.get(CONFIG_KEY_POOL)
+
+    if pool is None:
+        return generator
+
+    from .pool import FunCaptchaTokenPool, HCaptchaTokenPool
+
+    pool_options = pool if isinstance(pool, Mapping) else dict(target_size=pool)
+    pool_type = HCaptchaTokenPool if kind == KIND_H_CAPTCHA else FunCaptchaTokenPool
+
+    return pool_type(generator, **pool_options)
+
+
+def _required(config: Mapping, key: str):
+    value = config.get(key)
+
+    if value is None:
+        raise (ValueError(f'Provider "{config.get(CONFIG_KEY_PROVIDER)}" requires "{key}".'))
+
+    return value
+
+
+def _handler_options(config: Mapping) -> dict:
+    return {key: config[key] for key in HANDLER_OPTIONS if config.get(key) is not None}
+
+
+def _cap_solver_hcaptcha(config: Mapping):
+    from .capsolver import CapSolverHCaptchaGenerator
+
+    return CapSolverHCaptchaGenerator(_required(config, 'api_key'), _required(config, 'website_url'),
+                                      **_handler_options(config), **config.get(CONFIG_KEY_OPTIONS, dict()))
+
+
+def _two_captcha_request_handler(config: Mapping):
+    from .twocaptcha import RequestHandler
+
+    return config.get('request_handler') or RequestHandler(_required(config, 'api_key'), **_handler_options(config))
+
+
+def _two_captcha_hcaptcha(config: Mapping):
+    from .twocaptcha import TwoCapchaHCaptchaGenerator
+
+    return TwoCapchaHCaptchaGenerator(_two_captcha_request_handler(config), _required(config, 'website_url'),
+                                      _required(config, 'site_key'), **config.get(CONFIG_KEY_OPTIONS, dict()))
+
+
+def _two_captcha_funcaptcha(config: Mapping):
+    from .twocaptcha import TwoCapchaFunCaptchaGenerator
+
+    return TwoCapchaFunCaptchaGenerator(_two_captcha_request_handler(config), _required(config, 'website_url'),
+                                        _required(config, 'public_key'), **config.get(CONFIG_KEY_OPTIONS, dict()))
+
+
+def _broker_client(config: Mapping):
+    from .brokerclient import DEFAULT_CLIENT_TIMEOUT, BrokerClient
+
+    return BrokerClient(_required(config, 'address'), timeout=config.get('timeout', DEFAULT_CLIENT_TIMEOUT))
+
+
+def _broker_hcaptcha(config: Mapping):
+    from .brokerclient import BrokerHCaptchaGenerator
+
+    return BrokerHCaptchaGenerator(_broker_client(config))
+
+
+def _broker_funcaptcha(config: Mapping):
+    from .brokerclient import BrokerFunCaptchaGenerator
+
+    return BrokerFunCaptchaGenerator(_broker_client(config))
+
+
+register_provider(PROVIDER_CAP_SOLVER, KIND_H_CAPTCHA, _cap_solver_hcaptcha)
+register_provider(PROVIDER_TWO_CAPTCHA, KIND_H_CAPTCHA, _two_captcha_hcaptcha)
+register_provider(PROVIDER_TWO_CAPTCHA, KIND_FUN_CAPTCHA, _two_captcha_funcaptcha)
+register_provider(PROVIDER_BROKER, KIND_H_CAPTCHA, _broker_hcaptcha)
+register_provider(PROVIDER_BROKER, KIND_FUN_CAPTCHA, _broker_funcaptcha)
@@ -0,0 +1,93 @@
+import copy
+from typing import Collection, FrozenSet, Iterable, Optional
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed solve is attempted again, and how long to wait before doing so.
+
+    An attempt is one created task. Errors whose code is fatal (e.g. an invalid key or a zero balance) are never
+    retried. When ``fatal_error_codes`` is None the providers' own list of fatal codes is used. When
+    ``retryable_error_codes`` is given, only those codes and errors without a code (e.g. unexpected HTTP status codes)
+    are retried.
+    """
+
+    def __init__(self, max_attempts: int = 1, backoff: float = 1, backoff_factor: float = 2, max_backoff: float = 30,
+                 deadline: Optional[float] = None, fatal_error_codes: Iterable[str] = None,
+                 retryable_error_codes: Iterable[str] = None):
+        """
+        :param max_attempts: Maximum number of tasks created for a single solve
+        :param backoff: Seconds to wait before the first retry
+        :param backoff_factor: Multiplier applied to the wait after every retry
+        :param max_backoff: Upper bound of the wait between retries
+        :param deadline: Seconds after which a solve is given up, including time spent polling
+        :param fatal_error_codes: Provider error codes that are never retried
+        :param retryable_error_codes: Provider error codes that are retried. All non fatal codes if not given.
+        """
+        self.max_attempts: int = max_attempts
+        self.backoff: float = backoff
+        self.backoff_factor: float = backoff_factor
+        self.max_backoff: float = max_backoff
+        self.deadline: Optional[float] = deadline
+        self.fatal_error_codes: Optional[FrozenSet[str]] = \
+            frozenset(fatal_error_codes) if fatal_error_codes is not None else None
+        self.retryable_error_codes: Optional[FrozenSet[str]] = \
+            frozenset(retryable_error_codes) if retryable_error_codes is not None else None
+
+    def is_retryable(self, error_code: Optional[str], provider_fatal_error_codes: Collection[str] = ()) -> bool:
+        fatal_error_codes = self.fatal_error_codes if self.fatal_error_codes is not None else provider_fatal_error_codes
+
+        if error_code in fatal_error_codes:
+            return False
+
+        if self.retryable_error_codes is None or error_code is None:
+            return True
+
+        return error_code in self.retryable_error_codes
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        :param attempt: Number of attempts made so far
+        :return: Seconds to wait before the next attempt
+        """
+        return min(self.max_backoff, self.backoff * self.backoff_factor ** (attempt - 1))
+
+    def remaining(self, elapsed: float) -> Optional[float]:
+        """
+        :return: Seconds left until the deadline, or None if the policy has no deadline.
+        """
+        if self.deadline is None:
+            return None
+
+        return max(0.0, self.deadline - elapsed)
+
+    def with_deadline(self, deadline: Optional[float]) -> 'RetryPolicy':
+        """
+        :return: A copy of this policy whose deadline is at most ``deadline`` seconds, or this policy if None.
+        """
+        if deadline is None:
+            return self
+
+        policy = copy.copy(self)
+        policy.deadline = deadline if self.deadline is None else min(self.deadline, deadline)
+
+        return policy
+
+    def deadline_exceeded(self, elapsed: float) -> bool:
+        return self.deadline is not None and elapsed >= self.deadline
+
+    def should_retry(self, attempt: int, error_code: Optional[str], elapsed: float,
+                     provider_fatal_error_codes: Collection[str] = ()) -> bool:
+        """
+        :param attempt: Number of attempts made so far
+        :param error_code: Provider error code of the failed attempt, if any
+        :param elapsed: Seconds since the solve started
+        :param provider_fatal_error_codes: Fatal error codes of the provider, used unless overridden by the policy
+        """
+        if attempt >= self.max_attempts:
+            return False
+
+        if not self.is_retryable(error_code, provider_fatal_error_codes):
+            return False
+
+        return not self.deadline_exceeded(elapsed + self.backoff_delay(attempt))
@@ -0,0 +1,268 @@
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, List, Optional, Sequence
+from .base import BaseFunCaptchaGenerator, BaseFunCaptchaResult, BaseHCaptchaGenerator, BaseHCaptchaResult
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+DEFAULT_WINDOW = 200
+DEFAULT_SMOOTHING = 0.2
+DEFAULT_ERROR_PENALTY = 4
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_MIN_SAMPLES = 10
+DEFAULT_MAX_WORKERS = 32
+
+
+class ProviderScore:
+    """
+    Live latency and error rate of a single generator, smoothed with an exponentially weighted moving average.
+    A lower score is better. Generators without samples score 0 so every generator gets tried, while generators that
+    have only ever failed are ranked last.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, smoothing: float = DEFAULT_SMOOTHING,
+                 error_penalty: float = DEFAULT_ERROR_PENALTY):
+        self.smoothing: float = smoothing
+        self.error_penalty: float = error_penalty
+        self.latency: Optional[float] = None
+        self.error_rate: float = 0.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+            self.latency = latency if self.latency is None else \
+                self.smoothing * latency + (1 - self.smoothing) * self.latency
+            self.error_rate = (1 - self.smoothing) * self.error_rate
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate = self.smoothing + (1 - self.smoothing) * self.error_rate
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+
+            ordered = sorted(self._latencies)
+
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def score(self) -> float:
+        with self._lock:
+            if self.latency is None:
+                return 0.0 if self.error_rate == 0 else float('inf')
+
+            return self.latency * (1 + self.error_penalty * self.error_rate)
+
+
+class GeneratorRouter:
+    """
+    Sends every solve to the generator with the best live score and fails over to the next one on error.
+
+    With hedging enabled, once the chosen generator has been running longer than its ``hedge_percentile`` latency
+    (or ``hedge_after`` seconds when given) a second solve is started on the next best generator and whichever token
+    comes back first is returned. Without ``hedge_after``, no hedge is sent until the chosen generator has recorded
+    ``min_samples`` solves. Sync generators cannot be interrupted, so the losing sync solve finishes in the background
+    and its token is discarded; losing async solves are cancelled.
+    """
+
+    def __init__(self, generators: Sequence, hedge: bool = False, hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 hedge_after: float = None, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 max_workers: int = DEFAULT_MAX_WORKERS, window: int = DEFAULT_WINDOW,
+                 smoothing: float = DEFAULT_SMOOTHING, error_penalty: float = DEFAULT_ERROR_PENALTY):
+        if not generators:
+            raise ValueError('At least one generator is required.')
+
+        self.generators: list = list(generators)
+        self.hedge: bool = hedge
+        self.hedge_percentile: float = hedge_percentile
+        self.hedge_after: Optional[float] = hedge_after
+        self.min_samples: int = min_samples
+        self.scores: List[ProviderScore] = [ProviderScore(window, smoothing, error_penalty) for _ in self.generators]
+        self._executor: Optional[ThreadPoolExecutor] = \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='captcha-router') if hedge else None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _ranked(self) -> List[int]:
+        return sorted(range(len(self.generators)), key=lambda index: self.scores[index].score())
+
+    def _hedge_delay(self, index: int) -> Optional[float]:
+        if self.hedge_after is not None:
+            return self.hedge_after
+
+        score = self.scores[index]
+
+        if score.samples < self.min_samples:
+            return None
+
+        return score.percentile(self.hedge_percentile)
+
+    def _attempt(self, index: int, call: Callable):
+        started_at = time.monotonic()
+
+        try:
+            result = call(self.generators[index])
+
+        except Exception:
+            self.scores[index].record_failure()
+            raise
+
+        self.scores[index].record_success(time.monotonic() - started_at)
+
+        return result
+
+    async def _aattempt(self, index: int, call: Callable[[object], Awaitable]):
+        import asyncio
+
+        started_at = time.monotonic()
+
+        try:
+            result = await call(self.generators[index])
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception:
+            self.scores[index].record_failure()
+            raise
+
+        self.scores[index].record_success(time.monotonic() - started_at)
+
+        return result
+
+    def _solve(self, call: Callable):
+        remaining = self._ranked()
+        last_error: Optional[Exception] = None
+
+        if not self.hedge:
+            for index in remaining:
+                try:
+                    return self._attempt(index, call)
+
+                except Exception as e:
+                    last_error = e
+
+            raise last_error
+
+        primary = remaining[0]
+        pending = {self._executor.submit(self._attempt, remaining.pop(0), call)}
+        hedged = False
+
+        while pending:
+            timeout = self._hedge_delay(primary) if remaining and not hedged else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                pending.add(self._executor.submit(self._attempt, remaining.pop(0), call))
+                hedged = True
+                continue
+
+            for future in done:
+                try:
+                    return future.result()
+
+                except Exception as e:
+                    last_error = e
+
+            if not pending and remaining:
+                pending.add(self._executor.submit(self._attempt, remaining.pop(0), call))
+
+        raise last_error
+
+    async def _asolve(self, call: Callable[[object], Awaitable]):
+        import asyncio
+
+        remaining = self._ranked()
+        last_error: Optional[Exception] = None
+
+        if not self.hedge:
+            for index in remaining:
+                try:
+                    return await self._aattempt(index, call)
+
+                except Exception as e:
+                    last_error = e
+
+            raise last_error
+
+        primary = remaining[0]
+        pending = {asyncio.ensure_future(self._aattempt(remaining.pop(0), call))}
+        hedged = False
+
+        try:
+            while pending:
+                timeout = self._hedge_delay(primary) if remaining and not hedged else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    pending.add(asyncio.ensure_future(self._aattempt(remaining.pop(0), call)))
+                    hedged = True
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+
+                    last_error = task.exception()
+
+                if not pending and remaining:
+                    pending.add(asyncio.ensure_future(self._aattempt(remaining.pop(0), call)))
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+
+class RoutedHCaptchaGenerator(GeneratorRouter):
+    """
+    Routes hCaptcha solves across several generators. All generators are called by keyword, so generators that take
+    the site key on construction must also accept it as a ``site_key`` keyword.
+    """
+
+    def __init__(self, generators: Sequence[BaseHCaptchaGenerator], **kwargs):
+        super().__init__(generators, **kwargs)
+
+    def generate(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+        return self._solve(
+            lambda generator: generator.generate(site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible))
+
+    async def agenerate(self, site_key: str, captcha_proxy: ProxyConfig = None,
+                        invisible: bool = False) -> BaseHCaptchaResult:
+        return await self._asolve(
+            lambda generator: generator.agenerate(site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible))
+
+
+class RoutedFunCaptchaGenerator(GeneratorRouter):
+    """
+    Routes FunCaptcha solves across several generators.
+    """
+
+    def __init__(self, generators: Sequence[BaseFunCaptchaGenerator], **kwargs):
+        super().__init__(generators, **kwargs)
+
+    def generate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        return self._solve(lambda generator: generator.generate(captcha_proxy=captcha_proxy))
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        return await self._asolve(lambda generator: generator.agenerate(captcha_proxy=captcha_proxy))
@@ -0,0 +1,237 @@
+from __future__ import annotations
+import json as json_module
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Optional
+from .instrumentation import SolveEvents
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 30
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """
+    Creates a session with a keep-alive connection pool that can hold up to ``pool_size`` connections per host.
+
+    :param pool_size: Maximum number of connections kept alive per host
+    :return: New session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def endpoint_name(url: str) -> str:
+    return url.rsplit('/', 1)[-1]
+
+
+class HTTPTransport:
+    """
+    Thin wrapper around a pooled ``requests.Session``. The underlying connection pool is thread-safe, so a single
+    transport can be shared by every thread using the same generator or request handler. The session is created on
+    the first request, so building generators does not import requests.
+    """
+
+    def __init__(self, session: requests.Session = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT, provider: str = None, events: SolveEvents = None):
+        # Injected sessions belong to the caller and are left open on close().
+        self._owns_session: bool = session is None
+        self._session: Optional[requests.Session] = session
+        self._session_lock = threading.Lock()
+        self.pool_size: int = pool_size
+        self.timeout: Optional[float] = timeout
+        self.provider: Optional[str] = provider
+        self.events: SolveEvents = events if events is not None else SolveEvents()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = create_session(self.pool_size)
+
+        return self._session
+
+    @property
+    def transient_errors(self) -> tuple:
+        """
+        :return: Exceptions of requests failing before any response, which are worth retrying
+        """
+        import requests
+
+        return requests.ConnectionError, requests.Timeout
+
+    def post(self, url: str, json: dict) -> requests.Response:
+        started_at = time.monotonic()
+        response = self.session.post(url, json=json, timeout=self.timeout)
+
+        if self.events:
+            self.events.emit('on_http_response', self.provider, endpoint_name(url), response.status_code,
+                             time.monotonic() - started_at)
+
+        return response
+
+    def close(self):
+        if self._owns_session and self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncResponse:
+    """
+    Minimal response object mirroring the parts of ``requests.Response`` the providers use, so response handling can
+    be shared between the sync and async code paths.
+    """
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code: int = status_code
+        self.content: bytes = content
+
+    def json(self):
+        return json_module.loads(self.content)
+
+
+async def _close_with_loop(session):
+    """
+    Async generator closing a session when its loop shuts down. ``asyncio.run`` closes the async generators still
+    running before it closes the loop, so the session gets closed while the loop can still run its cleanup.
+    """
+    try:
+        yield
+
+    finally:
+        await session.close()
+
+
+class AsyncHTTPTransport:
+    """
+    Async counterpart of HTTPTransport backed by ``aiohttp``. Client sessions are created lazily, one per event loop, so
+    the transport can be constructed outside of a running event loop and used from successive ``asyncio.run`` calls.
+    A session is closed by ``close()`` or when ``asyncio.run`` finishes its loop. An injected session is always used
+    as is.
+    """
+
+    def __init__(self, session=None, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT, provider: str = None, events: SolveEvents = None):
+        self._owns_session: bool = session is None
+        self._session = session
+        # Session of each loop, with the generator closing it. Keyed weakly, so a finished loop is not kept alive.
+        self._sessions: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+        self._sessions_lock = threading.Lock()
+        self.pool_size: int = pool_size
+        self.timeout: Optional[float] = timeout
+        self.provider: Optional[str] = provider
+        self.events: SolveEvents = events if events is not None else SolveEvents()
+
+    async def get_session(self):
+        """
+        :return: The injected session, or the session of the running loop
+        """
+        if not self._owns_session:
+            return self._session
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        with self._sessions_lock:
+            session, _ = self._sessions.get(loop, (None, None))
+
+            if session is not None and not session.closed:
+                return session
+
+            self._discard_stale_sessions()
+            session = self._create_session()
+            closer = _close_with_loop(session)
+            self._sessions[loop] = (session, closer)
+
+        # Runs the generator up to its yield, which registers it with the loop's shutdown.
+        await closer.asend(None)
+
+        return session
+
+    def _create_session(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError(
+                'aiohttp is required for async support. Install with "captcha-provider[async]".') from e
+
+        connector = aiohttp.TCPConnector(limit=self.pool_size)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def _discard_stale_sessions(self):
+        # Sessions of loops closed without shutting down their async generators cannot be closed anymore. Detaching
+        # marks them closed, which stops aiohttp from reporting them.
+        for loop, (session, _) in list(self._sessions.items()):
+            if loop.is_closed() or session.closed:
+                del self._sessions[loop]
+                session.detach()
+
+    @property
+    def transient_errors(self) -> tuple:
+        """
+        :return: Exceptions of requests failing before any response, which are worth retrying
+        """
+        import asyncio
+        import aiohttp
+
+        return aiohttp.ClientConnectionError, asyncio.TimeoutError
+
+    async def post(self, url: str, json: dict) -> AsyncResponse:
+        started_at = time.monotonic()
+
+        session = await self.get_session()
+
+        async with session.post(url, json=json) as response:
+            result = AsyncResponse(response.status, await response.read())
+
+        if self.events:
+            self.events.emit('on_http_response', self.provider, endpoint_name(url), result.status_code,
+                             time.monotonic() - started_at)
+
+        return result
+
+    async def close(self):
+        """
+        Closes the session of the running loop. Sessions of finished loops are discarded, and those of loops still
+        running elsewhere must be closed from their own loop.
+        """
+        if not self._owns_session:
+            return
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        with self._sessions_lock:
+            session, closer = self._sessions.pop(loop, (None, None))
+            self._discard_stale_sessions()
+
+        if closer is not None:
+            await closer.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -1,17 +1,37 @@
-import json
-import time
-import requests
+from __future__ import annotations
+import concurrent.futures
+import logging
 from . import twocaptchaconstants as const
-from .base import BaseFunCaptchaResult, BaseHCaptchaResult
-from typing import Optional, TypeVar
-from proxy import ProxyConfig
+from .balance import BalanceMonitor, SolveBudget
+from .base import BaseFunCaptchaResult, BaseHCaptchaResult, intern_user_agent, proxy_key
+from .engine import (TASK_STATE_PROCESSING, TASK_STATE_READY, ProviderAdapter, ProviderClient, SolvingEngine,
+                     TaskFragmentCache)
+from .handle import CancelToken, SolveHandle, submit_solve
+from .instrumentation import SolveEvents, SolveListener
+from .journal import TaskJournal
+from .poller import TaskPoller
+from .polling import PollingStrategy
+from .ratelimit import ProviderLimiter
+from .retry import RetryPolicy
+from .transport import DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT
+from typing import TYPE_CHECKING, Iterable, Mapping, Optional, TypeVar
 from abc import ABC, abstractmethod
+from functools import partial
+
+if TYPE_CHECKING:
+    import requests
+    from proxy import ProxyConfig
+    from .callback import CallbackReceiver
+
+logger = logging.getLogger(__name__)
 
 TwoCaptchaResultT = TypeVar('TwoCaptchaResultT', bound='TwoCaptchaResult')
 
 
 class TwoCaptchaException(Exception):
-    pass
+    def __init__(self, *args, error_code: str = None):
+        super().__init__(*args)
+        self.error_code: Optional[str] = error_code
 
 
 class TwoCaptchaRequestProcessing(TwoCaptchaException):
@@ -22,57 +42,79 @@ class TwoCaptchaRequestFailed(TwoCaptchaException):
     pass
 
 
-def generate_request_proxy_dict(proxy_config: ProxyConfig) -> dict:
-    new_dict = dict()
-    # TODO: Improve this to include other protocols
-    new_dict[const.TWO_CAPTCHA_TASK_KEY_PROXY_TYPE] = 'http'
-
-    new_dict[const.TWO_CAPTCHA_TASK_KEY_PROXY_ADDRESS] = proxy_config.hostname
-    new_dict[const.TWO_CAPTCHA_TASK_KEY_PROXY_PORT] = proxy_config.port
-
-    if proxy_config.has_username():
-        new_dict[const.TWO_CAPTCHA_TASK_KEY_PROXY_USERNAME] = proxy_config.username
-
-    if proxy_config.has_password():
-        new_dict[const.TWO_CAPTCHA_TASK_KEY_PROXY_PASSWORD] = proxy_config.password
+TWO_CAPTCHA_ADAPTER = ProviderAdapter(
+    name=const.TWO_CAPTCHA_PROVIDER_NAME,
+    base_url=const.TWO_CAPTCHA_URL_BASE,
+    create_task_path=const.TWO_CAPTCHA_PATH_CREATE_TASK,
+    check_result_path=const.TWO_CAPTCHA_PATH_CHECK_RESULT,
+    balance_path=const.TWO_CAPTCHA_PATH_GET_BALANCE,
+    failed_exception=TwoCaptchaRequestFailed,
+    processing_exception=TwoCaptchaRequestProcessing,
+    request_key_api_token=const.TWO_CAPTCHA_REQUEST_KEY_API_TOKEN,
+    request_key_task=const.TWO_CAPTCHA_REQUEST_KEY_TASK,
+    request_key_task_id=const.TWO_CAPTCHA_REQUEST_KEY_TASK_ID,
+    request_key_callback_url=const.TWO_CAPTCHA_REQUEST_KEY_CALLBACK_URL,
+    response_key_error_id=const.TWO_CAPTCHA_RESPONSE_KEY_ERROR_ID,
+    response_key_error_code=const.TWO_CAPTCHA_RESPONSE_KEY_ERROR_CODE,
+    response_key_task_id=const.TWO_CAPTCHA_RESPONSE_KEY_TASK_ID,
+    response_key_status=const.TWO_CAPTCHA_RESPONSE_KEY_STATUS,
+    response_key_solution=const.TWO_CAPTCHA_RESPONSE_KEY_SOLUTION,
+    response_key_balance=const.TWO_CAPTCHA_RESPONSE_KEY_BALANCE,
+    statuses={
+        const.TWO_CAPTCHA_RESPONSE_STATUS_PROCESSING: TASK_STATE_PROCESSING,
+        const.TWO_CAPTCHA_RESPONSE_STATUS_READY: TASK_STATE_READY,
+    },
+    task_key_captcha_type=const.TWO_CAPTCHA_TASK_KEY_CAPTCHA_TYPE,
+    task_key_website_url=const.TWO_CAPTCHA_TASK_KEY_WEBSITE_URL,
+    task_key_proxy_type=const.TWO_CAPTCHA_TASK_KEY_PROXY_TYPE,
+    task_key_proxy_address=const.TWO_CAPTCHA_TASK_KEY_PROXY_ADDRESS,
+    task_key_proxy_port=const.TWO_CAPTCHA_TASK_KEY_PROXY_PORT,
+    task_key_proxy_username=const.TWO_CAPTCHA_TASK_KEY_PROXY_USERNAME,
+    task_key_proxy_password=const.TWO_CAPTCHA_TASK_KEY_PROXY_PASSWORD,
+    fatal_error_codes=const.TWO_CAPTCHA_FATAL_ERROR_CODES,
+    zero_balance_error_codes=const.TWO_CAPTCHA_ZERO_BALANCE_ERROR_CODES,
+    proxy_types=const.TWO_CAPTCHA_PROXY_TYPES,
+    proxy_error_codes=const.TWO_CAPTCHA_PROXY_ERROR_CODES,
+    poll_interval=3,
+)
 
-    return new_dict
 
+def generate_request_proxy_dict(proxy_config: ProxyConfig) -> dict:
+    return TWO_CAPTCHA_ADAPTER.proxy_fields(proxy_config)
 
-class RequestHandler:
-    def __init__(self, api_token: str):
-        self.api_token: str = api_token
 
-    def _create_base_request_body(self) -> dict:
-        request_data = dict()
-        request_data[const.TWO_CAPTCHA_REQUEST_KEY_API_TOKEN] = self.api_token
+class RequestHandler(ProviderClient):
+    def __init__(self, api_token: str, session: requests.Session = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 async_session=None, rate_limiter: ProviderLimiter = None, listeners: Iterable[SolveListener] = None,
+                 base_url: str = const.TWO_CAPTCHA_URL_BASE,
+                 request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT):
+        """
+        :param api_token: 2Captcha API key
+        :param session: Optional session to send requests with. Injected sessions are not closed by close().
+        :param pool_size: Maximum number of keep-alive connections when no session is provided
+        :param async_session: Optional ``aiohttp.ClientSession`` used by the async methods
+        :param rate_limiter: Limits to apply. Defaults to the limiter shared by all handlers using the same API key.
+        :param listeners: Listeners notified of every HTTP response, and of every solve phase of generators using
+            this handler unless they are given their own listeners
+        :param base_url: API root, e.g. to point the handler at a local stub server
+        :param request_timeout: Seconds to wait for each HTTP response, None to wait forever
+        """
+        super().__init__(TWO_CAPTCHA_ADAPTER, api_token, session=session, pool_size=pool_size,
+                         async_session=async_session, rate_limiter=rate_limiter, listeners=listeners, base_url=base_url,
+                         request_timeout=request_timeout)
 
-        return request_data
+    @property
+    def api_token(self) -> str:
+        return self.api_key
 
-    def create_task(self, task_details: dict) -> int:
+    def create_task(self, task_details: dict, callback_url: str = None) -> int:
         """
         Creates a task on 2Captcha, and returns the task number. Does not wait for task to complete.
         :param task_details: Task configuration data
+        :param callback_url: Url 2Captcha posts the result to once the task finishes. Must be registered on the account.
         :return: 2Captcha task number
         """
-        request_data = self._create_base_request_body()
-        request_data[const.TWO_CAPTCHA_REQUEST_KEY_TASK] = task_details
-
-        response = requests.post(const.TWO_CAPTCHA_URL_CREATE_TASK, json=request_data)
-
-        if response.status_code < 200 or response.status_code > 299:
-            raise (TwoCaptchaRequestFailed(
-                f'Create task request did not return 2XX code. Status code: {response.status_code}'))
-
-        response_json = response.json()
-
-        response_code = response_json[const.TWO_CAPTCHA_RESPONSE_KEY_ERROR_ID]
-
-        if response_code != 0:
-            print(json.dumps(response_json, sort_keys=True, indent=4))
-            raise (TwoCaptchaRequestFailed(f'Error occurred while creating task. Error id: {response_code}'))
-
-        return response_json[const.TWO_CAPTCHA_RESPONSE_KEY_TASK_ID]
+        return super().create_task(task_details, callback_url=callback_url)
 
     def get_result(self, task_id: int) -> dict:
         """
@@ -83,52 +125,61 @@ class RequestHandler:
         :except TwoCaptchaRequestFailed: Raised if the task failed
         :except TwoCaptchaRequestProcessing: Raised if the task is still being processed
         """
-        request_data = self._create_base_request_body()
-        request_data[const.TWO_CAPTCHA_REQUEST_KEY_TASK_ID] = task_id
-
-        response = requests.post(const.TWO_CAPTCHA_URL_CHECK_RESULT, json=request_data)
-
-        if response.status_code < 200 or response.status_code > 299:
-            raise (TwoCaptchaException(
-                f'Create task request did not return 2XX code. Status code: {response.status_code}'))
-
-        response_json = response.json()
-
-        response_code = response_json[const.TWO_CAPTCHA_RESPONSE_KEY_ERROR_ID]
-
-        if response_code != 0:
-            print(json.dumps(response_json, sort_keys=True, indent=4))
-            raise (TwoCaptchaRequestFailed(f'Error id: {response_code}'))
-
-        status = response_json[const.TWO_CAPTCHA_RESPONSE_KEY_STATUS]
-
-        if status == const.TWO_CAPTCHA_RESPONSE_STATUS_PROCESSING:
-            raise (TwoCaptchaRequestProcessing(f'Request still processing. Task id: {task_id}'))
-
-        return response_json.get(const.TWO_CAPTCHA_RESPONSE_KEY_SOLUTION)
+        return super().get_result(task_id)
 
 
 class TwoCaptchaResult:
-    def __init__(self, raw_solution: dict):
-        self.raw_solution: dict = raw_solution
+    __slots__ = ()
+
+    @property
+    def raw_solution(self) -> Optional[dict]:
+        """
+        The solution as returned by 2Captcha, or None if the generator was created with keep_raw_solution=False.
+        """
+        return self._raw_solution
 
 
 class TwoCaptchaGenerator(ABC):
-    def __init__(self, request_handler: RequestHandler, website_url: str, max_auto_retry: int = 0):
+    """
+    Generators are safe to share between threads and coroutines. They hold no per-call state: every call builds its own
+    task dict and solve context, and everything shared (the request handler, the fragment cache, the engine and its
+    poller, polling strategy, journal and limiters) is thread safe. Sharing one generator, rather than building one per
+    thread, also shares its connection pool and caches.
+    """
+
+    def __init__(self, request_handler: RequestHandler, website_url: str, max_auto_retry: int = 0,
+                 poller: TaskPoller = None, polling_strategy: PollingStrategy = None, retry_policy: RetryPolicy = None,
+                 listeners: Iterable[SolveListener] = None, journal: TaskJournal = None,
+                 keep_raw_solution: bool = True, balance_monitor: BalanceMonitor = None,
+                 task_costs: Mapping[str, float] = None, callback_receiver: CallbackReceiver = None):
+        """
+        :param max_auto_retry: Number of times a failed task is recreated. Ignored if retry_policy is given.
+        :param listeners: Listeners notified of every solve phase. Defaults to the listeners of the request handler.
+        :param journal: Journal of created tasks, used to resume tasks left pending by a previous run
+        :param keep_raw_solution: Keep the provider solution on results. Disable to shrink results held in pools.
+        :param balance_monitor: Balance of the account. Solves are rejected without a request once it runs low.
+        :param task_costs: Price of a task by task type, needed to enforce the max_cost of a SolveBudget
+        :param callback_receiver: Receiver of 2Captcha pingbacks. Solves wait for the pushed result and only poll as a
+            fallback. Its callback url must be registered on the 2Captcha account.
+        """
         self.request_handler: RequestHandler = request_handler
         self.website_url: str = website_url
         self.auto_retry: int = max_auto_retry
-
-        # TODO: Type should be provided by subclass. No need to be stored on superclass.
-        self.type: Optional[str] = None
+        self.keep_raw_solution: bool = keep_raw_solution
+        self.task_fragments: TaskFragmentCache = TaskFragmentCache()
+        self.engine: SolvingEngine = SolvingEngine(
+            request_handler, poller=poller, polling_strategy=polling_strategy,
+            retry_policy=retry_policy if retry_policy is not None else RetryPolicy(max_attempts=max_auto_retry + 1),
+            events=SolveEvents(listeners) if listeners is not None else None, journal=journal,
+            balance_monitor=balance_monitor, task_costs=task_costs, callback_receiver=callback_receiver)
 
     @abstractmethod
     def _process_solution(self, solution: dict) -> TwoCaptchaResultT:
         pass
 
-    def _generate_task_dict(self, additional_params: dict = None) -> dict:
+    def _generate_task_dict(self, captcha_type: str, additional_params: dict = None) -> dict:
         new_dict = dict()
-        new_dict[const.TWO_CAPTCHA_TASK_KEY_CAPTCHA_TYPE] = self.type
+        new_dict[const.TWO_CAPTCHA_TASK_KEY_CAPTCHA_TYPE] = captcha_type
         new_dict[const.TWO_CAPTCHA_TASK_KEY_WEBSITE_URL] = self.website_url
 
         if additional_params is not None:
@@ -136,57 +187,57 @@ class TwoCaptchaGenerator(ABC):
 
         return new_dict
 
-    def _get_solution(self, additional_params: dict = None) -> TwoCaptchaResultT:
-        # TODO: Better retry handling
-        solution = None
-
-        while solution is None:
-            task_id = self.request_handler.create_task(self._generate_task_dict(additional_params))
-            print(f'Task created. Id: {task_id}')
-
-            while True:
-                try:
-                    solution = self.request_handler.get_result(task_id)
-                    break
+    def _get_solution(self, task_dict: dict, budget: SolveBudget = None) -> TwoCaptchaResultT:
+        return self._solve(task_dict, budget=budget)
 
-                except TwoCaptchaRequestProcessing:
-                    print(f'Request "{task_id}" is still being processed. Will retry in 3 seconds.')
-                    time.sleep(3)
-                    continue
+    def _submit(self, task_dict: dict, executor: Optional[concurrent.futures.Executor],
+                budget: SolveBudget = None) -> SolveHandle:
+        return submit_solve(partial(self._solve, task_dict, budget=budget), executor)
 
-                except TwoCaptchaRequestFailed as e:
-                    print(f'{e}')
-                    break
+    def _solve(self, task_dict: dict, cancel_token: CancelToken = None,
+               budget: SolveBudget = None) -> TwoCaptchaResultT:
+        return self.engine.solve(task_dict, self._process_solution, cancel_token, budget)
 
-            # TODO: Implement auto retry
-
-        return self._process_solution(solution)
+    async def _aget_solution(self, task_dict: dict, budget: SolveBudget = None) -> TwoCaptchaResultT:
+        return await self.engine.asolve(task_dict, self._process_solution, budget)
 
 
 class TwoCapchaFunCaptchaResult(BaseFunCaptchaResult, TwoCaptchaResult):
-    def __init__(self, raw_solution: dict):
-        token: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_FUN_CAPTCHA_TOKEN]
+    __slots__ = ('_raw_solution',)
 
-        BaseFunCaptchaResult.__init__(self, token)
-        TwoCaptchaResult.__init__(self, raw_solution)
+    def __init__(self, raw_solution: dict, keep_raw_solution: bool = True):
+        self._token: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_FUN_CAPTCHA_TOKEN]
+        self._raw_solution: Optional[dict] = raw_solution if keep_raw_solution else None
 
 
 class TwoCapchaFunCaptchaGenerator(TwoCaptchaGenerator):
     def __init__(self, request_handler: RequestHandler, website_url: str, captcha_public_key: str,
-                 user_agent: str = None, captcha_subdomain: str = None):
-        super().__init__(request_handler, website_url)
+                 user_agent: str = None, captcha_subdomain: str = None, max_auto_retry: int = 0,
+                 poller: TaskPoller = None, polling_strategy: PollingStrategy = None, retry_policy: RetryPolicy = None,
+                 listeners: Iterable[SolveListener] = None, journal: TaskJournal = None,
+                 keep_raw_solution: bool = True, balance_monitor: BalanceMonitor = None,
+                 task_costs: Mapping[str, float] = None, callback_receiver: CallbackReceiver = None):
+        super().__init__(request_handler, website_url, max_auto_retry=max_auto_retry, poller=poller,
+                         polling_strategy=polling_strategy, retry_policy=retry_policy, listeners=listeners,
+                         journal=journal, keep_raw_solution=keep_raw_solution, balance_monitor=balance_monitor,
+                         task_costs=task_costs, callback_receiver=callback_receiver)
         self.captcha_public_key: str = captcha_public_key
         self.user_agent: Optional[str] = user_agent
         self.captcha_subdomain: Optional[str] = captcha_subdomain
 
     def _process_solution(self, solution: dict) -> TwoCapchaFunCaptchaResult:
-        return TwoCapchaFunCaptchaResult(solution)
+        return TwoCapchaFunCaptchaResult(solution, self.keep_raw_solution)
+
+    def _generate_task(self, captcha_proxy: ProxyConfig = None) -> dict:
+        return self.task_fragments.get(
+            (self.captcha_public_key, self.captcha_subdomain, self.user_agent, proxy_key(captcha_proxy)),
+            partial(self._build_task, captcha_proxy))
 
-    def generate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+    def _build_task(self, captcha_proxy: ProxyConfig = None) -> dict:
         if captcha_proxy is None:
-            self.type = const.TWO_CAPTCHA_TASK_TYPE_FUN_CAPTCHA
+            captcha_type = const.TWO_CAPTCHA_TASK_TYPE_FUN_CAPTCHA
         else:
-            self.type = const.TWO_CAPTCHA_TASK_TYPE_FUN_CAPTCHA_PROXY
+            captcha_type = const.TWO_CAPTCHA_TASK_TYPE_FUN_CAPTCHA_PROXY
 
         additional_params = dict()
 
@@ -201,36 +252,79 @@ class TwoCapchaFunCaptchaGenerator(TwoCaptchaGenerator):
         if captcha_proxy is not None:
             additional_params.update(generate_request_proxy_dict(captcha_proxy))
 
-        return self._get_solution(additional_params)
+        return self._generate_task_dict(captcha_type, additional_params)
+
+    def generate(self, captcha_proxy: ProxyConfig = None, budget: SolveBudget = None) -> BaseFunCaptchaResult:
+        """
+        :param budget: Maximum cost and latency of this solve
+        """
+        return self._get_solution(self._generate_task(captcha_proxy), budget)
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None, budget: SolveBudget = None) -> BaseFunCaptchaResult:
+        return await self._aget_solution(self._generate_task(captcha_proxy), budget)
+
+    def submit(self, captcha_proxy: ProxyConfig = None, executor: concurrent.futures.Executor = None,
+               budget: SolveBudget = None) -> SolveHandle:
+        """
+        Starts solving in the background and returns immediately. The token is collected with ``result()`` on the
+        returned handle.
+
+        :param executor: Executor to run the solve on. Defaults to an executor shared by all generators.
+        """
+        return self._submit(self._generate_task(captcha_proxy), executor, budget)
 
 
 class TwoCapchaHCaptchaResult(BaseHCaptchaResult, TwoCaptchaResult):
-    def __init__(self, raw_solution):
-        response_key: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_RESPONSE_KEY]
-        request_key: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_REQUEST_KEY]
-        user_agent: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_USER_AGENT]
+    __slots__ = ('_raw_solution',)
 
-        BaseHCaptchaResult.__init__(self, response_key, request_key, user_agent)
-        TwoCaptchaResult.__init__(self, raw_solution)
+    def __init__(self, raw_solution: dict, keep_raw_solution: bool = True):
+        self._response_key: str = raw_solution[const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_RESPONSE_KEY]
+        self._raw_solution: Optional[dict] = raw_solution if keep_raw_solution else None
+
+        # Without the raw solution the remaining fields cannot be parsed on access, so they are extracted now.
+        if not keep_raw_solution:
+            self._request_key: Optional[str] = raw_solution.get(const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_REQUEST_KEY)
+            self._user_agent: Optional[str] = \
+                intern_user_agent(raw_solution.get(const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_USER_AGENT))
+
+    def _parse_request_key(self) -> Optional[str]:
+        return self._raw_solution.get(const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_REQUEST_KEY)
+
+    def _parse_user_agent(self) -> Optional[str]:
+        return self._raw_solution.get(const.TWO_CAPTCHA_RESPONSE_H_CAPTCHA_USER_AGENT)
 
 
 class TwoCapchaHCaptchaGenerator(TwoCaptchaGenerator):
-    def __init__(self, request_handler: RequestHandler, website_url: str, site_key: str):
-        super().__init__(request_handler, website_url)
+    def __init__(self, request_handler: RequestHandler, website_url: str, site_key: str, max_auto_retry: int = 0,
+                 poller: TaskPoller = None, polling_strategy: PollingStrategy = None, retry_policy: RetryPolicy = None,
+                 listeners: Iterable[SolveListener] = None, journal: TaskJournal = None,
+                 keep_raw_solution: bool = True, balance_monitor: BalanceMonitor = None,
+                 task_costs: Mapping[str, float] = None, callback_receiver: CallbackReceiver = None):
+        super().__init__(request_handler, website_url, max_auto_retry=max_auto_retry, poller=poller,
+                         polling_strategy=polling_strategy, retry_policy=retry_policy, listeners=listeners,
+                         journal=journal, keep_raw_solution=keep_raw_solution, balance_monitor=balance_monitor,
+                         task_costs=task_costs, callback_receiver=callback_receiver)
         self.site_key = site_key
 
     def _process_solution(self, solution: dict) -> TwoCapchaHCaptchaResult:
-        return TwoCapchaHCaptchaResult(solution)
+        return TwoCapchaHCaptchaResult(solution, self.keep_raw_solution)
+
+    def _generate_task(self, captcha_proxy: ProxyConfig = None, invisible: bool = False, site_key: str = None) -> dict:
+        if site_key is None:
+            site_key = self.site_key
 
-    def generate(self, captcha_proxy: ProxyConfig = None, invisible: bool = False) -> BaseHCaptchaResult:
+        return self.task_fragments.get((site_key, proxy_key(captcha_proxy), invisible),
+                                       partial(self._build_task, captcha_proxy, invisible, site_key))
+
+    def _build_task(self, captcha_proxy: ProxyConfig, invisible: bool, site_key: str) -> dict:
         if captcha_proxy is None:
-            self.type = const.TWO_CAPTCHA_TASK_TYPE_H_CAPTCHA
+            captcha_type = const.TWO_CAPTCHA_TASK_TYPE_H_CAPTCHA
         else:
-            self.type = const.TWO_CAPTCHA_TASK_TYPE_H_CAPTCHA_PROXY
+            captcha_type = const.TWO_CAPTCHA_TASK_TYPE_H_CAPTCHA_PROXY
 
         additional_params = dict()
 
-        additional_params[const.TWO_CAPTCHA_TASK_H_CAPTCHA_SITE_KEY] = self.site_key
+        additional_params[const.TWO_CAPTCHA_TASK_H_CAPTCHA_SITE_KEY] = site_key
 
         if invisible is True:
             additional_params[const.TWO_CAPTCHA_TASK_H_CAPTCHA_INVISIBLE] = True
@@ -238,4 +332,27 @@ class TwoCapchaHCaptchaGenerator(TwoCaptchaGenerator):
         if captcha_proxy is not None:
             additional_params.update(generate_request_proxy_dict(captcha_proxy))
 
-        return self._get_solution(additional_params)
+        return self._generate_task_dict(captcha_type, additional_params)
+
+    def generate(self, captcha_proxy: ProxyConfig = None, invisible: bool = False, site_key: str = None,
+                 budget: SolveBudget = None) -> BaseHCaptchaResult:
+        """
+        :param site_key: Overrides the site key given on construction. Lets the generator be called by keyword like
+            any BaseHCaptchaGenerator.
+        :param budget: Maximum cost and latency of this solve
+        """
+        return self._get_solution(self._generate_task(captcha_proxy, invisible, site_key), budget)
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None, invisible: bool = False, site_key: str = None,
+                        budget: SolveBudget = None) -> BaseHCaptchaResult:
+        return await self._aget_solution(self._generate_task(captcha_proxy, invisible, site_key), budget)
+
+    def submit(self, captcha_proxy: ProxyConfig = None, invisible: bool = False, site_key: str = None,
+               executor: concurrent.futures.Executor = None, budget: SolveBudget = None) -> SolveHandle:
+        """
+        Starts solving in the background and returns immediately. The token is collected with ``result()`` on the
+        returned handle.
+
+        :param executor: Executor to run the solve on. Defaults to an executor shared by all generators.
+        """
+        return self._submit(self._generate_task(captcha_proxy, invisible, site_key), executor, budget)
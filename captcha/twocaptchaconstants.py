@@ -1,17 +1,29 @@
+# Provider
+TWO_CAPTCHA_PROVIDER_NAME = '2captcha'
+
 # URLS
-TWO_CAPTCHA_URL_CREATE_TASK = 'https://api.2captcha.com/createTask'
-TWO_CAPTCHA_URL_CHECK_RESULT = 'https://api.2captcha.com/getTaskResult'
+TWO_CAPTCHA_URL_BASE = 'https://api.2captcha.com'
+TWO_CAPTCHA_PATH_CREATE_TASK = '/createTask'
+TWO_CAPTCHA_PATH_CHECK_RESULT = '/getTaskResult'
+TWO_CAPTCHA_PATH_GET_BALANCE = '/getBalance'
+
+TWO_CAPTCHA_URL_CREATE_TASK = TWO_CAPTCHA_URL_BASE + TWO_CAPTCHA_PATH_CREATE_TASK
+TWO_CAPTCHA_URL_CHECK_RESULT = TWO_CAPTCHA_URL_BASE + TWO_CAPTCHA_PATH_CHECK_RESULT
+TWO_CAPTCHA_URL_GET_BALANCE = TWO_CAPTCHA_URL_BASE + TWO_CAPTCHA_PATH_GET_BALANCE
 
 # Generic request keys
 TWO_CAPTCHA_REQUEST_KEY_API_TOKEN = 'clientKey'
 TWO_CAPTCHA_REQUEST_KEY_TASK = 'task'
 TWO_CAPTCHA_REQUEST_KEY_TASK_ID = 'taskId'
+TWO_CAPTCHA_REQUEST_KEY_CALLBACK_URL = 'callbackUrl'
 
 # Generic response keys
 TWO_CAPTCHA_RESPONSE_KEY_ERROR_ID = 'errorId'
+TWO_CAPTCHA_RESPONSE_KEY_ERROR_CODE = 'errorCode'
 TWO_CAPTCHA_RESPONSE_KEY_TASK_ID = 'taskId'
 TWO_CAPTCHA_RESPONSE_KEY_STATUS = 'status'
 TWO_CAPTCHA_RESPONSE_KEY_SOLUTION = 'solution'
+TWO_CAPTCHA_RESPONSE_KEY_BALANCE = 'balance'
 
 TWO_CAPTCHA_RESPONSE_STATUS_PROCESSING = 'processing'
 TWO_CAPTCHA_RESPONSE_STATUS_READY = 'ready'
@@ -23,6 +35,14 @@ TWO_CAPTCHA_TASK_KEY_PROXY_PORT = 'proxyPort'
 TWO_CAPTCHA_TASK_KEY_PROXY_USERNAME = 'proxyLogin'
 TWO_CAPTCHA_TASK_KEY_PROXY_PASSWORD = 'proxyPassword'
 
+# Proxy types by proxy protocol. 2Captcha has no https type; HTTPS proxies are reached with CONNECT like HTTP ones.
+TWO_CAPTCHA_PROXY_TYPES = {
+    'http': 'http',
+    'https': 'http',
+    'socks4': 'socks4',
+    'socks5': 'socks5',
+}
+
 # Generic task keys
 TWO_CAPTCHA_TASK_KEY_CAPTCHA_TYPE = 'type'
 TWO_CAPTCHA_TASK_KEY_WEBSITE_URL = 'websiteURL'
@@ -48,3 +68,27 @@ TWO_CAPTCHA_RESPONSE_H_CAPTCHA_RESPONSE_KEY = 'token'
 TWO_CAPTCHA_RESPONSE_H_CAPTCHA_REQUEST_KEY = 'respKey'
 TWO_CAPTCHA_RESPONSE_H_CAPTCHA_USER_AGENT = 'userAgent'
 
+# Error codes that will fail again if the task is recreated
+TWO_CAPTCHA_FATAL_ERROR_CODES = frozenset((
+    'ERROR_KEY_DOES_NOT_EXIST',
+    'ERROR_WRONG_USER_KEY',
+    'ERROR_ZERO_BALANCE',
+    'ERROR_IP_NOT_ALLOWED',
+    'ERROR_IP_BANNED',
+    'ERROR_TASK_NOT_SUPPORTED',
+    'ERROR_BAD_PARAMETERS',
+    'ERROR_PAGEURL',
+    'ERROR_PROXY_FORMAT',
+))
+
+# Error codes meaning the account has run out of funds
+TWO_CAPTCHA_ZERO_BALANCE_ERROR_CODES = frozenset((
+    'ERROR_ZERO_BALANCE',
+))
+
+# Error codes blaming the proxy a task was sent through
+TWO_CAPTCHA_PROXY_ERROR_CODES = frozenset((
+    'ERROR_PROXY_CONNECTION_FAILED',
+    'ERROR_BAD_PROXY',
+    'ERROR_PROXY_FORMAT',
+))
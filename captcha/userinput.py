@@ -1,5 +1,9 @@
+from __future__ import annotations
 from .base import BaseFunCaptchaResult
-from proxy import ProxyConfig
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
 
 
 class UserInputFunCaptchaGenrator:
@@ -7,3 +11,10 @@ class UserInputFunCaptchaGenrator:
         token = input('Token: ')
 
         return BaseFunCaptchaResult(token)
+
+    async def agenerate(self, captcha_proxy: ProxyConfig = None) -> BaseFunCaptchaResult:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, self.generate, captcha_proxy)
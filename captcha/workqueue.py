@@ -0,0 +1,496 @@
+from __future__ import annotations
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from .base import KIND_FUN_CAPTCHA, KIND_H_CAPTCHA, BaseFunCaptchaGenerator, BaseHCaptchaGenerator
+from .brokerclient import decode_proxy, decode_result, encode_proxy, encode_result
+
+if TYPE_CHECKING:
+    from proxy import ProxyConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE = 600
+DEFAULT_IDLE_INTERVAL = 0.2
+DEFAULT_RESULT_POLL_INTERVAL = 0.2
+DEFAULT_PROCESSES = 2
+DEFAULT_THREADS_PER_PROCESS = 8
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class WorkQueueException(Exception):
+    pass
+
+
+class SolveRequestFailed(WorkQueueException):
+    def __init__(self, *args, error_code: str = None):
+        super().__init__(*args)
+        self.error_code: Optional[str] = error_code
+
+
+class SolveRequestUnknown(WorkQueueException):
+    pass
+
+
+class SolveRequest:
+    """
+    A solve waiting in the queue. ``params`` are passed as keywords to the generator of ``kind``.
+
+    Requests and outcomes are stored as JSON, like broker messages, so a shared store never unpickles what another
+    process wrote.
+    """
+
+    def __init__(self, kind: str, params: dict, request_id: str = None):
+        self.request_id: str = request_id if request_id is not None else uuid.uuid4().hex
+        self.kind: str = kind
+        self.params: dict = params
+
+    def encode(self) -> bytes:
+        params = dict(self.params)
+        params['captcha_proxy'] = encode_proxy(params.get('captcha_proxy'))
+
+        new_dict = dict()
+        new_dict['id'] = self.request_id
+        new_dict['kind'] = self.kind
+        new_dict['params'] = params
+
+        return json.dumps(new_dict).encode()
+
+    @classmethod
+    def decode(cls, payload: bytes) -> SolveRequest:
+        data = json.loads(payload)
+        params = data['params']
+        params['captcha_proxy'] = decode_proxy(params.get('captcha_proxy'))
+
+        return cls(data['kind'], params, data['id'])
+
+
+class SolveOutcome:
+    """
+    Final state of a request as stored by the backend: either the generator result or the error that ended the solve.
+    """
+
+    def __init__(self, result=None, error: str = None, error_code: str = None):
+        self.result = result
+        self.error: Optional[str] = error
+        self.error_code: Optional[str] = error_code
+
+    def encode(self, kind: str) -> bytes:
+        new_dict = dict()
+        new_dict['kind'] = kind
+        new_dict['result'] = encode_result(kind, self.result) if self.result is not None else None
+        new_dict['error'] = self.error
+        new_dict['error_code'] = self.error_code
+
+        return json.dumps(new_dict).encode()
+
+    @classmethod
+    def decode(cls, data: bytes) -> SolveOutcome:
+        outcome = json.loads(data)
+        result = outcome['result']
+
+        return cls(decode_result(outcome['kind'], result) if result is not None else None, outcome['error'],
+                   outcome['error_code'])
+
+
+class QueueBackend(ABC):
+    """
+    Queue of solve requests plus the store their outcomes land in, shared by producers and every worker process.
+
+    Implementations must be picklable, as they are handed to worker processes, and must make ``claim`` atomic across
+    processes and hosts. A claimed request whose lease expires before it completes is handed out again, so a worker
+    that dies mid-solve does not lose the request.
+    """
+
+    @abstractmethod
+    def put(self, request_id: str, payload: bytes):
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease: float) -> Optional[Tuple[str, bytes]]:
+        """
+        :return: The id and payload of the oldest claimable request, or None if the queue is empty.
+        """
+        pass
+
+    @abstractmethod
+    def complete(self, request_id: str, status: str, outcome: bytes):
+        pass
+
+    @abstractmethod
+    def fetch(self, request_id: str) -> Optional[Tuple[str, Optional[bytes]]]:
+        """
+        :return: The status and outcome of a request, or None if the request is unknown.
+        """
+        pass
+
+    @abstractmethod
+    def purge(self, older_than: float) -> int:
+        """
+        Deletes finished requests completed more than ``older_than`` seconds ago.
+
+        :return: Number of deleted requests
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(QueueBackend):
+    """
+    Queue backend stored in a single SQLite database, so producers and workers on one machine share it without any
+    outside service. Every thread uses its own connection and the database runs in WAL mode so readers do not block
+    the worker claiming the next request.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        """
+        :param path: Database file, created if missing
+        :param timeout: Seconds to wait for a lock held by another process
+        """
+        self.path: str = os.path.abspath(path)
+        self.timeout: float = timeout
+        self._local = threading.local()
+        self._create_schema()
+
+    def __getstate__(self):
+        return dict(path=self.path, timeout=self.timeout)
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.timeout = state['timeout']
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+
+        return connection
+
+    def _create_schema(self):
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS solve_requests ('
+            'id TEXT PRIMARY KEY, '
+            'status TEXT NOT NULL, '
+            'payload BLOB NOT NULL, '
+            'outcome BLOB, '
+            'worker_id TEXT, '
+            'lease_until REAL, '
+            'created_at REAL NOT NULL, '
+            'finished_at REAL)')
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS solve_requests_claim ON solve_requests (status, created_at)')
+
+    def put(self, request_id: str, payload: bytes):
+        self._connection().execute(
+            'INSERT INTO solve_requests (id, status, payload, created_at) VALUES (?, ?, ?, ?)',
+            (request_id, STATUS_PENDING, payload, time.time()))
+
+    def claim(self, worker_id: str, lease: float) -> Optional[Tuple[str, bytes]]:
+        connection = self._connection()
+        now = time.time()
+
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same request.
+        connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            row = connection.execute(
+                'SELECT id, payload FROM solve_requests '
+                'WHERE status = ? OR (status = ? AND lease_until < ?) '
+                'ORDER BY created_at LIMIT 1',
+                (STATUS_PENDING, STATUS_RUNNING, now)).fetchone()
+
+            if row is not None:
+                connection.execute(
+                    'UPDATE solve_requests SET status = ?, worker_id = ?, lease_until = ? WHERE id = ?',
+                    (STATUS_RUNNING, worker_id, now + lease, row[0]))
+
+            connection.execute('COMMIT')
+
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        return (row[0], row[1]) if row is not None else None
+
+    def complete(self, request_id: str, status: str, outcome: bytes):
+        self._connection().execute(
+            'UPDATE solve_requests SET status = ?, outcome = ?, lease_until = NULL, finished_at = ? WHERE id = ?',
+            (status, outcome, time.time(), request_id))
+
+    def fetch(self, request_id: str) -> Optional[Tuple[str, Optional[bytes]]]:
+        row = self._connection().execute(
+            'SELECT status, outcome FROM solve_requests WHERE id = ?', (request_id,)).fetchone()
+
+        return (row[0], row[1]) if row is not None else None
+
+    def purge(self, older_than: float) -> int:
+        cursor = self._connection().execute(
+            'DELETE FROM solve_requests WHERE status IN (?, ?) AND finished_at < ?',
+            (STATUS_DONE, STATUS_FAILED, time.time() - older_than))
+
+        return cursor.rowcount
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class SolveQueue:
+    """
+    Producer side of the work queue. Requests are enqueued with ``submit_*`` and their results collected, from any
+    process sharing the backend, with ``result``.
+    """
+
+    def __init__(self, backend: QueueBackend):
+        self.backend: QueueBackend = backend
+
+    def submit(self, request: SolveRequest) -> str:
+        self.backend.put(request.request_id, request.encode())
+
+        return request.request_id
+
+    def submit_hcaptcha(self, site_key: str, captcha_proxy: ProxyConfig = None, invisible: bool = False,
+                        request_id: str = None) -> str:
+        """
+        :return: Id of the request, used to collect its result
+        """
+        params = dict(site_key=site_key, captcha_proxy=captcha_proxy, invisible=invisible)
+
+        return self.submit(SolveRequest(KIND_H_CAPTCHA, params, request_id))
+
+    def submit_funcaptcha(self, captcha_proxy: ProxyConfig = None, request_id: str = None) -> str:
+        """
+        :return: Id of the request, used to collect its result
+        """
+        return self.submit(SolveRequest(KIND_FUN_CAPTCHA, dict(captcha_proxy=captcha_proxy), request_id))
+
+    def status(self, request_id: str) -> Optional[str]:
+        row = self.backend.fetch(request_id)
+
+        return row[0] if row is not None else None
+
+    def result(self, request_id: str, timeout: float = None, poll_interval: float = DEFAULT_RESULT_POLL_INTERVAL):
+        """
+        Waits for a request to finish and returns the generator result.
+
+        :raises TimeoutError: If the request is still unfinished after ``timeout`` seconds
+        :raises SolveRequestFailed: If the solve failed
+        :raises SolveRequestUnknown: If no request has this id, e.g. because it was purged
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            row = self.backend.fetch(request_id)
+
+            if row is None:
+                raise (SolveRequestUnknown(f'Unknown solve request "{request_id}".'))
+
+            status, outcome = row
+
+            if status in (STATUS_DONE, STATUS_FAILED):
+                outcome = SolveOutcome.decode(outcome)
+
+                if status == STATUS_FAILED:
+                    raise (SolveRequestFailed(outcome.error, error_code=outcome.error_code))
+
+                return outcome.result
+
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                raise (TimeoutError(f'Solve request "{request_id}" is still {status}.'))
+
+            time.sleep(poll_interval)
+
+
+class SolverWorker:
+    """
+    Claims requests from the backend and runs them through the generators built by the factories. Each process builds
+    its generators once, so their connection pools, rate limiters and pollers are shared by all its threads.
+    """
+
+    def __init__(self, backend: QueueBackend,
+                 hcaptcha_factory: Callable[[], BaseHCaptchaGenerator] = None,
+                 funcaptcha_factory: Callable[[], BaseFunCaptchaGenerator] = None,
+                 lease: float = DEFAULT_LEASE, idle_interval: float = DEFAULT_IDLE_INTERVAL):
+        """
+        :param hcaptcha_factory: Builds the generator solving hCaptcha requests. The generator is called with
+            ``site_key``, ``captcha_proxy`` and ``invisible`` keywords.
+        :param funcaptcha_factory: Builds the generator solving FunCaptcha requests
+        :param lease: Seconds a claimed request stays assigned to a worker. Must exceed the longest solve.
+        :param idle_interval: Seconds to wait before checking an empty queue again
+        """
+        self.backend: QueueBackend = backend
+        self.hcaptcha_factory: Optional[Callable[[], BaseHCaptchaGenerator]] = hcaptcha_factory
+        self.funcaptcha_factory: Optional[Callable[[], BaseFunCaptchaGenerator]] = funcaptcha_factory
+        self.lease: float = lease
+        self.idle_interval: float = idle_interval
+        self._generators: dict = dict()
+        self._generators_lock = threading.Lock()
+
+    def _generator(self, kind: str):
+        with self._generators_lock:
+            generator = self._generators.get(kind)
+
+            if generator is None:
+                factory = self.hcaptcha_factory if kind == KIND_H_CAPTCHA else \
+                    self.funcaptcha_factory if kind == KIND_FUN_CAPTCHA else None
+
+                if factory is None:
+                    raise (WorkQueueException(f'No generator configured for "{kind}" requests.'))
+
+                generator = factory()
+                self._generators[kind] = generator
+
+            return generator
+
+    def process(self, request: SolveRequest) -> SolveOutcome:
+        try:
+            result = self._generator(request.kind).generate(**request.params)
+
+        except Exception as e:
+            logger.info(f'Solve request "{request.request_id}" failed. Reason: {e}')
+            return SolveOutcome(error=str(e) or type(e).__name__, error_code=getattr(e, 'error_code', None))
+
+        return SolveOutcome(result=result)
+
+    def run_once(self, worker_id: str) -> bool:
+        """
+        Claims and solves a single request.
+
+        :return: False if the queue was empty
+        """
+        claimed = self.backend.claim(worker_id, self.lease)
+
+        if claimed is None:
+            return False
+
+        request_id, payload = claimed
+
+        try:
+            request = SolveRequest.decode(payload)
+
+        except (KeyError, TypeError, ValueError) as e:
+            self.backend.complete(request_id, STATUS_FAILED,
+                                  SolveOutcome(error=f'Invalid solve request: {e}').encode(KIND_H_CAPTCHA))
+            return True
+
+        outcome = self.process(request)
+        status = STATUS_FAILED if outcome.error is not None else STATUS_DONE
+
+        try:
+            data = outcome.encode(request.kind)
+
+        except Exception as e:
+            status = STATUS_FAILED
+            data = SolveOutcome(error=f'Result could not be stored: {e}').encode(request.kind)
+
+        self.backend.complete(request_id, status, data)
+
+        return True
+
+    def run(self, worker_id: str, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                if self.run_once(worker_id):
+                    continue
+
+            except Exception:
+                logger.exception(f'Worker {worker_id} failed to process a request.')
+
+            stop.wait(self.idle_interval)
+
+
+def _run_process(backend: QueueBackend, hcaptcha_factory: Optional[Callable[[], BaseHCaptchaGenerator]],
+                 funcaptcha_factory: Optional[Callable[[], BaseFunCaptchaGenerator]], lease: float,
+                 idle_interval: float, threads: int, stop):
+    worker = SolverWorker(backend, hcaptcha_factory=hcaptcha_factory, funcaptcha_factory=funcaptcha_factory,
+                          lease=lease, idle_interval=idle_interval)
+    local_stop = threading.Event()
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    workers: List[threading.Thread] = list()
+
+    for index in range(threads):
+        thread = threading.Thread(target=worker.run, args=(f'{prefix}:{index}', local_stop),
+                                  name=f'captcha-solver-{index}', daemon=True)
+        thread.start()
+        workers.append(thread)
+
+    stop.wait()
+    local_stop.set()
+
+    for thread in workers:
+        thread.join()
+
+
+class SolverPool:
+    """
+    Runs ``processes`` worker processes with ``threads`` solving threads each. Solves spend nearly all their time
+    waiting on the provider, so every process runs several solves at once. More pools, on this or other hosts, can
+    serve the same backend.
+
+    The backend and the factories are sent to the worker processes, which build their own SolverWorker, and must
+    therefore be picklable under every start method: factories should be module level functions.
+    """
+
+    def __init__(self, backend: QueueBackend,
+                 hcaptcha_factory: Callable[[], BaseHCaptchaGenerator] = None,
+                 funcaptcha_factory: Callable[[], BaseFunCaptchaGenerator] = None,
+                 processes: int = DEFAULT_PROCESSES, threads: int = DEFAULT_THREADS_PER_PROCESS,
+                 lease: float = DEFAULT_LEASE, idle_interval: float = DEFAULT_IDLE_INTERVAL):
+        self.backend: QueueBackend = backend
+        self.hcaptcha_factory: Optional[Callable[[], BaseHCaptchaGenerator]] = hcaptcha_factory
+        self.funcaptcha_factory: Optional[Callable[[], BaseFunCaptchaGenerator]] = funcaptcha_factory
+        self.lease: float = lease
+        self.idle_interval: float = idle_interval
+        self.processes: int = processes
+        self.threads: int = threads
+        self._stop = multiprocessing.Event()
+        self._processes: List[multiprocessing.Process] = list()
+
+    def start(self):
+        for index in range(self.processes):
+            args = (self.backend, self.hcaptcha_factory, self.funcaptcha_factory, self.lease, self.idle_interval,
+                    self.threads, self._stop)
+            process = multiprocessing.Process(target=_run_process, args=args, name=f'captcha-solver-{index}',
+                                              daemon=True)
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout: float = None):
+        """
+        Stops the workers once their current solves finish. Unclaimed requests stay in the backend.
+        """
+        self._stop.set()
+
+        for process in self._processes:
+            process.join(timeout)
+
+        self._processes.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
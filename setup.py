@@ -14,5 +14,10 @@ setup(
     install_requires=[
         'requests >= 2.29.0,<3',
         'proxy-provider @ git+ssh://git@github.com/OnlyCookie/proxy-provider.git'
-    ]
+    ],
+    extras_require={
+        'async': [
+            'aiohttp >= 3.8,<4'
+        ]
+    }
 )